@@ -115,6 +115,7 @@ sphinx_gallery_conf = {
 epkg_dictionary = {
     "automodule": "https://www.sphinx-doc.org/en/master/usage/extensions/autodoc.html#directive-automodule",
     "black": "https://black.readthedocs.io/en/stable/index.html",
+    "cloudpickle": "https://github.com/cloudpipe/cloudpickle",
     "dot": "https://en.wikipedia.org/wiki/DOT_(graph_description_language)",
     "DOT": "https://en.wikipedia.org/wiki/DOT_(graph_description_language)",
     "JIT": "https://en.wikipedia.org/wiki/Just-in-time_compilation",
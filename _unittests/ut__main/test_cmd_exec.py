@@ -0,0 +1,105 @@
+import json
+import os
+import tempfile
+import unittest
+from sphinx_runpython.ext_test_case import ExtTestCase, hide_stdout
+from sphinx_runpython._cmd_helper import exec_runpython, get_parser, process_args
+from sphinx_runpython.runpython.run_exec import collect_runpython_blocks
+
+_RST = """
+title
+=====
+
+.. runpython::
+
+    print("a")
+
+::
+
+    .. runpython::
+
+        print("not executed")
+
+.. runpython::
+    :store:
+
+    x = 5
+
+.. runpython::
+    :restore:
+
+    print(x + 1)
+
+.. runpython::
+    :process:
+
+    import time
+    time.sleep(0.2)
+    print("b")
+"""
+
+_PY = '''
+def f():
+    """
+    Docstring.
+
+    .. runpython::
+
+        raise ValueError("failing")
+    """
+'''
+
+
+class TestCmdExec(ExtTestCase):
+    def _write(self, temp):
+        sub = os.path.join(temp, "sub")
+        os.mkdir(sub)
+        with open(os.path.join(temp, "index.rst"), "w") as f:
+            f.write(_RST)
+        with open(os.path.join(sub, "mod.py"), "w") as f:
+            f.write(_PY)
+
+    def test_collect(self):
+        with tempfile.TemporaryDirectory() as temp:
+            self._write(temp)
+            blocks = collect_runpython_blocks(temp)
+            self.assertEqual(len(blocks), 4)
+            self.assertEqual([b["lineno"] for b in blocks], [5, 15, 20, 25])
+            blocks = collect_runpython_blocks(temp, recursive=True)
+            self.assertEqual(len(blocks), 5)
+            py = [b for b in blocks if b["filename"].endswith(".py")]
+            self.assertEqual(py[0]["lineno"], 6)
+            self.assertEqual(py[0]["docname"], "sub/mod")
+
+    @hide_stdout()
+    def test_exec(self):
+        with tempfile.TemporaryDirectory() as temp:
+            self._write(temp)
+            manifest = os.path.join(temp, "manifest.json")
+            records = exec_runpython(
+                temp, recursive=True, jobs=2, output=manifest, verbose=2
+            )
+            with open(manifest) as f:
+                saved = json.load(f)
+        self.assertEqual(records, saved)
+        self.assertEqual(len(records), 5)
+        status = [r["status"] for r in records]
+        self.assertEqual(status[:4], ["ok", "ok", "ok", "ok"])
+        self.assertEqual(status[4], "RunPythonExecutionError")
+        self.assertIn("failing", records[4]["error"])
+        self.assertGreater(records[3]["duration"], 0.2)
+        self.assertEqual(len(records[0]["hash"]), 64)
+        self.assertEqual(records[1]["options"], {"store": ""})
+
+    @hide_stdout()
+    def test_process_args(self):
+        with tempfile.TemporaryDirectory() as temp:
+            self._write(temp)
+            args = get_parser().parse_args(["exec", "-p", temp, "-j", "1"])
+            process_args(args)
+            args = get_parser().parse_args(["exec", "-p", temp, "-r"])
+            self.assertRaise(lambda: process_args(args), SystemExit)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,18 @@
+import unittest
+from sphinx_runpython.ext_test_case import ExtTestCase
+from sphinx_runpython.process_rst import rst2html
+
+
+class TestProcessRst(ExtTestCase):
+    def test_rst2html_configuration(self):
+        content = "before |value| after"
+        rst = rst2html(
+            content,
+            writer_name="rst",
+            rst_prolog=".. |value| replace:: configured",
+        )
+        self.assertIn("before configured after", rst)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
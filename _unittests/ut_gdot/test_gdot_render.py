@@ -0,0 +1,259 @@
+import os
+import sys
+import tempfile
+import unittest
+from sphinx_runpython.ext_test_case import ExtTestCase, skipif_ci_windows
+from sphinx_runpython.process_rst import rst2html
+from sphinx_runpython.gdot.gdot_render import (
+    choose_engine,
+    graph_size,
+    graphviz_version,
+    layout_args,
+    render_cache_key,
+)
+
+_FAKE_DOT = """#!{executable}
+import sys
+import time
+
+begin = time.time()
+args = sys.argv[1:]
+if args == ["-V"]:
+    sys.stderr.write("dot - graphviz version 0.0.0 (fake)\\n")
+    sys.exit(0)
+code = sys.stdin.read()
+time.sleep({sleep})
+outputs = [a[2:] for a in args if a.startswith("-o")]
+formats = [a[2:] for a in args if a.startswith("-T")]
+for fmt, out in zip(formats, outputs):
+    with open(out, "w") as f:
+        if fmt == "cmapx":
+            f.write('<map id="fake" name="fake">\\n</map>\\n')
+        elif fmt == "svg":
+            f.write('<svg xmlns="http://www.w3.org/2000/svg"><!-- fake --></svg>')
+        else:
+            f.write("PNG")
+with open({log!r}, "a") as f:
+    f.write(f"{{begin}} {{time.time()}} {{' '.join(args)}}\\n")
+"""
+
+
+def _fake_dot(folder, sleep=0):
+    log = os.path.join(folder, "calls.txt")
+    name = os.path.join(folder, "fake_dot.py")
+    with open(name, "w") as f:
+        f.write(_FAKE_DOT.format(executable=sys.executable, log=log, sleep=sleep))
+    os.chmod(name, 0o755)
+    return name, log
+
+
+def _calls(log):
+    if not os.path.exists(log):
+        return 0
+    with open(log) as f:
+        return len(f.readlines())
+
+
+@skipif_ci_windows("the fake dot relies on a shebang")
+class TestGDotRender(ExtTestCase):
+    def setUp(self):
+        self._unittest_going = os.environ.pop("UNITTEST_GOING", None)
+
+    def tearDown(self):
+        if self._unittest_going is not None:
+            os.environ["UNITTEST_GOING"] = self._unittest_going
+
+    def test_render_cache_key(self):
+        key = render_cache_key("digraph{}", "svg", "v1", [])
+        self.assertEqual(key, render_cache_key("digraph{}", "svg", "v1", []))
+        self.assertNotEqual(key, render_cache_key("digraph{}", "png", "v1", []))
+        self.assertNotEqual(key, render_cache_key("digraph{}", "svg", "v2", []))
+        self.assertNotEqual(
+            key, render_cache_key("digraph{}", "svg", "v1", ["-Gdpi=90"])
+        )
+
+    def test_graphviz_version(self):
+        with tempfile.TemporaryDirectory() as temp:
+            dot, _ = _fake_dot(temp)
+            self.assertIn("fake", graphviz_version(dot))
+        self.assertEqual(graphviz_version(dot + ".missing"), "")
+
+    def test_cache_png_svg(self):
+        content = """
+                    before
+
+                    .. gdot::
+                        :format: {0}
+
+                        digraph foo {{
+                          "bar" -> "baz";
+                        }}
+
+                    after
+                    """.replace("                    ", "")
+
+        with tempfile.TemporaryDirectory() as temp:
+            dot, log = _fake_dot(temp)
+            cache = os.path.join(temp, "cache")
+            for fmt, tag in [("png", "<img"), ("svg", "<object")]:
+                begin = _calls(log)
+                for _ in range(2):
+                    html = rst2html(
+                        content.format(fmt),
+                        writer_name="html",
+                        new_extensions=["sphinx_runpython.gdot"],
+                        graphviz_dot=dot,
+                        gdot_cache_dir=cache,
+                    )
+                    self.assertIn(tag, html)
+                    self.assertIn(f".{fmt}", html)
+                # the second build takes the image from the cache
+                self.assertEqual(_calls(log), begin + 1)
+            self.assertEqual(len(os.listdir(cache)), 2)
+
+            # another version of graphviz renders the graph again
+            html = rst2html(
+                content.format("svg"),
+                writer_name="html",
+                new_extensions=["sphinx_runpython.gdot"],
+                graphviz_dot=dot,
+                graphviz_dot_args=["-Gdpi=90"],
+                gdot_cache_dir=cache,
+            )
+            self.assertEqual(_calls(log), 3)
+
+    def test_batch_rendering(self):
+        graphs = "\n".join(f"""
+                    .. gdot::
+                        :format: {fmt}
+
+                        digraph foo {{
+                          "bar" -> "baz{i}";
+                        }}
+                    """ for i, fmt in enumerate(["svg", "png", "svg", "png"])).replace(
+            "                    ", ""
+        )
+
+        with tempfile.TemporaryDirectory() as temp:
+            dot, log = _fake_dot(temp, sleep=1)
+            html = rst2html(
+                graphs,
+                writer_name="html",
+                new_extensions=["sphinx_runpython.gdot"],
+                graphviz_dot=dot,
+                gdot_render_workers=4,
+            )
+            with open(log) as f:
+                times = [tuple(map(float, line.split()[:2])) for line in f]
+        self.assertEqual(html.count("<object"), 2)
+        self.assertEqual(html.count("<img"), 2)
+        # every graph is rendered once and dot runs in parallel
+        self.assertEqual(len(times), 4)
+        self.assertLess(max(t[0] for t in times), min(t[1] for t in times))
+
+    def test_graph_size(self):
+        code = """
+            digraph foo { // comment
+                rankdir=LR; node [shape=box];
+                "a b" -> b -> c [label="x->y"];
+                d; e -> f
+                subgraph cluster_0 { g -> a }
+            }
+        """
+        self.assertEqual(graph_size(code), (8, 4))
+        self.assertEqual(choose_engine(8, 4, [(10, 4, "sfdp")]), "sfdp")
+        self.assertEqual(
+            choose_engine(8, 4, [(10, 10, "sfdp"), (5, 10, "neato")]), "neato"
+        )
+        self.assertEmpty(choose_engine(8, 4, [(10, 10, "sfdp")]))
+        self.assertEqual(layout_args(None), ())
+        self.assertEqual(layout_args("neato"), ("-Kneato",))
+        self.assertIn("-Gsplines=line", layout_args("simplify"))
+
+    def test_layout_engine_timeout(self):
+        content = """
+                    .. gdot::
+                        :format: svg
+
+                        digraph foo {
+                          a -> b -> c -> d;
+                        }
+                    """.replace("                    ", "")
+
+        with tempfile.TemporaryDirectory() as temp:
+            dot, log = _fake_dot(temp)
+            html = rst2html(
+                content,
+                writer_name="html",
+                new_extensions=["sphinx_runpython.gdot"],
+                graphviz_dot=dot,
+                gdot_layout_engines=[(4, 100, "sfdp")],
+            )
+            with open(log) as f:
+                self.assertIn("-Ksfdp", f.read())
+            self.assertIn("<object", html)
+
+            html = rst2html(
+                content,
+                writer_name="html",
+                new_extensions=["sphinx_runpython.gdot"],
+                graphviz_dot=dot,
+                gdot_layout_engines=[(4, 100, "simplify")],
+            )
+            with open(log) as f:
+                last = f.readlines()[-1]
+            self.assertIn("-Gsplines=line", last)
+            self.assertNotIn("-K", last)
+            self.assertIn("<object", html)
+
+            dot, log = _fake_dot(temp, sleep=5)
+            html, err = rst2html(
+                content,
+                writer_name="html",
+                new_extensions=["sphinx_runpython.gdot"],
+                graphviz_dot=dot,
+                gdot_render_timeout=1,
+                return_warnings=True,
+            )
+        # a sphinx warning, sphinx -W fails
+        self.assertIn("WARNING: [gdot]", err)
+        self.assertIn("a placeholder is displayed", err)
+        self.assertNotIn("<object", html)
+        self.assertIn("gdot-timeout", html)
+        self.assertIn("4 nodes and 3 edges", html)
+
+    def test_svg_inline(self):
+        content = """
+                    .. gdot::
+                        :format: svg
+
+                        digraph foo {
+                          "bar" -> "baz";
+                        }
+                    """.replace("                    ", "")
+
+        with tempfile.TemporaryDirectory() as temp:
+            dot, _ = _fake_dot(temp)
+            inline = rst2html(
+                content,
+                writer_name="html",
+                new_extensions=["sphinx_runpython.gdot"],
+                graphviz_dot=dot,
+                gdot_svg_embed="inline",
+            )
+            external = rst2html(
+                content,
+                writer_name="html",
+                new_extensions=["sphinx_runpython.gdot"],
+                graphviz_dot=dot,
+                gdot_svg_embed="inline",
+                gdot_svg_inline_limit=10,
+            )
+        self.assertNotIn("<object", inline)
+        self.assertIn('<svg xmlns="http://www.w3.org/2000/svg" />', inline)
+        self.assertNotIn("fake", inline)
+        self.assertIn("<object", external)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
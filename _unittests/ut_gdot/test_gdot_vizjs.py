@@ -0,0 +1,55 @@
+import unittest
+from sphinx_runpython.ext_test_case import ExtTestCase
+from sphinx_runpython.process_rst import rst2html
+
+
+class TestGDotVizJs(ExtTestCase):
+    def test_vizjs_loader(self):
+        content = """
+                    .. gdot::
+                        :url: local
+
+                        digraph foo { "bar" -> "baz"; }
+
+                    .. gdot::
+
+                        digraph foo { "bar" -> "baz"; }
+
+                    .. gdot::
+
+                        digraph foo { "bar" -> "end</script>"; }
+                    """.replace("                    ", "")
+
+        html = rst2html(
+            content,
+            writer_name="html",
+            new_extensions=["sphinx_runpython.gdot"],
+            gdot_vizjs=True,
+        )
+        # one loader per page, identical graphs share the same source
+        self.assertEqual(html.count("IntersectionObserver(function"), 1)
+        self.assertEqual(html.count('type="text/vnd.graphviz"'), 2)
+        self.assertEqual(html.count('class="gdot-vizjs"'), 3)
+        self.assertIn('var url = "_static/viz.js";', html)
+        self.assertIn('"end<\\/script>"', html)
+        self.assertNotIn("require.js", html)
+
+    def test_no_vizjs(self):
+        content = """
+                    .. gdot::
+
+                        digraph foo { "bar" -> "baz"; }
+                    """.replace("                    ", "")
+
+        html = rst2html(
+            content,
+            writer_name="html",
+            new_extensions=["sphinx_runpython.gdot"],
+            graphviz_dot="",
+        )
+        self.assertNotIn("IntersectionObserver", html)
+        self.assertNotIn("gdot-vizjs", html)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,71 @@
+import unittest
+import xml.etree.ElementTree as ET
+from sphinx_runpython.ext_test_case import ExtTestCase
+from sphinx_runpython.ext_svg_helper import minify_svg
+
+_SVG = """<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.1//EN"
+ "http://www.w3.org/Graphics/SVG/1.1/DTD/svg11.dtd">
+<!-- Generated by graphviz -->
+<svg width="62pt" height="116pt" viewBox="0.00 0.00 62.00 116.00"
+     xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink"
+     xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape">
+<metadata>generator</metadata>
+<defs>
+<linearGradient id="grad1"><stop offset="0"/></linearGradient>
+<linearGradient id="grad2"><stop offset="0"/></linearGradient>
+</defs>
+<g id="graph0" class="graph" inkscape:label="layer">
+<title>foo</title>
+<!-- bar -->
+<g id="node1" class="node">
+<a xlink:href="page.html#section" xlink:title="bar">
+<ellipse fill="url(#grad2)" cx="27.0000" cy="-90.123456" rx="27" ry="18"/>
+</a>
+<text x="27" y="-86.3">bar</text>
+</g>
+<use xlink:href="#grad1"/>
+<a xlink:href="https://www.python.org/"><text x="1.5">python</text></a>
+</g>
+</svg>
+"""
+
+
+class TestSvgHelper(ExtTestCase):
+    def test_minify_svg(self):
+        svg = minify_svg(_SVG, prefix="p1_", relink=lambda href: f"../{href}")
+        self.assertLess(len(svg), len(_SVG) * 0.7)
+        for removed in ["<!--", "<?xml", "DOCTYPE", "metadata", "inkscape", "grad"]:
+            self.assertNotIn(removed, svg)
+        self.assertIn('viewBox="0 0 62 116"', svg)
+        self.assertIn('cx="27" cy="-90.12"', svg)
+        self.assertIn("<title>foo</title>", svg)
+        # one gradient is left and both references use it
+        self.assertEqual(svg.count("<linearGradient"), 1)
+        self.assertIn('<linearGradient id="p1_0">', svg)
+        self.assertIn('fill="url(#p1_0)"', svg)
+        self.assertIn('xlink:href="#p1_0"', svg)
+        self.assertIn('id="p1_1"', svg)
+        self.assertIn('xlink:href="../page.html#section"', svg)
+        self.assertIn('xlink:href="https://www.python.org/"', svg)
+        self.assertTrue(svg.startswith("<svg "))
+        self.assertIn('xmlns="http://www.w3.org/2000/svg"', svg)
+        self.assertIn('xmlns:xlink="http://www.w3.org/1999/xlink"', svg)
+        self.assertNotIn("ns0", svg)
+        self.assertEqual(ET.fromstring(svg).tag, "{http://www.w3.org/2000/svg}svg")
+
+    def test_namespaces_unchanged(self):
+        minify_svg(_SVG)
+        xml = ET.tostring(ET.fromstring('<root><a xmlns="svg-ns"/></root>'))
+        self.assertEqual(xml, b'<root xmlns:ns0="svg-ns"><ns0:a /></root>')
+        xml = ET.tostring(ET.Element("{http://www.w3.org/2000/svg}svg"))
+        self.assertIn(b"ns0:svg", xml)
+
+    def test_prefix(self):
+        svg1 = minify_svg(_SVG, prefix="a_")
+        svg2 = minify_svg(_SVG, prefix="b_")
+        self.assertEqual(svg1.replace('"a_', '"b_').replace("#a_", "#b_"), svg2)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
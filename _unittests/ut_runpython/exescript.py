@@ -0,0 +1,14 @@
+# coding: utf-8
+import sys
+if True:
+    __WD__ = '/tmp/tmps8b7_tnf'
+    import math
+    import inspect
+    
+    def fctfct():
+        return math.pi
+    
+    code = inspect.getsource(fctfct)
+    print("***********")
+    print(code)
+    print("***********")
\ No newline at end of file
@@ -0,0 +1,59 @@
+import os
+import sys
+import tempfile
+import unittest
+from sphinx_runpython.ext_test_case import ExtTestCase
+from sphinx_runpython.runpython.run_cache import RunPythonCache
+from sphinx_runpython.runpython.sphinx_runpython_extension import (
+    _BLACK_MEMORY,
+    MAX_BLACK_MEMORY,
+    format_with_black,
+    remove_extra_spaces_and_black,
+)
+
+
+class TestBlackCache(ExtTestCase):
+    def test_format_with_black_memory(self):
+        code = "x=[1,2,\n  3]\nprint( x )\n"
+        formatted = format_with_black(code)
+        self.assertEqual(formatted, "x = [1, 2, 3]\nprint(x)\n")
+        # the formatted code is known as well
+        size = len(_BLACK_MEMORY)
+        self.assertEqual(format_with_black(formatted), formatted)
+        self.assertEqual(format_with_black(code), formatted)
+        self.assertEqual(len(_BLACK_MEMORY), size)
+
+    def test_format_with_black_disk(self):
+        code = "y=(4,\n5)\n"
+        with tempfile.TemporaryDirectory() as temp:
+            cache = RunPythonCache(temp)
+            formatted = format_with_black(code, cache=cache)
+            self.assertEqual(formatted, "y = (4, 5)\n")
+            self.assertEqual(len(list(cache._entries())), 2)
+            # the next build starts with an empty memory and must not import black
+            _BLACK_MEMORY.clear()
+            black = sys.modules.pop("black", None)
+            try:
+                self.assertEqual(format_with_black(code, cache=cache), formatted)
+                self.assertNotIn("black", sys.modules)
+            finally:
+                if black is not None:
+                    sys.modules["black"] = black
+
+    def test_format_with_black_bounded(self):
+        for i in range(MAX_BLACK_MEMORY):
+            format_with_black(f"z{i}=1\n")
+        self.assertLessEqual(len(_BLACK_MEMORY), MAX_BLACK_MEMORY)
+        self.assertEqual(format_with_black("z0=1\n"), "z0 = 1\n")
+
+    def test_remove_extra_spaces_and_black(self):
+        with tempfile.TemporaryDirectory() as temp:
+            cache = RunPythonCache(os.path.join(temp, "black"))
+            res = remove_extra_spaces_and_black(
+                "a=1   \nb=2\n", is_string=True, cache=cache
+            )
+        self.assertEqual(res, "a = 1\nb = 2\n")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,90 @@
+import linecache
+import tempfile
+import unittest
+from sphinx_runpython.ext_test_case import ExtTestCase
+from sphinx_runpython.process_rst import rst2html
+from sphinx_runpython.runpython.run_bytecode import (
+    _CODE_CACHE,
+    MAX_CODES,
+    MAX_SOURCES,
+    compile_script,
+    register_source,
+    script_filename,
+)
+from sphinx_runpython.runpython.run_cache import RunPythonCache
+from sphinx_runpython.runpython.sphinx_runpython_extension import (
+    RunPythonExecutionError,
+    run_python_script,
+)
+
+
+class TestRunBytecode(ExtTestCase):
+    def test_script_filename(self):
+        self.assertEqual(script_filename("a"), script_filename("a"))
+        self.assertNotEqual(script_filename("a"), script_filename("b"))
+        self.assertTrue(script_filename("a", prefix="doc:4").startswith("<doc:4-"))
+
+    def test_compile_script(self):
+        script = "x = 1\nprint(x + 1)"
+        name = script_filename(script)
+        with tempfile.TemporaryDirectory() as temp:
+            cache = RunPythonCache(temp)
+            code = compile_script(script, name, cache=cache)
+            self.assertIs(compile_script(script, name, cache=cache), code)
+            self.assertEqual(len(list(cache._entries())), 1)
+            # a new build only finds the code on disk
+            _CODE_CACHE.clear()
+            code2 = compile_script(script, name, cache=cache)
+        self.assertEqual(code2.co_filename, name)
+        self.assertEqual(code2.co_code, code.co_code)
+        self.assertEqual(linecache.getline(name, 2), "print(x + 1)\n")
+
+    def test_register_source_bounded(self):
+        names = [script_filename(f"x = {i}", prefix="bounded") for i in range(300)]
+        for i, name in enumerate(names):
+            register_source(f"x = {i}", name)
+        self.assertEqual(MAX_SOURCES, 256)
+        self.assertNotIn(names[0], linecache.cache)
+        self.assertNotIn(names[-MAX_SOURCES - 1], linecache.cache)
+        self.assertEqual(linecache.getline(names[-MAX_SOURCES], 1), "x = 44\n")
+        self.assertEqual(linecache.getline(names[-1], 1), "x = 299\n")
+
+    def test_compile_script_bounded(self):
+        scripts = [f"y = {i}" for i in range(MAX_CODES + 10)]
+        codes = [compile_script(s, script_filename(s)) for s in scripts]
+        self.assertLessEqual(len(_CODE_CACHE), MAX_CODES)
+        self.assertIs(
+            compile_script(scripts[-1], script_filename(scripts[-1])), codes[-1]
+        )
+        self.assertIsNot(
+            compile_script(scripts[0], script_filename(scripts[0])), codes[0]
+        )
+
+    def test_traceback(self):
+        script = "def f():\n    raise ValueError('bad value')\nf()"
+        with self.assertRaises(RunPythonExecutionError) as e:
+            run_python_script(script, filename="<doc:3-a>")
+        self.assertIn('File "<doc:3-a>", line 2, in f', str(e.exception))
+        self.assertIn("raise ValueError('bad value')", str(e.exception))
+
+    def test_stable_name(self):
+        content = """
+                    .. runpython::
+                        :showcode:
+
+                        import inspect
+                        print(inspect.currentframe().f_code.co_name)
+                    """.replace("                    ", "")
+        names = set()
+        for _ in range(2):
+            rst = rst2html(content, writer_name="rst")
+            names |= {
+                line.strip()
+                for line in rst.split("\n")
+                if line.strip().startswith("run_python_script_")
+            }
+        self.assertEqual(len(names), 1)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
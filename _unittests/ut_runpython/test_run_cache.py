@@ -0,0 +1,116 @@
+import os
+import tempfile
+import unittest
+from sphinx_runpython.ext_test_case import ExtTestCase
+from sphinx_runpython.process_rst import rst2html
+from sphinx_runpython.runpython.run_cache import (
+    RunPythonCache,
+    dependencies_fingerprint,
+    runpython_cache_key,
+)
+
+
+class TestRunCache(ExtTestCase):
+    def test_cache_key(self):
+        k1 = runpython_cache_key("print(1)", dict(process=True))
+        k2 = runpython_cache_key("print(1)", dict(process=False))
+        k3 = runpython_cache_key("print(1)", dict(process=True), fingerprint="h")
+        self.assertEqual(len({k1, k2, k3}), 3)
+        self.assertEqual(k1, runpython_cache_key("print(1)", dict(process=True)))
+
+    def test_fingerprint(self):
+        with tempfile.TemporaryDirectory() as temp:
+            self.assertEqual(dependencies_fingerprint([], temp), "")
+            name = os.path.join(temp, "dep.py")
+            with open(name, "w") as f:
+                f.write("a = 1")
+            f1 = dependencies_fingerprint(["*.py"], temp)
+            with open(name, "w") as f:
+                f.write("a = 2")
+            f2 = dependencies_fingerprint(["*.py"], temp)
+            self.assertNotEqual(f1, f2)
+
+    def test_cache_lru(self):
+        with tempfile.TemporaryDirectory() as temp:
+            cache = RunPythonCache(temp, max_size=3000)
+            self.assertTrue(cache.set("a" * 64, ("x" * 1000, "", None)))
+            self.assertTrue(cache.set("b" * 64, ("y" * 1000, "", None)))
+            self.assertFalse(cache.set("e" * 64, ("", "", {"f": lambda x: x})))
+            # a is now more recent than b
+            os.utime(cache._filename("b" * 64), (0, 0))
+            self.assertEqual(cache.get("a" * 64)[0], "x" * 1000)
+            self.assertTrue(cache.set("c" * 64, ("z" * 1000, "", None)))
+            self.assertEqual(cache.get("b" * 64), None)
+            self.assertEqual(cache.get("a" * 64)[0], "x" * 1000)
+            self.assertEqual(cache.get("c" * 64)[0], "z" * 1000)
+            cache.clear()
+            self.assertEqual(cache.get("a" * 64), None)
+
+    def test_cache_stale_entry(self):
+        with tempfile.TemporaryDirectory() as temp:
+            cache = RunPythonCache(temp)
+            self.assertTrue(cache.set("a" * 64, ("x", "", None)))
+            name = cache._filename("a" * 64)
+            # a pickle referring to a class which does not exist anymore
+            with open(name, "wb") as f:
+                f.write(b"\x80\x04csphinx_runpython\nMissingClass\n.")
+            self.assertEqual(cache.get("a" * 64), None)
+            self.assertFalse(os.path.exists(name))
+
+    def test_block_key_limits(self):
+        from sphinx_runpython.runpython.sphinx_runpython_extension import (
+            get_runpython_options,
+            runpython_block_key,
+        )
+
+        keys = set()
+        for options, kwargs in [
+            ({}, {}),
+            (dict(timeout="5"), {}),
+            (dict(maxmem="1G"), {}),
+            (dict(session="s1"), {}),
+            ({}, dict(timeout=10)),
+            ({}, dict(maxmem="2G")),
+        ]:
+            p = get_runpython_options(options, **kwargs)
+            keys.add(runpython_block_key("print(1)", p, "index"))
+        self.assertEqual(len(keys), 6)
+        p1 = get_runpython_options(dict(timeout="10"))
+        p2 = get_runpython_options({}, timeout=10)
+        self.assertEqual(
+            runpython_block_key("print(1)", p1, "index"),
+            runpython_block_key("print(1)", p2, "index"),
+        )
+
+    def test_runpython_cache_dir(self):
+        content = """
+                    test a directive
+                    ================
+
+                    .. runpython::
+
+                        import random
+                        print("value", random.random())
+
+                    .. runpython::
+                        :nocache:
+
+                        import random
+                        print("nocache", random.random())
+                    """.replace("                    ", "")
+
+        with tempfile.TemporaryDirectory() as temp:
+            rst1 = rst2html(content, writer_name="rst", runpython_cache_dir=temp)
+            rst2 = rst2html(content, writer_name="rst", runpython_cache_dir=temp)
+        v1 = [line for line in rst1.split("\n") if "value" in line]
+        v2 = [line for line in rst2.split("\n") if "value" in line]
+        self.assertEqual(len(v1), 1)
+        self.assertEqual(v1, v2)
+        n1 = [line for line in rst1.split("\n") if "nocache" in line]
+        n2 = [line for line in rst2.split("\n") if "nocache" in line]
+        self.assertEqual(len(n1), 1)
+        self.assertNotEqual(n1, n2)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
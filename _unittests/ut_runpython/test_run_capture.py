@@ -0,0 +1,73 @@
+import unittest
+from contextlib import redirect_stdout
+from sphinx_runpython.ext_test_case import ExtTestCase
+from sphinx_runpython.process_rst import rst2html
+from sphinx_runpython.runpython.run_capture import BoundedCapture
+from sphinx_runpython.runpython.sphinx_runpython_extension import run_python_script
+
+
+class TestRunCapture(ExtTestCase):
+    def test_no_limit(self):
+        sout = BoundedCapture()
+        with redirect_stdout(sout):
+            print("a" * 1000)
+        self.assertEqual(sout.getvalue(), "a" * 1000 + "\n")
+        self.assertFalse(sout.truncated)
+        self.assertEqual(sout.truncated_bytes, 0)
+        sout.close()
+
+    def test_limit(self):
+        sout = BoundedCapture(10)
+        for i in range(100):
+            sout.write(str(i % 10))
+        self.assertTrue(sout.truncated)
+        self.assertEqual(sout.truncated_bytes, 90)
+        self.assertEqual(sout.getvalue(), "01234\n[... 90 bytes truncated ...]\n56789")
+        sout.write("é")
+        self.assertEqual(sout.truncated_bytes, 91)
+        self.assertTrue(sout.getvalue().endswith("6789é"))
+        sout.close()
+        self.assertRaise(lambda: sout.write("a"), ValueError)
+
+    def test_large_write(self):
+        sout = BoundedCapture(8)
+        sout.write("abc")
+        sout.write("x" * 100 + "end")
+        self.assertEqual(sout.getvalue(), "abcx\n[... 98 bytes truncated ...]\nxend")
+        sout.close()
+
+    def test_surrogate(self):
+        sout = BoundedCapture()
+        sout.write("a\udcff")
+        self.assertEqual(sout.getvalue(), "a\udcff")
+        sout.close()
+        sout = BoundedCapture(4)
+        sout.write("\udcff" * 10)
+        self.assertEqual(sout.truncated_bytes, 18)
+        sout.close()
+        out, _, _ = run_python_script("print('\\udcff')")
+        self.assertEqual(out, "\udcff\n")
+
+    def test_run_python_script(self):
+        out, _, _ = run_python_script(
+            "for i in range(1000):\n    print(i)", capture_limit=20
+        )
+        self.assertTrue(out.startswith("0\n1\n2\n"))
+        self.assertIn("bytes truncated", out)
+        self.assertTrue(out.endswith("998\n999\n"))
+
+    def test_runpython_capture_limit(self):
+        content = """
+                    .. runpython::
+
+                        for i in range(1000):
+                            print(i)
+                    """.replace("                    ", "")
+        rst = rst2html(content, writer_name="rst", runpython_capture_limit=100)
+        self.assertIn("bytes truncated", rst)
+        self.assertNotIn("500", rst)
+        self.assertIn("999", rst)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
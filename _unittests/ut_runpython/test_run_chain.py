@@ -0,0 +1,120 @@
+import tempfile
+import threading
+import unittest
+from sphinx_runpython.ext_test_case import ExtTestCase
+from sphinx_runpython.process_rst import rst2html
+from sphinx_runpython.runpython.run_chain import (
+    chain_block_key,
+    restore_context,
+    snapshot_context,
+)
+
+
+def _values(rst):
+    return [line.strip() for line in rst.split("\n") if line.strip().startswith("v")]
+
+
+class TestRunChain(ExtTestCase):
+    def test_snapshot_context(self):
+        context = dict(a=5, b="text", lock=threading.Lock(), big=b"x" * 10000)
+        snapshot, skipped = snapshot_context(context)
+        self.assertEqual(skipped, ["lock"])
+        restored, failed = restore_context(snapshot)
+        self.assertEqual(failed, [])
+        self.assertEqual(restored, dict(a=5, b="text", big=b"x" * 10000))
+
+        snapshot, skipped = snapshot_context(context, max_size=1000)
+        self.assertEqual(skipped, ["big", "lock"])
+        self.assertEqual(set(snapshot), {"a", "b"})
+
+        modules, skipped = snapshot_context(dict(m=unittest))
+        self.assertEqual(skipped, [])
+        self.assertIs(restore_context(modules)[0]["m"], unittest)
+
+        restored, failed = restore_context(dict(a=b"not a pickle", b=snapshot["b"]))
+        self.assertEqual(failed, ["a"])
+        self.assertEqual(restored, dict(b="text"))
+
+    def test_chain_block_key(self):
+        k1 = chain_block_key("", "a")
+        self.assertEqual(k1, chain_block_key("", "a"))
+        self.assertNotEqual(chain_block_key(k1, "b"), chain_block_key("", "b"))
+
+    def test_chain_cached(self):
+        content = """
+                    test a directive
+                    ================
+
+                    .. runpython::
+                        :store:
+
+                        import random
+                        a = random.random()
+                        print("va", a)
+
+                    .. runpython::
+                        :restore:
+                        :store:
+
+                        import random
+                        b = a + random.random()
+                        print("vb", b)
+
+                    .. runpython::
+                        :restore:
+
+                        import random
+                        print("vc", a, b, random.random())
+                    """.replace("                    ", "")
+
+        modified = content.replace('print("vc",', 'print("vc", "modified",')
+        with tempfile.TemporaryDirectory() as temp:
+            v1 = _values(rst2html(content, writer_name="rst", runpython_cache_dir=temp))
+            v2 = _values(rst2html(content, writer_name="rst", runpython_cache_dir=temp))
+            v3 = _values(
+                rst2html(modified, writer_name="rst", runpython_cache_dir=temp)
+            )
+        self.assertEqual(len(v1), 3)
+        self.assertEqual(v1, v2)
+        # only the last block runs again with the restored context
+        self.assertEqual(v1[:2], v3[:2])
+        self.assertNotEqual(v1[2], v3[2])
+        self.assertIn(v1[2].split()[1], v3[2])
+        self.assertIn(v1[2].split()[2], v3[2])
+
+    def test_chain_partial_snapshot(self):
+        content = """
+                    test a directive
+                    ================
+
+                    .. runpython::
+                        :store:
+
+                        import threading
+                        lock = threading.Lock()
+                        a = 5
+                        print("va", a)
+
+                    .. runpython::
+                        :restore:
+
+                        with lock:
+                            print("vb", a)
+                    """.replace("                    ", "")
+
+        modified = content.replace('print("vb",', 'print("vb", "modified",')
+        with tempfile.TemporaryDirectory() as temp:
+            v1 = _values(rst2html(content, writer_name="rst", runpython_cache_dir=temp))
+            v2 = _values(
+                rst2html(modified, writer_name="rst", runpython_cache_dir=temp)
+            )
+        self.assertEqual(len(v1), 2)
+        self.assertEqual(len(v2), 2)
+        # the first block comes from the cache but its snapshot misses lock,
+        # it runs again silently to rebuild the context
+        self.assertEqual(v1, ["va 5", "vb 5"])
+        self.assertEqual(v2, ["va 5", "vb modified 5"])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
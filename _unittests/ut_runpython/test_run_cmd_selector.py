@@ -0,0 +1,86 @@
+import sys
+import time
+import unittest
+from sphinx_runpython.runpython.run_cmd import run_cmd
+from sphinx_runpython.ext_test_case import ExtTestCase
+
+
+class TestRunCmdSelector(ExtTestCase):
+    def _cmd(self, script):
+        return [sys.executable, "-c", script]
+
+    def test_outputs(self):
+        cmd = self._cmd(
+            "import sys\n"
+            "print('a')\n"
+            "print('b', file=sys.stderr)\n"
+            "sys.stdout.write('no end of line')"
+        )
+        out1, err1 = run_cmd(cmd, wait=True)
+        out2, err2 = run_cmd(cmd, wait=True, communicate=False)
+        self.assertEqual(out1.replace("\r", ""), "a\nno end of line")
+        self.assertEqual(out1.replace("\r", ""), out2)
+        self.assertEqual(err1, err2)
+
+    @unittest.skipIf(sys.platform.startswith("win"), reason="threads on Windows")
+    def test_no_polling(self):
+        cmd = self._cmd("print(1)")
+        run_cmd(cmd, wait=True, communicate=False)
+        begin = time.perf_counter()
+        for _ in range(10):
+            out, _ = run_cmd(cmd, wait=True, communicate=False)
+            self.assertEqual(out, "1")
+        # the previous implementation waits at least 50ms per command
+        self.assertLess(time.perf_counter() - begin, 5)
+
+    def test_timeout(self):
+        logs = []
+
+        def logf(*args):
+            logs.append(args)
+
+        cmd = self._cmd("import time\nprint('start', flush=True)\ntime.sleep(30)")
+        begin = time.perf_counter()
+        out, err = run_cmd(
+            cmd,
+            wait=True,
+            communicate=False,
+            timeout=1,
+            tell_if_no_output=0.3,
+            logf=logf,
+        )
+        self.assertLess(time.perf_counter() - begin, 10)
+        self.assertEqual(err, "Process killed.")
+        self.assertIn("start", out)
+        messages = [str(args[0]) for args in logs]
+        self.assertTrue(any("No update" in m for m in messages))
+        self.assertTrue(any("Timeout" in m for m in messages))
+
+    def test_stop_running_if(self):
+        cmd = self._cmd(
+            "import time\nfor i in range(100):\n    print(i, flush=True)\n"
+            "    time.sleep(0.05)"
+        )
+        seen = []
+
+        def stop_running_if(out, err):
+            if out:
+                seen.append(out)
+            return out is not None and out.strip() == "3"
+
+        out, err = run_cmd(
+            cmd,
+            wait=True,
+            communicate=False,
+            stop_running_if=stop_running_if,
+            logf=lambda *args: None,
+        )
+        self.assertEqual(err, "Process killed.")
+        self.assertEqual([s.strip() for s in seen], ["0", "1", "2", "3"])
+        self.assertEqual(
+            out.split("\n"), ["0", "1", "2", "3", "[run_cmd] killing process."]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
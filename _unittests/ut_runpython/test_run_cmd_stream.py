@@ -0,0 +1,79 @@
+import os
+import sys
+import tempfile
+import unittest
+from sphinx_runpython.ext_test_case import ExtTestCase
+from sphinx_runpython.runpython.run_cmd import run_cmd
+from sphinx_runpython.runpython.sphinx_runpython_extension import run_python_script
+
+
+class TestRunCmdStream(ExtTestCase):
+    script = (
+        "import sys\n"
+        "for i in range(20000):\n"
+        "    print(i)\n"
+        "print('é' * 3, file=sys.stderr)\n"
+    )
+
+    def test_full(self):
+        out1, err1 = run_cmd([sys.executable, "-"], self.script, wait=True)
+        chunks = []
+        out2, err2 = run_cmd(
+            [sys.executable, "-"],
+            self.script,
+            wait=True,
+            on_output=lambda name, text: chunks.append((name, text)),
+        )
+        self.assertEqual(out1, out2)
+        self.assertEqual(err1, err2)
+        self.assertEqual(err2, "ééé")
+        self.assertEqual("".join(t for n, t in chunks if n == "out"), out2)
+        self.assertEqual("".join(t for n, t in chunks if n == "err").strip(), "ééé")
+
+    def test_headtail(self):
+        out, err = run_cmd(
+            [sys.executable, "-"],
+            self.script,
+            wait=True,
+            retention="headtail",
+            retention_limit=20,
+        )
+        self.assertTrue(out.startswith("0\n1\n2\n"))
+        self.assertIn("bytes truncated", out)
+        self.assertTrue(out.endswith("19999\n"))
+        self.assertEqual(err, "ééé")
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as temp:
+            name = os.path.join(temp, "out.txt")
+            out, _ = run_cmd(
+                [sys.executable, "-"],
+                self.script,
+                wait=True,
+                retention="file",
+                retention_limit=20,
+                output_file=name,
+            )
+            with open(name, encoding="utf-8") as f:
+                full = f.read()
+        self.assertLess(len(out), 100)
+        self.assertEqual(full.split(), [str(i) for i in range(20000)])
+        self.assertRaise(
+            lambda: run_cmd([sys.executable, "-"], "", wait=True, retention="file"),
+            ValueError,
+        )
+
+    def test_run_python_script(self):
+        chunks = []
+        out, _, _ = run_python_script(
+            "for i in range(20000):\n    print(i)",
+            process=True,
+            capture_limit=20,
+            on_output=lambda name, text: chunks.append(text),
+        )
+        self.assertIn("bytes truncated", out)
+        self.assertGreater(len("".join(chunks)), 100000)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
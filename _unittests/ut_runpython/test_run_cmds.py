@@ -0,0 +1,62 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from sphinx_runpython.ext_test_case import ExtTestCase
+from sphinx_runpython.runpython.run_cmd import RunCmdException, run_cmd, run_cmds
+
+
+class TestRunCmds(ExtTestCase):
+    def test_run_cmd_cwd(self):
+        with tempfile.TemporaryDirectory() as temp:
+            current = os.getcwd()
+            out, _ = run_cmd(
+                [sys.executable, "-c", "import os;print(os.getcwd())"],
+                wait=True,
+                cwd=temp,
+            )
+            self.assertEqual(os.getcwd(), current)
+            self.assertEqual(os.path.realpath(out.strip()), os.path.realpath(temp))
+
+    def test_run_cmds(self):
+        commands = [
+            [sys.executable, "-c", f"import time;time.sleep(0.5);print({i})"]
+            for i in range(4)
+        ]
+        commands.append([sys.executable, "-c", "import sys;sys.exit(3)"])
+        commands.append(["this_command_does_not_exist_for_sure"])
+        begin = time.perf_counter()
+        res = run_cmds(commands, max_workers=6)
+        duration = time.perf_counter() - begin
+        self.assertEqual(len(res), 6)
+        self.assertLess(duration, 1.9)
+        for i in range(4):
+            self.assertEqual(res[i]["out"].strip(), str(i))
+            self.assertEqual(res[i]["returncode"], 0)
+            self.assertIsNone(res[i]["exception"])
+            self.assertGreater(res[i]["duration"], 0.4)
+        self.assertEqual(res[4]["returncode"], 3)
+        self.assertIsInstance(res[4]["exception"], RunCmdException)
+        self.assertIsNone(res[5]["returncode"])
+        self.assertIsInstance(res[5]["exception"], RunCmdException)
+
+    def test_run_cmds_timeout_cwd(self):
+        with tempfile.TemporaryDirectory() as temp:
+            res = run_cmds(
+                [
+                    [sys.executable, "-c", "import time;time.sleep(30)"],
+                    [sys.executable, "-c", "import os;print(os.getcwd())"],
+                ],
+                cwd=[None, temp],
+                timeout=1,
+            )
+        self.assertIn("Timeout", str(res[0]["exception"]))
+        self.assertEqual(
+            os.path.realpath(res[1]["out"].strip()), os.path.realpath(temp)
+        )
+        self.assertRaise(lambda: run_cmds(["a", "b"], cwd=["."]), ValueError)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,193 @@
+import json
+import os
+import signal
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from sphinx_runpython.ext_test_case import ExtTestCase
+from sphinx_runpython.process_rst import rst2html
+from sphinx_runpython.runpython.run_cmd import RunCmdException
+from sphinx_runpython.runpython.run_daemon import (
+    _CLIENTS,
+    DaemonClient,
+    DaemonConnectionError,
+    _request,
+    get_daemon_client,
+    ping_daemon,
+)
+from sphinx_runpython.runpython.sphinx_runpython_extension import (
+    RunPythonTimeoutError,
+    run_python_script,
+)
+
+
+@unittest.skipIf(not hasattr(socket, "AF_UNIX"), reason="no unix socket")
+class TestRunDaemon(ExtTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.temp = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.temp.name, "runpython.sock")
+        cls.proc = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "sphinx_runpython",
+                "worker",
+                "--socket",
+                cls.path,
+                "-j",
+                "2",
+                "--preload",
+                "json",
+            ],
+            cwd=os.path.join(os.path.dirname(__file__), "..", ".."),
+        )
+        begin = time.perf_counter()
+        while ping_daemon(cls.path) is None:
+            if time.perf_counter() - begin > 30:
+                raise AssertionError("The daemon did not start.")
+            time.sleep(0.1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.proc.send_signal(signal.SIGINT)
+        cls.proc.wait(timeout=30)
+        cls.temp.cleanup()
+
+    def test_ping(self):
+        info = ping_daemon(self.path)
+        self.assertEqual(info["size"], 2)
+        self.assertEqual(info["preload"], ["json"])
+        self.assertEqual(info["prefix"], sys.prefix)
+        self.assertNotEmpty(get_daemon_client(self.path))
+        self.assertEmpty(ping_daemon(self.path + ".missing"))
+        self.assertEmpty(get_daemon_client(self.path + ".missing"))
+
+    def test_run(self):
+        client = DaemonClient(self.path)
+        stats = {}
+        out, err, _ = run_python_script(
+            "import os, sys\nprint(os.getpid())\nprint('err', file=sys.stderr)",
+            process=True,
+            pool=client,
+            stats=stats,
+        )
+        self.assertNotEqual(int(out.strip()), os.getpid())
+        self.assertEqual(err, "err")
+        self.assertEqual(stats["mode"], "daemon")
+        self.assertIn("duration", stats)
+
+    def test_isolation(self):
+        client = DaemonClient(self.path)
+        client.run("import sys\nsys.added_by_script = 1")
+        out, _ = client.run("import sys\nprint(hasattr(sys, 'added_by_script'))")
+        self.assertEqual(out.strip(), "False")
+
+    def test_modules_do_not_leak(self):
+        client = DaemonClient(self.path)
+        client.run("import sys, json\nsys.modules['leaked_module'] = json")
+        out, _ = client.run("import sys\nprint('leaked_module' in sys.modules)")
+        self.assertEqual(out.strip(), "False")
+
+    def test_socket_permissions(self):
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+
+    def test_env_path(self):
+        os.environ["RUNPYTHON_DAEMON_TEST"] = "forwarded"
+        sys.path.append("runpython-daemon-test")
+        try:
+            out, _ = DaemonClient(self.path).run(
+                "import os, sys\n"
+                "print(os.environ.get('RUNPYTHON_DAEMON_TEST'))\n"
+                "print(sys.path[-1])\n"
+                "print(os.getcwd())"
+            )
+        finally:
+            del os.environ["RUNPYTHON_DAEMON_TEST"]
+            sys.path.remove("runpython-daemon-test")
+        self.assertEqual(
+            out.strip().split("\n"),
+            ["forwarded", "runpython-daemon-test", os.getcwd()],
+        )
+
+    def test_mismatch(self):
+        res = _request(self.path, dict(script="print(1)", prefix="?", version="?"))
+        self.assertIn("error", res)
+        with tempfile.TemporaryDirectory() as temp:
+            with open(os.path.join(temp, "json.py"), "w") as f:
+                f.write("")
+            sys.path.insert(0, temp)
+            try:
+                with self.assertRaises(RunCmdException) as e:
+                    DaemonClient(self.path).run("print(1)")
+            finally:
+                sys.path.remove(temp)
+        self.assertIn("json", str(e.exception))
+
+    def test_timeout(self):
+        with self.assertRaises(RunPythonTimeoutError) as e:
+            run_python_script(
+                "import time\nprint('start', flush=True)\ntime.sleep(30)",
+                process=True,
+                pool=DaemonClient(self.path),
+                timeout=1,
+            )
+        self.assertIn("start", e.exception.out)
+        out, _ = DaemonClient(self.path).run("print('alive')")
+        self.assertEqual(out.strip(), "alive")
+
+    def test_daemon_stopped(self):
+        # a client kept by get_daemon_client while the daemon stopped
+        missing = self.path + ".stopped"
+        _CLIENTS[missing] = (time.perf_counter(), DaemonClient(missing))
+        client = get_daemon_client(missing)
+        self.assertIsInstance(client, DaemonClient)
+        with self.assertRaises(DaemonConnectionError):
+            client.run("print(1)")
+        self.assertEmpty(get_daemon_client(missing))
+        # the script runs locally
+        stats = {}
+        out, _, _ = run_python_script(
+            "print('local')", process=True, pool=client, stats=stats
+        )
+        self.assertEqual(out.strip(), "local")
+        self.assertEqual(stats["mode"], "subprocess")
+
+    def test_rst2html(self):
+        content = """
+                    test a directive
+                    ================
+
+                    .. runpython::
+                        :process:
+
+                        print("daemon")
+                    """.replace("                    ", "")
+
+        with tempfile.TemporaryDirectory() as temp:
+            name = os.path.join(temp, "report.json")
+            rst = rst2html(
+                content,
+                writer_name="rst",
+                runpython_daemon_socket=self.path,
+                runpython_report=name,
+            )
+            with open(name) as f:
+                report = json.load(f)
+        self.assertIn("daemon", rst)
+        self.assertEqual(report[0]["mode"], "daemon")
+
+        rst = rst2html(
+            content,
+            writer_name="rst",
+            runpython_daemon_socket=self.path + ".missing",
+        )
+        self.assertIn("daemon", rst)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,130 @@
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+from sphinx_runpython.ext_test_case import ExtTestCase
+from sphinx_runpython.process_rst import rst2html
+from sphinx_runpython.runpython.run_dependencies import (
+    DependencyRecorder,
+    imported_modules,
+    outdated_dependencies,
+    record_dependencies,
+)
+from sphinx_runpython.runpython.run_pool import RunPythonPool
+from sphinx_runpython.runpython.sphinx_runpython_extension import run_python_script
+
+
+class TestRunDependencies(ExtTestCase):
+    def test_imported_modules(self):
+        self.assertEqual(
+            imported_modules("import os, a.b\nfrom c import d\nfrom . import e"),
+            ["a.b", "c", "os"],
+        )
+        self.assertEqual(imported_modules("import ("), [])
+
+    def test_recorder_in_process(self):
+        with tempfile.TemporaryDirectory() as temp:
+            data = os.path.join(temp, "data.txt")
+            with open(data, "w") as f:
+                f.write("7")
+            mod = os.path.join(temp, "mod_dep_inprocess.py")
+            with open(mod, "w") as f:
+                f.write("VALUE = 5\n")
+            script = (
+                "def f():\n"
+                "    import mod_dep_inprocess\n"
+                f"    with open({data!r}) as f:\n"
+                "        print(mod_dep_inprocess.VALUE + int(f.read()))\n"
+                "f()"
+            )
+            sys.path.insert(0, temp)
+            try:
+                rec = DependencyRecorder(script)
+                with rec:
+                    out, _, _ = run_python_script(script)
+                sigs = rec.signatures()
+            finally:
+                sys.path.remove(temp)
+                sys.modules.pop("mod_dep_inprocess", None)
+        self.assertEqual(out.strip(), "12")
+        self.assertEqual(set(sigs), {os.path.abspath(data), os.path.abspath(mod)})
+        # numpy or the standard library are never dependencies
+        self.assertFalse(any("site-packages" in k for k in sigs))
+
+    def test_recorder_pool(self):
+        pool = RunPythonPool(1)
+        try:
+            with tempfile.TemporaryDirectory() as temp:
+                data = os.path.join(temp, "data.txt")
+                with open(data, "w") as f:
+                    f.write("7")
+                script = f"import json\nwith open({data!r}) as f:\n    print(f.read())"
+                rec = DependencyRecorder(script)
+                with rec:
+                    out, _, _ = run_python_script(
+                        script, process=True, pool=pool, dependencies=rec.files
+                    )
+                sigs = rec.signatures()
+        finally:
+            pool.close()
+        self.assertEqual(out.strip(), "7")
+        self.assertEqual(list(sigs), [os.path.abspath(data)])
+
+    def test_outdated_dependencies(self):
+        with tempfile.TemporaryDirectory() as temp:
+            data = os.path.join(temp, "data.txt")
+            with open(data, "w") as f:
+                f.write("1")
+            rec = DependencyRecorder("")
+            rec.files.add(data)
+            noted = []
+            env = SimpleNamespace(note_dependency=noted.append)
+            record_dependencies(env, "index", rec.signatures())
+            self.assertEqual(noted, [os.path.abspath(data)])
+            self.assertEqual(outdated_dependencies(None, env, set(), set(), set()), [])
+            with open(data, "w") as f:
+                f.write("2")
+            self.assertEqual(
+                outdated_dependencies(None, env, set(), set(), set()), ["index"]
+            )
+            self.assertEqual(
+                outdated_dependencies(None, env, set(), {"index"}, set()), []
+            )
+
+    def test_runpython_track_dependencies(self):
+        content = """
+                    test a directive
+                    ================
+
+                    .. runpython::
+
+                        import os
+                        print(os.path.exists(__WD__))
+                    """.replace("                    ", "")
+        rst = rst2html(content, writer_name="rst", runpython_track_dependencies=True)
+        self.assertIn("True", rst)
+
+    def test_runpython_cache_dependencies(self):
+        with tempfile.TemporaryDirectory() as temp:
+            data = os.path.join(temp, "data.txt")
+            content = f"""
+                .. runpython::
+
+                    with open({data!r}) as f:
+                        print("value", f.read())
+                """.replace("                ", "")
+            for value in ["1", "2"]:
+                with open(data, "w") as f:
+                    f.write(value)
+                rst = rst2html(
+                    content,
+                    writer_name="rst",
+                    runpython_cache_dir=os.path.join(temp, "cache"),
+                    runpython_track_dependencies=True,
+                )
+                self.assertIn(f"value {value}", rst)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,166 @@
+import contextlib
+import subprocess
+import sys
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from sphinx_runpython.ext_test_case import ExtTestCase
+from sphinx_runpython.process_rst import rst2html
+from sphinx_runpython.runpython.run_cmd import run_cmd, run_cmds
+from sphinx_runpython.runpython.run_pool import RunPythonPool
+from sphinx_runpython.runpython.sphinx_runpython_extension import (
+    RunPythonExecutionError,
+    RunPythonMemoryError,
+    RunPythonTimeoutError,
+    _parse_memory_size,
+    run_python_script,
+)
+
+_SLOW = (
+    "print('begin', flush=True)\nimport time\nfor i in range(100):\n    time.sleep(0.2)"
+)
+_BIG = "x = bytearray(2**31)\nprint(len(x))"
+
+
+class TestRunLimits(ExtTestCase):
+    def test_parse_memory_size(self):
+        self.assertEqual(_parse_memory_size(None), None)
+        self.assertEqual(_parse_memory_size("1000"), 1000)
+        self.assertEqual(_parse_memory_size("2K"), 2048)
+        self.assertEqual(_parse_memory_size("1.5G"), 3 * 2**29)
+        self.assertEqual(_parse_memory_size("512mb"), 2**29)
+
+    def test_timeout_subprocess(self):
+        begin = time.perf_counter()
+        with self.assertRaises(RunPythonTimeoutError) as e:
+            run_python_script(_SLOW, process=True, timeout=1)
+        self.assertLess(time.perf_counter() - begin, 10)
+        self.assertIsInstance(e.exception, RunPythonExecutionError)
+        self.assertEqual(e.exception.reason, "timeout")
+        self.assertIn("begin", e.exception.out)
+
+    def test_timeout_pool(self):
+        pool = RunPythonPool(1)
+        try:
+            with self.assertRaises(RunPythonTimeoutError) as e:
+                run_python_script(_SLOW, process=True, pool=pool, timeout=1)
+            self.assertIn("begin", e.exception.out)
+            # the interpreter is still usable
+            out, _, _ = run_python_script("print('next')", process=True, pool=pool)
+            self.assertEqual(out.strip(), "next")
+        finally:
+            pool.close()
+
+    @unittest.skipIf(sys.platform.startswith("win"), reason="no SIGALRM")
+    def test_timeout_in_process(self):
+        script = (
+            "def f():\n    import time\n    while True:\n        time.sleep(0.1)\nf()"
+        )
+        with self.assertRaises(RunPythonTimeoutError):
+            run_python_script(script, timeout=0.5)
+        out, _, _ = run_python_script("print(1)", timeout=10)
+        self.assertEqual(out.strip(), "1")
+
+    @unittest.skipIf(sys.platform != "linux", reason="RLIMIT_AS")
+    def test_maxmem(self):
+        with self.assertRaises(RunPythonMemoryError) as e:
+            run_python_script(_BIG, process=True, maxmem=2**30)
+        self.assertEqual(e.exception.reason, "memory")
+        pool = RunPythonPool(1)
+        try:
+            with self.assertRaises(RunPythonMemoryError):
+                run_python_script(_BIG, process=True, pool=pool, maxmem=2**30)
+            # the limit is removed after the script
+            out, _, _ = run_python_script(_BIG, process=True, pool=pool)
+            self.assertEqual(out.strip(), str(2**31))
+            # option :exception: returns the error
+            _, err, _ = run_python_script(
+                _BIG, process=True, pool=pool, maxmem=2**30, exception=True
+            )
+            self.assertIn("MemoryError", err)
+        finally:
+            pool.close()
+        _, err, _ = run_python_script(_BIG, process=True, maxmem=2**30, exception=True)
+        self.assertIn("MemoryError", err)
+        # only an uncaught MemoryError means the limit was reached
+        out, _, _ = run_python_script(
+            "print('MemoryError')", process=True, maxmem=2**30
+        )
+        self.assertEqual(out.strip(), "MemoryError")
+
+    @unittest.skipIf(sys.platform.startswith("win"), reason="process group")
+    def test_timeout_grandchild(self):
+        # the grandchild keeps the pipes open after its parent is killed
+        script = (
+            "import subprocess, sys, time\n"
+            "subprocess.Popen([sys.executable, '-c', 'import time;time.sleep(30)'])\n"
+            "print('begin', flush=True)\n"
+            "time.sleep(30)"
+        )
+        cmd = [sys.executable, "-c", script]
+        for kwargs in [
+            {},
+            dict(retention="headtail"),
+            dict(communicate=False, logf=lambda *args: None),
+        ]:
+            with self.subTest(**kwargs):
+                begin = time.perf_counter()
+                with contextlib.suppress(subprocess.TimeoutExpired):
+                    run_cmd(cmd, wait=True, timeout=1, **kwargs)
+                self.assertLess(time.perf_counter() - begin, 10)
+        begin = time.perf_counter()
+        res = run_cmds([cmd], timeout=1)
+        self.assertIsInstance(res[0]["exception"], Exception)
+        self.assertLess(time.perf_counter() - begin, 10)
+
+    @unittest.skipIf(sys.platform != "linux", reason="RLIMIT_AS")
+    def test_maxmem_threads(self):
+        # the limit does not leak into commands started by other threads
+        unlimited = (
+            "import resource\n"
+            "print(resource.getrlimit(resource.RLIMIT_AS)[0] == resource.RLIM_INFINITY)"
+        )
+
+        def run(i):
+            if i % 2:
+                return run_cmd([sys.executable, "-c", unlimited], wait=True)
+            return run_cmd([sys.executable, "-c", _BIG], wait=True, maxmem=2**30)
+
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(run, range(8)))
+        for i, (out, err) in enumerate(results):
+            if i % 2:
+                self.assertEqual(out.strip(), "True")
+            else:
+                self.assertIn("MemoryError", err)
+        # a shell command inherits the limit
+        stats = {}
+        out, _ = run_cmd(
+            "ulimit -v",
+            shell=True,
+            preprocess=False,
+            wait=True,
+            maxmem=2**30,
+            stats=stats,
+        )
+        self.assertEqual(out.strip(), str(2**20))
+        self.assertEqual(stats["returncode"], 0)
+
+    def test_runpython_timeout(self):
+        content = """
+                    .. runpython::
+                        :process:
+                        :timeout: 1
+
+                        import time
+                        time.sleep(30)
+                    """.replace("                    ", "")
+        begin = time.perf_counter()
+        with self.assertRaises(RuntimeError) as e:
+            rst2html(content, writer_name="rst")
+        self.assertIn("RunPythonTimeoutError", str(e.exception))
+        self.assertLess(time.perf_counter() - begin, 20)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,224 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from sphinx_runpython.ext_test_case import ExtTestCase
+from sphinx_runpython.process_rst import rst2html
+from sphinx_runpython.runpython.run_cmd import RunCmdException
+from sphinx_runpython.runpython.run_pool import (
+    RunPythonPool,
+    _PoolWorker,
+    get_process_pool,
+)
+from sphinx_runpython.runpython.sphinx_runpython_extension import run_python_script
+
+
+def _running(pid):
+    # a zombie process is not running
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split()[2] != "Z"
+    except OSError:
+        return False
+
+
+class TestRunPool(ExtTestCase):
+    def test_pool_run(self):
+        pool = RunPythonPool(2, recycle=2, preload=["json"])
+        try:
+            for i in range(5):
+                out, err = pool.run(
+                    f"import sys\nsys.path.append('xx')\nsys.zz = 1\nprint({i})"
+                )
+                self.assertEqual(out.strip(), str(i))
+                self.assertEqual(err, "")
+            out, err = pool.run(
+                "import sys\nprint('xx' in sys.path, hasattr(sys, 'zz'))"
+            )
+            self.assertEqual(out.strip(), "False False")
+        finally:
+            pool.close()
+
+    def test_pool_error(self):
+        pool = RunPythonPool(1)
+        try:
+            out, err = pool.run("print('before')\nraise ValueError('unexpected')")
+            self.assertEqual(out.strip(), "before")
+            self.assertIn("ValueError: unexpected", err)
+            self.assertIn('File "<stdin>", line 2', err)
+            self.assertNotIn("_pool_worker", err)
+            out, err = pool.run("import sys\nsys.stderr.write('E')\nprint('O')")
+            self.assertEqual((out.strip(), err), ("O", "E"))
+        finally:
+            pool.close()
+
+    def test_pool_preload_print(self):
+        with tempfile.TemporaryDirectory() as temp:
+            with open(os.path.join(temp, "noisy_module.py"), "w") as f:
+                f.write("print('imported')\n")
+            path = os.pathsep.join([temp, os.environ.get("PYTHONPATH", "")])
+            with mock.patch.dict(os.environ, {"PYTHONPATH": path}):
+                for fork in [False, True]:
+                    pool = RunPythonPool(1, preload=["noisy_module"], fork=fork)
+                    try:
+                        out, err = pool.run("import noisy_module\nprint(1)")
+                    finally:
+                        pool.close()
+                    self.assertEqual(out.strip(), "1")
+                    self.assertEqual(err, "")
+
+    def test_pool_unexpected_answer(self):
+        worker = _PoolWorker.__new__(_PoolWorker)
+        worker.proc = SimpleNamespace(
+            pid=0, stdout=SimpleNamespace(readline=lambda: b"imported\n")
+        )
+        with self.assertRaises(RunCmdException) as e:
+            worker._receive()
+        self.assertIn("imported", str(e.exception))
+
+    def test_pool_cwd_file(self):
+        pool = get_process_pool(1)
+        with tempfile.TemporaryDirectory() as temp:
+            name = os.path.join(temp, "script.py")
+            script = (
+                "import os, inspect\ndef f():\n    pass\nprint(inspect.getsource(f))"
+            )
+            with open(name, "w") as f:
+                f.write(script)
+            out, err = pool.run(script, filename=name, cwd=temp)
+            self.assertIn("def f():", out)
+            self.assertEqual(err, "")
+            out, err = pool.run("import os\nprint(os.getcwd())", cwd=temp)
+            self.assertEqual(os.path.realpath(out.strip()), os.path.realpath(temp))
+        out, _ = pool.run("import os\nprint(os.getcwd())")
+        self.assertEqual(os.path.realpath(out.strip()), os.path.realpath(os.getcwd()))
+
+    @unittest.skipIf(not hasattr(os, "fork") or sys.platform == "darwin", "no fork")
+    def test_pool_fork(self):
+        pool = RunPythonPool(1, preload=["json"], fork=True)
+        try:
+            self.assertTrue(pool.supports_fork())
+            out, err = pool.run("import json, os\njson.zz = 1\nprint(os.getpid())")
+            self.assertEqual(err, "")
+            out2, err = pool.run("import json, os\nprint(hasattr(json, 'zz'))")
+            self.assertEqual((out2.strip(), err), ("False", ""))
+            out3, _ = pool.run("import os\nprint(os.getpid())")
+            self.assertNotEqual(out.strip(), out3.strip())
+            out, err = pool.run("raise RuntimeError('fork')")
+            self.assertIn("RuntimeError: fork", err)
+        finally:
+            pool.close()
+
+    @unittest.skipIf(sys.platform != "linux", reason="RLIMIT_AS")
+    def test_pool_maxmem_child(self):
+        pool = RunPythonPool(1)
+        try:
+            script = "import os\nprint(os.getpid())"
+            out, _ = pool.run(script)
+            out2, _ = pool.run(script, maxmem=2**30)
+            out3, _ = pool.run(script)
+            # only a forked process is limited
+            self.assertNotEqual(out.strip(), out2.strip())
+            self.assertEqual(out.strip(), out3.strip())
+        finally:
+            pool.close()
+
+    @unittest.skipIf(sys.platform != "linux", reason="uses /proc")
+    def test_pool_fork_kill(self):
+        pool = RunPythonPool(1, fork=True)
+        try:
+            with tempfile.TemporaryDirectory() as temp:
+                name = os.path.join(temp, "pid.txt")
+                with self.assertRaises(subprocess.TimeoutExpired):
+                    pool.run(
+                        "import os, signal, time\n"
+                        "signal.signal(signal.SIGALRM, signal.SIG_IGN)\n"
+                        f"with open({name!r}, 'w') as f:\n"
+                        "    f.write(str(os.getpid()))\n"
+                        "time.sleep(60)",
+                        timeout=0.5,
+                    )
+                with open(name) as f:
+                    pid = int(f.read())
+            # the forked process is killed with the interpreter
+            begin = time.perf_counter()
+            while time.perf_counter() - begin < 10:
+                if not _running(pid):
+                    break
+                time.sleep(0.1)
+            else:
+                raise AssertionError(f"Process {pid} is still running.")
+            out, _ = pool.run("print('alive')")
+            self.assertEqual(out.strip(), "alive")
+        finally:
+            pool.close()
+
+    def test_run_python_script_pool(self):
+        pool = get_process_pool(1)
+        out, err, _ = run_python_script(
+            "import sys\nprint(sys.executable)", process=True, pool=pool
+        )
+        self.assertEqual(out.strip(), sys.executable)
+        self.assertEqual(err, "")
+
+    def test_runpython_pool_size(self):
+        content = """
+                    test a directive
+                    ================
+
+                    .. runpython::
+                        :process:
+
+                        import os
+                        print("pid", os.getpid())
+
+                    .. runpython::
+                        :process:
+
+                        import os
+                        print("pid", os.getpid())
+                    """.replace("                    ", "")
+
+        rst = rst2html(content, writer_name="rst", runpython_pool_size=1)
+        pids = [line for line in rst.split("\n") if "pid" in line]
+        self.assertEqual(len(pids), 2)
+        self.assertEqual(pids[0], pids[1])
+
+    @unittest.skipIf(not hasattr(os, "fork") or sys.platform == "darwin", "no fork")
+    def test_runpython_forkserver(self):
+        content = """
+                    test a directive
+                    ================
+
+                    .. runpython::
+                        :process:
+
+                        import os
+                        print("pid", os.getpid(), os.getppid())
+
+                    .. runpython::
+                        :process:
+
+                        import os
+                        print("pid", os.getpid(), os.getppid())
+                    """.replace("                    ", "")
+
+        rst = rst2html(
+            content,
+            writer_name="rst",
+            runpython_process_mode="forkserver",
+            runpython_process_preload=["json"],
+        )
+        pids = [line.split()[1:] for line in rst.split("\n") if "pid" in line]
+        self.assertEqual(len(pids), 2)
+        # two different children of the same parent
+        self.assertNotEqual(pids[0][0], pids[1][0])
+        self.assertEqual(pids[0][1], pids[1][1])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
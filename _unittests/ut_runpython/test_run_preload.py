@@ -0,0 +1,70 @@
+import sys
+import unittest
+from sphinx_runpython.ext_test_case import ExtTestCase
+from sphinx_runpython.process_rst import rst2html
+from sphinx_runpython.runpython.run_preload import preload_modules, set_numpy_precision
+from sphinx_runpython.runpython.sphinx_runpython_extension import (
+    build_runpython_script,
+    get_runpython_options,
+    run_python_script,
+)
+
+
+class TestRunPreload(ExtTestCase):
+    def test_preload_modules(self):
+        res = preload_modules(["json", "not_existing_module_runpython"])
+        self.assertIsInstance(res["json"], float)
+        self.assertIn("ModuleNotFoundError", res["not_existing_module_runpython"])
+        self.assertIn("json", sys.modules)
+
+    def test_set_numpy_precision(self):
+        import numpy
+
+        self.assertFalse(set_numpy_precision("-"))
+        self.assertFalse(set_numpy_precision("a"))
+        self.assertTrue(set_numpy_precision(4))
+        self.assertEqual(numpy.get_printoptions()["precision"], 4)
+        self.assertTrue(set_numpy_precision("4"))
+        self.assertTrue(set_numpy_precision(3))
+        self.assertEqual(numpy.get_printoptions()["precision"], 3)
+
+    def test_numpy_prelude_not_in_script(self):
+        code = "import numpy\nprint(numpy.array([1.123456789]))"
+        p = get_runpython_options({}, numpy_precision=5)
+        self.assertEqual(p["numpy_precision"], "5")
+        script = build_runpython_script(code, p, "f")
+        self.assertNotIn("set_printoptions", script)
+        p = get_runpython_options({"process": True})
+        script = build_runpython_script(code, p, "f")
+        self.assertIn("numpy.set_printoptions(3)", script)
+
+    def test_numpy_precision_in_process(self):
+        code = "import numpy\nprint(numpy.array([1.123456789]))"
+        out, _, _ = run_python_script(code, numpy_precision=2)
+        self.assertEqual(out.strip(), "[1.12]")
+        out, _, _ = run_python_script(code, numpy_precision=3)
+        self.assertEqual(out.strip(), "[1.123]")
+
+    def test_runpython_preload_config(self):
+        content = """
+                    test a directive
+                    ================
+
+                    .. runpython::
+
+                        import numpy
+                        print(numpy.array([1.123456789, 1.987654321]))
+                    """.replace("                    ", "")
+
+        html = rst2html(
+            content,
+            writer_name="rst",
+            runpython_preload_modules=["numpy", "not_existing_module_runpython"],
+            runpython_numpy_precision=5,
+        )
+        self.assertIn("[1.12346 1.98765]", html)
+        set_numpy_precision(3)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+from sphinx_runpython.ext_test_case import ExtTestCase
+from sphinx_runpython.process_rst import rst2html
+from sphinx_runpython.runpython.run_prepass import (
+    collect_prepass_jobs,
+    find_runpython_blocks,
+    pop_prepass_result,
+    run_prepass,
+)
+
+
+class TestRunPrepass(ExtTestCase):
+    def test_find_runpython_blocks(self):
+        text = """
+            title
+            =====
+
+            .. runpython::
+                :showcode:
+                :warningout: DeprecationWarning
+                    FutureWarning
+
+                for i in range(2):
+                    print(i)
+
+            ::
+
+                .. runpython::
+
+                    print("example")
+
+            .. runpython::
+                print("no option")
+
+            .. note::
+
+                .. runpython::
+                    :process:
+
+                    print("nested")
+            """.replace("            ", "")
+        blocks = find_runpython_blocks(text)
+        self.assertEqual(len(blocks), 3)
+        self.assertEqual(blocks[0]["lineno"], 5)
+        self.assertEqual(
+            blocks[0]["options"],
+            {"showcode": "", "warningout": "DeprecationWarning\nFutureWarning"},
+        )
+        self.assertEqual(blocks[0]["content"], ["for i in range(2):", "    print(i)"])
+        self.assertEqual(blocks[1]["options"], {})
+        self.assertEqual(blocks[1]["content"], ['print("no option")'])
+        self.assertEqual(blocks[2]["options"], {"process": ""})
+        self.assertEqual(blocks[2]["content"], ['print("nested")'])
+
+    def test_run_prepass(self):
+        text = """
+            .. runpython::
+
+                print("in")
+
+            .. runpython::
+                :process:
+
+                print("out")
+
+            .. runpython::
+                :store:
+
+                a = 1
+            """.replace("            ", "")
+        with tempfile.TemporaryDirectory() as temp:
+            name = os.path.join(temp, "index.rst")
+            with open(name, "w") as f:
+                f.write(text)
+            jobs = collect_prepass_jobs([("index", name)])
+        self.assertEqual(len(jobs), 2)
+        res = run_prepass(jobs, max_workers=2)
+        self.assertEqual(len(res), 2)
+        self.assertEqual(pop_prepass_result(jobs[0]["key"])[0].strip(), "in")
+        self.assertEqual(pop_prepass_result(jobs[1]["key"])[0].strip(), "out")
+        self.assertEqual(pop_prepass_result(jobs[1]["key"]), None)
+
+    def test_runpython_prepass(self):
+        content = """
+                    test a directive
+                    ================
+
+                    .. runpython::
+                        :store:
+
+                        import os
+                        print("pid1", os.getpid())
+
+                    .. runpython::
+
+                        import os
+                        print("pid2", os.getpid())
+                    """.replace("                    ", "")
+
+        for prepass in [False, True]:
+            rst = rst2html(content, writer_name="rst", runpython_prepass=prepass)
+            pids = [line.split()[-1] for line in rst.split("\n") if "pid" in line]
+            self.assertEqual(len(pids), 2)
+            if prepass:
+                self.assertNotEqual(pids[0], pids[1])
+            else:
+                self.assertEqual(pids[0], pids[1])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,66 @@
+import json
+import os
+import tempfile
+import unittest
+from sphinx_runpython.ext_test_case import ExtTestCase
+from sphinx_runpython.process_rst import rst2html
+from sphinx_runpython.runpython.run_pool import get_process_pool
+from sphinx_runpython.runpython.run_report import ExecutionMeasure
+from sphinx_runpython.runpython.sphinx_runpython_extension import run_python_script
+
+
+class TestRunReport(ExtTestCase):
+    def test_measure_in_process(self):
+        with ExecutionMeasure(True) as m:
+            out, _, _ = run_python_script(
+                "def f():\n    x = [0] * 1000000\n    print(len(x))\nf()",
+                stats=m.stats,
+            )
+        self.assertEqual(out.strip(), "1000000")
+        self.assertEqual(m.record["mode"], "in-process")
+        self.assertGreater(m.record["peak_memory"], 8000000)
+        self.assertGreater(m.record["wall"], 0)
+
+    def test_measure_pool(self):
+        pool = get_process_pool(1)
+        with ExecutionMeasure(False) as m:
+            out, _, _ = run_python_script(
+                "print('pool')", process=True, pool=pool, stats=m.stats
+            )
+        self.assertEqual(out.strip(), "pool")
+        self.assertEqual(m.record["mode"], "pool")
+        self.assertIn("duration", m.stats)
+
+    def test_runpython_report(self):
+        content = """
+                    test a directive
+                    ================
+
+                    .. runpython::
+
+                        print("in")
+
+                    .. runpython::
+                        :process:
+
+                        import time
+                        time.sleep(0.5)
+                        print("out")
+                    """.replace("                    ", "")
+
+        with tempfile.TemporaryDirectory() as temp:
+            name = os.path.join(temp, "report.json")
+            rst2html(content, writer_name="rst", runpython_report=name)
+            with open(name) as f:
+                report = json.load(f)
+        self.assertEqual(len(report), 2)
+        self.assertEqual(report[0]["mode"], "subprocess")
+        self.assertEqual(report[0]["lineno"], 9)
+        self.assertGreater(report[0]["wall"], 0.5)
+        self.assertEqual(report[1]["mode"], "in-process")
+        self.assertEqual(report[1]["docname"], "index")
+        self.assertEqual(report[1]["output_size"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,105 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from sphinx_runpython.ext_test_case import ExtTestCase
+from sphinx_runpython.process_rst import rst2html
+from sphinx_runpython.runpython.run_prepass import clear_prepass_results, run_prepass
+from sphinx_runpython.runpython.run_schedule import (
+    drop_purged_durations,
+    get_duration,
+    keep_duration,
+    longest_first,
+    merge_durations,
+    over_budget,
+    purge_durations,
+    record_duration,
+)
+
+
+def _values(rst):
+    return [line.strip() for line in rst.split("\n") if line.strip().startswith("v")]
+
+
+class TestRunSchedule(ExtTestCase):
+    def test_longest_first(self):
+        jobs = [dict(key=k) for k in "abcd"]
+        ordered = longest_first(jobs, dict(a=1.0, b=5.0, d=0.5))
+        self.assertEqual([j["key"] for j in ordered], ["c", "b", "a", "d"])
+
+    def test_over_budget(self):
+        latest = dict(out="", err="", duration=10.0)
+        self.assertFalse(over_budget(20.0, None, latest))
+        self.assertFalse(over_budget(20.0, 5.0, None))
+        self.assertTrue(over_budget(20.0, 5.0, latest))
+        self.assertFalse(over_budget(2.0, 5.0, latest))
+        self.assertTrue(over_budget(None, 5.0, latest))
+
+    def test_run_prepass_durations(self):
+        jobs = [
+            dict(key=str(i), kwargs=dict(script=f"import time\ntime.sleep({i / 10})"))
+            for i in range(3)
+        ]
+        durations = {"0": 10.0}
+        res = run_prepass(jobs, max_workers=2, durations=durations)
+        clear_prepass_results(None, None)
+        self.assertEqual(len(res), 3)
+        self.assertEqual(set(durations), {"0", "1", "2"})
+        self.assertLess(durations["0"], 10.0)
+        self.assertGreater(durations["2"], 0.2)
+
+    def test_time_budget(self):
+        content = """
+                    test a directive
+                    ================
+
+                    .. runpython::
+
+                        import random
+                        import time
+                        time.sleep(0.5)
+                        print("v", random.random())
+                    """.replace("                    ", "")
+
+        modified = content.replace('print("v",', 'print("v", "modified",')
+        with tempfile.TemporaryDirectory() as temp:
+            data = os.path.join(temp, "data.txt")
+            with open(data, "w") as f:
+                f.write("1")
+            kwargs = dict(
+                writer_name="rst",
+                runpython_cache_dir=os.path.join(temp, "cache"),
+                runpython_cache_dependencies=[data],
+            )
+            v1 = _values(rst2html(content, **kwargs))
+            with open(data, "w") as f:
+                f.write("2")
+            # the cached outputs cannot be used, the script is too long
+            v2 = _values(rst2html(content, runpython_time_budget=0.1, **kwargs))
+            # a modified script always runs
+            v3 = _values(rst2html(modified, runpython_time_budget=0.1, **kwargs))
+        self.assertEqual(len(v1), 1)
+        self.assertEqual(v1, v2)
+        self.assertEqual(len(v3), 1)
+        self.assertIn("modified", v3[0])
+
+    def test_purge_durations(self):
+        env = SimpleNamespace(config=SimpleNamespace(runpython_cache_dir=None))
+        for key, docname in [("a", "doc1"), ("b", "doc1"), ("c", "doc2")]:
+            record_duration(env, key, 1.0)
+            keep_duration(env, key, docname)
+        purge_durations(None, env, "doc1")
+        # the document is read again and only keeps script a
+        other = SimpleNamespace(
+            runpython_durations={"a": 2.0}, runpython_duration_docs={"doc1": {"a"}}
+        )
+        merge_durations(None, env, {"doc1"}, other)
+        drop_purged_durations(None, env)
+        self.assertEqual(get_duration(env, "a"), 2.0)
+        self.assertEqual(get_duration(env, "b"), None)
+        self.assertEqual(get_duration(env, "c"), 1.0)
+        self.assertEqual(env.runpython_duration_docs, {"doc1": {"a"}, "doc2": {"c"}})
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
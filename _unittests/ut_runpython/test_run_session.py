@@ -0,0 +1,93 @@
+import unittest
+from sphinx_runpython.ext_test_case import ExtTestCase
+from sphinx_runpython.process_rst import rst2html
+from sphinx_runpython.runpython.run_session import (
+    _NAMESPACES,
+    _SESSION_POOLS,
+    close_sessions,
+    get_session_namespace,
+    get_session_pool,
+)
+from sphinx_runpython.runpython.sphinx_runpython_extension import (
+    RunPythonExecutionError,
+    run_python_script,
+)
+
+
+class TestRunSession(ExtTestCase):
+    def test_namespace(self):
+        ns = get_session_namespace("doc", "a")
+        self.assertIs(ns, get_session_namespace("doc", "a"))
+        self.assertIsNot(ns, get_session_namespace("doc", "b"))
+        run_python_script("x = [1, 2]", namespace=ns)
+        out, _, _ = run_python_script("x.append(3)\nprint(x)", namespace=ns)
+        self.assertEqual(out.strip(), "[1, 2, 3]")
+        # nothing but the variables of the scripts remains in the namespace
+        self.assertNotIn("__dict__", ns)
+        self.assertEqual([k for k in ns if k.startswith("__runpython__")], [])
+        with self.assertRaises(RunPythonExecutionError):
+            run_python_script("raise ValueError()", namespace=ns)
+        self.assertEqual([k for k in ns if k.startswith("__runpython__")], [])
+        close_sessions("doc")
+        self.assertNotIn(("doc", "a"), _NAMESPACES)
+
+    def test_pool(self):
+        pool = get_session_pool("doc", "p")
+        self.assertIs(pool, get_session_pool("doc", "p"))
+        try:
+            run_python_script("x = 5", process=True, pool=pool, session="p")
+            out, _, _ = run_python_script(
+                "import os\nprint(x, os.getpid())", process=True, pool=pool, session="p"
+            )
+        finally:
+            close_sessions()
+        self.assertEqual(out.split()[0], "5")
+        self.assertEqual(len(_SESSION_POOLS), 0)
+
+    def test_runpython_session(self):
+        content = """
+                    test a directive
+                    ================
+
+                    .. runpython::
+                        :session: s1
+
+                        import numpy
+                        big = numpy.arange(10)
+                        print(id(big))
+
+                    .. runpython::
+                        :session: s1
+
+                        print(id(big), big.sum())
+
+                    .. runpython::
+                        :process:
+                        :session: s2
+
+                        import os
+                        pid = os.getpid()
+                        print("pid", pid)
+
+                    .. runpython::
+                        :process:
+                        :session: s2
+
+                        import os
+                        print("pid", pid, os.getpid())
+                    """.replace("                    ", "")
+
+        rst = rst2html(content, writer_name="rst")
+        lines = [line.strip() for line in rst.split("\n") if line.strip()]
+        ids = [line for line in lines if line[:1].isdigit()]
+        self.assertEqual(len(ids), 2)
+        self.assertEqual(ids[1], f"{ids[0]} 45")
+        pids = [line.split()[1:] for line in lines if line.startswith("pid")]
+        self.assertEqual(len(pids), 2)
+        self.assertEqual(pids[1], [pids[0][0], pids[0][0]])
+        self.assertEqual(len(_NAMESPACES), 0)
+        self.assertEqual(len(_SESSION_POOLS), 0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
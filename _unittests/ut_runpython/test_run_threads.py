@@ -0,0 +1,132 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from sphinx_runpython.ext_test_case import ExtTestCase
+from sphinx_runpython.runpython.run_prepass import run_prepass
+from sphinx_runpython.runpython.run_threads import (
+    route_output,
+    sys_variable,
+    working_directory,
+)
+from sphinx_runpython.runpython.sphinx_runpython_extension import run_python_script
+
+
+class TestRunThreads(ExtTestCase):
+    def test_concurrent_outputs(self):
+        barrier = threading.Barrier(4)
+
+        def run(i):
+            script = (
+                "import time\n"
+                "for k in range(20):\n"
+                f"    print({i}, k)\n"
+                "    time.sleep(0.001)\n"
+            )
+            barrier.wait()
+            return run_python_script(script, threadsafe=True)
+
+        saved = sys.stdout, sys.stderr
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(run, range(4)))
+        self.assertIs(sys.stdout, saved[0])
+        self.assertIs(sys.stderr, saved[1])
+        for i, (out, err, _) in enumerate(results):
+            lines = out.strip().split("\n")
+            self.assertEqual(len(lines), 20)
+            self.assertEqual({line.split()[0] for line in lines}, {str(i)})
+            self.assertEqual(err, "")
+
+    def test_concurrent_warnings(self):
+        def run(category):
+            script = "import warnings\nwarnings.warn('w', UserWarning)\nprint('ok')"
+            return run_python_script(
+                script, threadsafe=True, warningout=category, exception=True
+            )
+
+        with ThreadPoolExecutor(2) as executor:
+            ignored, shown = executor.map(run, ["UserWarning", "DeprecationWarning"])
+        self.assertEqual(ignored[0].strip(), "ok")
+        self.assertIn("UserWarning", shown[0])
+        self.assertIn("ok", shown[0])
+
+    def test_warnings_other_threads(self):
+        routed, done = threading.Event(), threading.Event()
+
+        def run(f):
+            with route_output(f):
+                routed.set()
+                warnings.warn("routed", UserWarning, stacklevel=1)
+                done.wait()
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("ignore")
+            with tempfile.TemporaryFile("w+") as f:
+                thread = threading.Thread(target=run, args=(f,))
+                thread.start()
+                routed.wait()
+                warnings.warn("other", UserWarning, stacklevel=1)
+                done.set()
+                thread.join()
+                f.seek(0)
+                text = f.read()
+            filters = list(warnings.filters)
+        # the routed thread always sees its warnings,
+        # the other thread keeps the filters of the process
+        self.assertIn("routed", text)
+        self.assertEqual(caught, [])
+        self.assertEqual(filters[0], ("ignore", None, Warning, None, 0))
+        self.assertNotIn("_RoutedThread", str(filters))
+
+    def test_route_output_nested(self):
+        saved = sys.stdout
+        with tempfile.TemporaryFile("w+") as f:
+            with route_output(f):
+                print("a")
+                with route_output(f):
+                    print("b")
+                print("c")
+            self.assertIs(sys.stdout, saved)
+            f.seek(0)
+            self.assertEqual(f.read(), "a\nb\nc\n")
+
+    def test_sys_variable(self):
+        self.assertFalse(hasattr(sys, "enable_disabled_documented_pieces_of_code"))
+        with sys_variable("enable_disabled_documented_pieces_of_code"):
+            with sys_variable("enable_disabled_documented_pieces_of_code"):
+                pass
+            self.assertTrue(sys.enable_disabled_documented_pieces_of_code)
+        self.assertFalse(hasattr(sys, "enable_disabled_documented_pieces_of_code"))
+
+    def test_working_directory(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as temp:
+            out, _, _ = run_python_script(
+                "import os\nprint(os.getcwd())", chdir=temp, threadsafe=True
+            )
+            self.assertEqual(
+                os.path.realpath(out.strip()), os.path.realpath(os.path.abspath(temp))
+            )
+            with working_directory(None):
+                self.assertEqual(os.getcwd(), cwd)
+        self.assertEqual(os.getcwd(), cwd)
+
+    def test_prepass_threads(self):
+        jobs = [
+            {
+                "key": str(i),
+                "kwargs": dict(script=f"print({i} * 2)", exception=True),
+            }
+            for i in range(6)
+        ]
+        results = run_prepass(jobs, max_workers=3, threads=True)
+        self.assertEqual(len(results), 6)
+        for i in range(6):
+            self.assertEqual(results[str(i)][0].strip(), str(i * 2))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
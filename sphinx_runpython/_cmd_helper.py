@@ -1,6 +1,7 @@
 import glob
 import os
-from typing import Optional
+import time
+from typing import Any, Dict, List, Optional
 from argparse import ArgumentParser, RawTextHelpFormatter
 from tempfile import TemporaryDirectory
 
@@ -15,8 +16,10 @@ def get_parser():
     parser.add_argument(
         "command",
         help="Command to run, only 'nb2py', 'readme', 'img2pdf', 'api', "
-        "'latex' are available\n"
+        "'latex', 'exec', 'worker' are available\n"
         "- api     - generates sphinx documentation api\n"
+        "- exec    - executes every runpython script of a documentation\n"
+        "- worker  - starts a daemon running the runpython scripts of every build\n"
         "- latex   - improves latex rendering\n"
         "- img2pdf - converts impage to pdf\n"
         "- nb2py   - converts notebooks into python\n"
@@ -51,6 +54,44 @@ def get_parser():
         default=0.0,
         help="rotate the image",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        default=None,
+        type=int,
+        help="number of processes used by exec, the number of cores by default,\n"
+        "number of interpreters started by worker",
+    )
+    parser.add_argument(
+        "--timeout",
+        default=None,
+        type=float,
+        help="timeout for every script executed by exec",
+    )
+    parser.add_argument(
+        "--socket",
+        default=None,
+        help="socket the worker listens to",
+    )
+    parser.add_argument(
+        "--preload",
+        default="",
+        help="modules the interpreters of the worker import, comma separated",
+    )
+    parser.add_argument(
+        "--no-fork",
+        help="the interpreters of the worker do not fork themselves to run "
+        "a script,\nthey are recycled after every script unless --recycle "
+        "is specified",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--recycle",
+        default=None,
+        type=int,
+        help="an interpreter of the worker is replaced after it ran "
+        "this number of scripts",
+    )
     parser.add_argument("-v", "--verbose", help="verbosity", default=1, type=int)
     return parser
 
@@ -116,6 +157,43 @@ def sphinx_api(
     f(infolder, output, verbose=verbose, hidden=hidden)
 
 
+def exec_runpython(
+    infolder: str,
+    recursive: bool = False,
+    jobs: Optional[int] = None,
+    output: Optional[str] = None,
+    timeout: Optional[float] = None,
+    verbose: int = 0,
+) -> List[Dict[str, Any]]:
+    from .runpython.run_exec import (
+        collect_runpython_blocks,
+        execute_runpython_blocks,
+        write_manifest,
+    )
+
+    begin = time.perf_counter()
+    blocks = collect_runpython_blocks(infolder, recursive=recursive)
+    if verbose:
+        print(f"[exec] found {len(blocks)} scripts in {infolder!r}")
+    records = execute_runpython_blocks(blocks, max_workers=jobs, timeout=timeout)
+    if output:
+        if verbose:
+            print(f"[exec] write {output!r}")
+        write_manifest(records, output)
+    failures = [r for r in records if r["status"] != "ok"]
+    if verbose:
+        for r in failures:
+            print(f"[exec] {r['status']} {r['filename']}:{r['lineno']}: {r['error']}")
+        if verbose > 1:
+            for r in sorted(records, key=lambda r: -r["duration"])[:10]:
+                print(f"[exec] {r['duration']:1.2f}s {r['filename']}:{r['lineno']}")
+        print(
+            f"[exec] {len(records) - len(failures)}/{len(records)} scripts "
+            f"succeeded in {time.perf_counter() - begin:1.1f} seconds"
+        )
+    return records
+
+
 def process_args(args):
     cmd = args.command
     if cmd == "nb2py":
@@ -130,6 +208,32 @@ def process_args(args):
             hidden=args.hidden,
         )
         return
+    if cmd == "exec":
+        records = exec_runpython(
+            args.path,
+            recursive=args.recursive,
+            jobs=args.jobs,
+            output=args.output,
+            timeout=args.timeout,
+            verbose=args.verbose,
+        )
+        if any(r["status"] != "ok" for r in records):
+            raise SystemExit(1)
+        return
+    if cmd == "worker":
+        from .runpython.run_daemon import serve
+
+        if not args.socket:
+            raise ValueError("Command 'worker' needs argument --socket.")
+        serve(
+            args.socket,
+            size=args.jobs or 1,
+            recycle=args.recycle,
+            preload=[m.strip() for m in args.preload.split(",") if m.strip()],
+            fork=not args.no_fork,
+            verbose=args.verbose,
+        )
+        return
     if cmd == "latex":
         latex_process(
             args.path,
@@ -0,0 +1,176 @@
+import re
+import xml.etree.ElementTree as ET
+from typing import Callable, Dict, Optional
+
+SVG_NS = "http://www.w3.org/2000/svg"
+XLINK_NS = "http://www.w3.org/1999/xlink"
+XML_NS = "http://www.w3.org/XML/1998/namespace"
+_KEPT_NAMESPACES = {SVG_NS, XLINK_NS, XML_NS}
+
+_NUMBER = re.compile(r"-?\d*\.\d+(?:[eE][-+]?\d+)?")
+_URL_REF = re.compile(r"url\(\s*#([^)\s]+)\s*\)")
+_GEOMETRY = {
+    "cx",
+    "cy",
+    "d",
+    "font-size",
+    "height",
+    "points",
+    "r",
+    "rx",
+    "ry",
+    "stroke-width",
+    "transform",
+    "viewBox",
+    "width",
+    "x",
+    "x1",
+    "x2",
+    "y",
+    "y1",
+    "y2",
+}
+
+
+def _namespace(tag: str) -> Optional[str]:
+    return tag[1:].split("}")[0] if tag.startswith("{") else None
+
+
+def _local(tag: str) -> str:
+    return tag.split("}")[-1]
+
+
+def _round(value: str, precision: int) -> str:
+    def _replace(match):
+        text = f"{float(match.group(0)):.{precision}f}".rstrip("0").rstrip(".")
+        return "0" if text in ("", "-0") else text
+
+    return _NUMBER.sub(_replace, value)
+
+
+def _short_name(index: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    name = ""
+    while True:
+        name = digits[index % 36] + name
+        index //= 36
+        if index == 0:
+            return name
+
+
+def _clean(element: ET.Element):
+    # removes metadata and elements or attributes from editors (inkscape, ...)
+    for child in list(element):
+        if not isinstance(child.tag, str):
+            element.remove(child)
+            continue
+        ns = _namespace(child.tag)
+        if _local(child.tag) == "metadata" or (ns and ns not in _KEPT_NAMESPACES):
+            element.remove(child)
+            continue
+        _clean(child)
+    for name in list(element.attrib):
+        ns = _namespace(name)
+        if ns and ns not in _KEPT_NAMESPACES:
+            del element.attrib[name]
+    if element.text is not None and not element.text.strip():
+        element.text = None
+    if element.tail is not None and not element.tail.strip():
+        element.tail = None
+
+
+def _dedup_defs(root: ET.Element) -> Dict[str, str]:
+    renamed = {}
+    for defs in root.iter(f"{{{SVG_NS}}}defs"):
+        seen = {}
+        for child in list(defs):
+            ident = child.attrib.get("id", None)
+            if ident is None:
+                continue
+            del child.attrib["id"]
+            signature = ET.tostring(child)
+            child.attrib["id"] = ident
+            if signature in seen:
+                renamed[ident] = seen[signature]
+                defs.remove(child)
+            else:
+                seen[signature] = ident
+    return renamed
+
+
+def _rename(value: str, names: Dict[str, str]) -> str:
+    if value.startswith("#") and value[1:] in names:
+        return f"#{names[value[1:]]}"
+    return _URL_REF.sub(lambda m: f"url(#{names.get(m.group(1), m.group(1))})", value)
+
+
+def _strip_namespaces(root: ET.Element):
+    # the serialized svg uses the default namespace and prefix xlink,
+    # the names are rewritten instead of registering the namespaces
+    # which would change the serialization of every other xml document
+    uses_xlink = False
+    for element in root.iter():
+        if _namespace(element.tag) == SVG_NS:
+            element.tag = _local(element.tag)
+        for name in list(element.attrib):
+            ns = _namespace(name)
+            if ns == SVG_NS:
+                element.attrib[_local(name)] = element.attrib.pop(name)
+            elif ns == XLINK_NS:
+                element.attrib[f"xlink:{_local(name)}"] = element.attrib.pop(name)
+                uses_xlink = True
+    root.attrib["xmlns"] = SVG_NS
+    if uses_xlink:
+        root.attrib["xmlns:xlink"] = XLINK_NS
+
+
+def minify_svg(
+    svg: str,
+    prefix: str = "s_",
+    precision: int = 2,
+    relink: Optional[Callable[[str], str]] = None,
+) -> str:
+    """
+    Reduces the size of a :epkg:`SVG` image before it is inserted into
+    a page. It removes comments, metadata, the xml declaration, blank
+    text, shortens the identifiers, rounds the coordinates and removes
+    duplicated definitions.
+
+    :param svg: SVG content
+    :param prefix: every identifier starts with this prefix,
+        it must be unique in the page to avoid any collision
+    :param precision: number of decimals kept for the coordinates
+    :param relink: function modifying the relative links
+        (``href`` and ``xlink:href`` not starting with ``#``)
+    :return: minified SVG
+    """
+    root = ET.fromstring(svg)  # noqa: S314
+    _clean(root)
+    duplicates = _dedup_defs(root)
+
+    names = {}
+    index = 0
+    for element in root.iter():
+        ident = element.attrib.get("id", None)
+        if ident is not None:
+            names[ident] = f"{prefix}{_short_name(index)}"
+            element.attrib["id"] = names[ident]
+            index += 1
+    for duplicate, kept in duplicates.items():
+        names[duplicate] = names[kept]
+
+    for element in root.iter():
+        for name, value in list(element.attrib.items()):
+            local = _local(name)
+            if local == "href":
+                if value.startswith("#"):
+                    value = _rename(value, names)
+                elif relink is not None and not re.match(r"^[a-zA-Z]+:", value):
+                    value = relink(value)
+            elif "url(" in value:
+                value = _rename(value, names)
+            if local in _GEOMETRY:
+                value = _round(value, precision)
+            element.attrib[name] = value
+    _strip_namespaces(root)
+    return ET.tostring(root, encoding="unicode")
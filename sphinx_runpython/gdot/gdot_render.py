@@ -0,0 +1,541 @@
+"""
+Renders :epkg:`DOT` graphs with :epkg:`Graphviz` and keeps the images
+in a cache on disk reused by the next builds. All graphs are rendered
+in parallel once the documents are read.
+"""
+
+import hashlib
+import os
+import re
+import subprocess
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+from sphinx.ext.graphviz import GraphvizError
+from sphinx.util import logging
+from ..runpython.run_cache import RunPythonCache, get_cache
+
+logger = logging.getLogger(__name__)
+
+_DOT_VERSIONS = {}
+_DOT_VERSIONS_LOCK = threading.Lock()
+
+
+def graphviz_version(graphviz_dot: str) -> str:
+    """
+    Returns the version printed by ``dot -V``, an empty string
+    if the executable cannot be run. The result is kept in memory.
+    """
+    with _DOT_VERSIONS_LOCK:
+        if graphviz_dot in _DOT_VERSIONS:
+            return _DOT_VERSIONS[graphviz_dot]
+    try:
+        proc = subprocess.run(
+            [graphviz_dot, "-V"], capture_output=True, check=False, timeout=30
+        )
+        version = (proc.stderr or proc.stdout).decode("utf-8", errors="ignore")
+    except (OSError, subprocess.TimeoutExpired):
+        version = ""
+    version = version.strip()
+    with _DOT_VERSIONS_LOCK:
+        _DOT_VERSIONS[graphviz_dot] = version
+    return version
+
+
+def render_cache_key(
+    code: str, format: str, version: str, args: List[str], folder: str = ""
+) -> str:
+    """
+    Computes the key of a rendered graph in the cache.
+
+    :param code: DOT code
+    :param format: ``"svg"`` or ``"png"``
+    :param version: see :func:`graphviz_version`
+    :param args: ``graphviz_dot_args``
+    :param folder: folder of the document, relative paths
+        in the graph depend on it
+    :return: hexadecimal digest
+    """
+    h = hashlib.sha256()
+    for value in [code, format, version, repr(list(args)), folder]:
+        h.update(value.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def get_render_cache(config, srcdir: str) -> Optional[RunPythonCache]:
+    """
+    Returns the cache defined by ``gdot_cache_dir`` (relative to the source
+    folder), None if it is disabled.
+    """
+    folder = getattr(config, "gdot_cache_dir", None)
+    if not folder:
+        return None
+    if not os.path.isabs(folder):
+        folder = os.path.join(srcdir, folder)
+    return get_cache(folder, max_size=config.gdot_cache_size)
+
+
+def _read(name: str, mode: str = "rb") -> Any:
+    with open(name, mode, **({} if "b" in mode else {"encoding": "utf-8"})) as f:
+        return f.read()
+
+
+def _write(name: str, data: Any):
+    os.makedirs(os.path.dirname(name), exist_ok=True)
+    if isinstance(data, str):
+        with open(name, "w", encoding="utf-8") as f:
+            f.write(data)
+    else:
+        with open(name, "wb") as f:
+            f.write(data)
+
+
+def image_name(
+    code: str,
+    options: Dict[str, Any],
+    graphviz_dot: str,
+    dot_args: List[str],
+    format: str,
+    prefix: str = "gdot",
+) -> str:
+    """
+    Returns the name of the image :func:`sphinx.ext.graphviz.render_dot`
+    creates for a graph.
+    """
+    hashkey = "".join((code, str(options), str(graphviz_dot), str(dot_args))).encode()
+    return f"{prefix}-{hashlib.sha1(hashkey).hexdigest()}.{format}"  # noqa: S324
+
+
+def restore_image(cache: RunPythonCache, key: str, outfn: str) -> bool:
+    """
+    Copies an image and its map from the cache into the output folder.
+
+    :return: True if the image was found
+    """
+    entry = cache.get(key)
+    if entry is None:
+        return False
+    _write(outfn, entry["image"])
+    if entry.get("map", None) is not None:
+        _write(f"{outfn}.map", entry["map"])
+    return True
+
+
+def store_image(cache: RunPythonCache, key: str, outfn: str):
+    """
+    Stores an image and its map (if any) in the cache.
+    """
+    if not os.path.isfile(outfn):
+        return
+    mapfn = f"{outfn}.map"
+    cache.set(
+        key,
+        dict(
+            image=_read(outfn),
+            map=_read(mapfn, "r") if os.path.isfile(mapfn) else None,
+        ),
+    )
+
+
+class GraphvizTimeoutError(GraphvizError):
+    """
+    Raised when :epkg:`Graphviz` takes longer than ``gdot_render_timeout``.
+    """
+
+
+_COMMENT = re.compile(r"/\*.*?\*/|//[^\n]*|^#[^\n]*", re.S | re.M)
+_STRING = re.compile(r'"(?:[^"\\]|\\.)*"')
+_ATTRIBUTES = re.compile(r"\[[^\]]*\]")
+_EDGE = re.compile(r"--|->")
+_LAYOUT = re.compile(r"\blayout\s*=")
+_KEYWORDS = {"digraph", "edge", "graph", "node", "strict", "subgraph"}
+# cheaper layout with the default engine: straight edges, fewer iterations
+# for the network simplex and the crossing minimization
+SIMPLIFY_ARGS = ("-Gsplines=line", "-Gnslimit=2", "-Gnslimit1=2", "-Gmclimit=0.5")
+
+
+def graph_size(code: str) -> Tuple[int, int]:
+    """
+    Counts the nodes and the edges of a graph. The parser is approximate
+    but fast enough to decide which layout engine to use.
+
+    :param code: DOT code
+    :return: number of nodes, number of edges
+    """
+    strings = {}
+
+    def _replace(match):
+        return strings.setdefault(match.group(0), f"S{len(strings)}")
+
+    text = _ATTRIBUTES.sub(" ", _STRING.sub(_replace, _COMMENT.sub(" ", code)))
+    names = set()
+    edges = 0
+    for statement in re.split(r"[;{}\n]", text):
+        statement = statement.strip()
+        words = statement.split()
+        if not words or words[0].lower() in _KEYWORDS - {"edge", "node"}:
+            continue
+        parts = _EDGE.split(statement)
+        if len(parts) == 1 and "=" in statement:
+            continue
+        edges += len(parts) - 1
+        for part in parts:
+            for name in re.split(r"[\s,]+", part):
+                if name and name.lower() not in _KEYWORDS:
+                    names.add(name.split(":")[0])
+    return len(names), edges
+
+
+def choose_engine(
+    nodes: int, edges: int, rules: List[Tuple[int, int, str]]
+) -> Optional[str]:
+    """
+    Chooses the layout engine for a graph.
+
+    :param nodes: number of nodes
+    :param edges: number of edges
+    :param rules: ``gdot_layout_engines``, a list of tuples
+        *(nodes, edges, engine)*, the first rule whose number of nodes
+        or number of edges is reached gives the engine,
+        ``"simplify"`` keeps the default engine with a cheaper layout
+        (see :func:`layout_args`)
+    :return: engine or None to keep the default one
+    """
+    for min_nodes, min_edges, engine in rules or []:
+        if nodes >= min_nodes or edges >= min_edges:
+            return engine
+    return None
+
+
+def layout_args(engine: Optional[str]) -> Tuple[str, ...]:
+    """
+    Returns the arguments given to :epkg:`Graphviz` for an engine
+    returned by :func:`choose_engine`. ``"simplify"`` draws straight edges
+    and limits the iterations of the layout (:data:`SIMPLIFY_ARGS`),
+    the attributes defined in the graph take precedence.
+
+    :param engine: engine or None
+    :return: arguments
+    """
+    if engine is None:
+        return ()
+    if engine == "simplify":
+        return SIMPLIFY_ARGS
+    return (f"-K{engine}",)
+
+
+def run_dot(
+    graphviz_dot: str,
+    dot_args: List[str],
+    code: str,
+    format: str,
+    outfn: str,
+    cwd: Optional[str] = None,
+    timeout: Optional[float] = None,
+):
+    """
+    Runs :epkg:`Graphviz` to render a graph, the map is rendered as well
+    for format png.
+
+    :param graphviz_dot: executable
+    :param dot_args: additional arguments
+    :param code: DOT code
+    :param format: ``"svg"`` or ``"png"``
+    :param outfn: output file
+    :param cwd: working directory, relative paths in the graph depend on it
+    :param timeout: the process is killed after this delay in seconds
+        and :class:`subprocess.TimeoutExpired` is raised
+    """
+    os.makedirs(os.path.dirname(outfn), exist_ok=True)
+    args = [graphviz_dot, *dot_args, f"-T{format}", f"-o{outfn}"]
+    if format == "png":
+        args.extend(["-Tcmapx", f"-o{outfn}.map"])
+    try:
+        subprocess.run(
+            args,
+            input=code.encode(),
+            capture_output=True,
+            cwd=cwd,
+            check=True,
+            timeout=timeout or None,
+        )
+    except subprocess.CalledProcessError as e:
+        raise GraphvizError(
+            f"dot exited with error:\n[stderr]\n{e.stderr!r}\n[stdout]\n{e.stdout!r}"
+        ) from e
+    if not os.path.isfile(outfn):
+        raise GraphvizError(f"dot did not produce an output file {outfn!r}.")
+
+
+def fix_svg_links(outfn: str, docname: str, outdir: str, imagedir: str):
+    """
+    Same as :func:`sphinx.ext.graphviz.fix_svg_relative_paths`
+    without any translator, relative links are written relative to
+    the image folder instead of the document.
+    """
+    tree = ET.parse(outfn)  # noqa: S314
+    ns = {"svg": "http://www.w3.org/2000/svg", "xlink": "http://www.w3.org/1999/xlink"}
+    href_name = "{http://www.w3.org/1999/xlink}href"
+    doc_dir = os.path.dirname(os.path.abspath(os.path.join(outdir, docname)))
+    img_dir = os.path.abspath(os.path.join(outdir, imagedir))
+    modified = False
+    for element in [
+        *tree.getroot().findall(".//svg:image[@xlink:href]", ns),
+        *tree.getroot().findall(".//svg:a[@xlink:href]", ns),
+    ]:
+        scheme, hostname, rel_uri, query, fragment = urlsplit(element.attrib[href_name])
+        if hostname:
+            continue
+        new_path = os.path.relpath(os.path.join(doc_dir, rel_uri), start=img_dir)
+        element.set(
+            href_name, urlunsplit((scheme, hostname, new_path, query, fragment))
+        )
+        modified = True
+    if modified:
+        tree.write(outfn)
+
+
+def graph_job(
+    builder,
+    code: str,
+    options: Dict[str, Any],
+    format: str,
+    prefix: str = "gdot",
+    filename: Optional[str] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Gathers everything needed to render a graph
+    with :func:`render_graph`.
+
+    :param builder: sphinx builder
+    :param code: DOT code
+    :param options: options, it contains the docname
+    :param format: ``"svg"`` or ``"png"``
+    :param prefix: prefix of the image name
+    :param filename: see :func:`sphinx.ext.graphviz.render_dot`
+    :return: a dictionary or None if ``graphviz_dot`` is empty
+    """
+    config = builder.config
+    graphviz_dot = options.get("graphviz_dot", config.graphviz_dot)
+    if not graphviz_dot:
+        return None
+    outdir = str(builder.outdir)
+    srcdir = str(builder.srcdir)
+    docname = options.get("docname", "index")
+    nodes, edges = graph_size(code)
+    engine = (
+        None
+        if _LAYOUT.search(code)
+        else choose_engine(nodes, edges, config.gdot_layout_engines)
+    )
+    # not converted into a list, the image name depends on its string representation
+    dot_args = config.graphviz_dot_args
+    if engine is not None:
+        dot_args = (*dot_args, *layout_args(engine))
+    fname = image_name(code, options, graphviz_dot, dot_args, format, prefix)
+    cache = get_render_cache(config, srcdir)
+    return dict(
+        code=code,
+        format=format,
+        graphviz_dot=graphviz_dot,
+        dot_args=dot_args,
+        fname=fname,
+        outfn=os.path.join(outdir, builder.imagedir, fname),
+        cwd=os.path.dirname(os.path.join(srcdir, filename or docname)),
+        docname=docname,
+        outdir=outdir,
+        imagedir=builder.imagedir,
+        nodes=nodes,
+        edges=edges,
+        engine=engine,
+        timeout=config.gdot_render_timeout,
+        cache=cache,
+        key=(
+            None
+            if cache is None
+            else render_cache_key(
+                code,
+                format,
+                graphviz_version(graphviz_dot),
+                dot_args,
+                os.path.dirname(filename or docname),
+            )
+        ),
+    )
+
+
+def render_graph(job: Dict[str, Any]) -> Tuple[str, Optional[str], float]:
+    """
+    Renders a graph described by :func:`graph_job` unless the image
+    already exists or is found in the cache.
+
+    :param job: see :func:`graph_job`
+    :return: origin of the image (*exists*, *cache*, *dot*, *timeout*,
+        *missing* if :epkg:`Graphviz` cannot be run, *error*),
+        error message, rendering time
+    """
+    outfn = job["outfn"]
+    if os.path.isfile(outfn):
+        return "exists", None, 0.0
+    cache = job["cache"]
+    if cache is not None and restore_image(cache, job["key"], outfn):
+        return "cache", None, 0.0
+    begin = time.perf_counter()
+    try:
+        run_dot(
+            job["graphviz_dot"],
+            job["dot_args"],
+            job["code"],
+            job["format"],
+            outfn,
+            cwd=job["cwd"],
+            timeout=job["timeout"],
+        )
+        if job["format"] == "svg":
+            fix_svg_links(outfn, job["docname"], job["outdir"], job["imagedir"])
+    except (OSError, GraphvizError, subprocess.TimeoutExpired) as e:
+        for name in [outfn, f"{outfn}.map"]:
+            if os.path.exists(name):
+                os.remove(name)
+        duration = time.perf_counter() - begin
+        if isinstance(e, subprocess.TimeoutExpired):
+            message = (
+                f"rendering a graph with {job['nodes']} nodes and "
+                f"{job['edges']} edges in {job['docname']!r} took more than "
+                f"{job['timeout']} seconds"
+            )
+            return "timeout", message, duration
+        if isinstance(e, OSError):
+            return "missing", str(e), duration
+        return "error", str(e), duration
+    duration = time.perf_counter() - begin
+    logger.info(
+        "[gdot] %s: graph rendered in %1.3fs (%d nodes, %d edges, engine %s)",
+        job["docname"],
+        duration,
+        job["nodes"],
+        job["edges"],
+        job["engine"] or "default",
+    )
+    if cache is not None:
+        store_image(cache, job["key"], outfn)
+    return "dot", None, duration
+
+
+def cached_render_dot(
+    self,
+    code: str,
+    options: Dict[str, Any],
+    format: str,
+    prefix: str = "gdot",
+    filename: Optional[str] = None,
+) -> Tuple[Optional[Path], Optional[Path]]:
+    """
+    Same as :func:`sphinx.ext.graphviz.render_dot` but the image
+    (and the clickable map for png) is taken from the cache defined
+    by ``gdot_cache_dir`` if it was rendered before, by this build or
+    a previous one. The key depends on the DOT code, the format,
+    the version of :epkg:`Graphviz`, ``graphviz_dot_args`` and
+    the folder of the document. The layout engine depends on the size
+    of the graph (``gdot_layout_engines``) and :epkg:`Graphviz`
+    is stopped after ``gdot_render_timeout`` seconds.
+
+    :param self: html translator
+    :param code: DOT code
+    :param options: options, it contains the docname
+    :param format: ``"svg"`` or ``"png"``
+    :param prefix: prefix of the image name
+    :param filename: see :func:`sphinx.ext.graphviz.render_dot`
+    :return: relative file name, output file name
+    :raises GraphvizTimeoutError: if the rendering takes too long,
+        a warning is logged and the caller displays a placeholder
+    """
+    builder = self.builder
+    job = graph_job(builder, code, options, format, prefix, filename)
+    if job is None:
+        raise GraphvizError(
+            f"graphviz_dot executable path must be set! "
+            f"{builder.config.graphviz_dot!r}"
+        )
+    outfn = job["outfn"]
+    relfn = f"{builder.imgpath}/{job['fname']}"
+    timeouts = getattr(builder, "_gdot_timeouts", {})
+    if outfn in timeouts:
+        logger.warning("[gdot] %s, a placeholder is displayed", timeouts[outfn])
+        raise GraphvizTimeoutError(timeouts[outfn])
+    warned = getattr(builder, "_graphviz_warned_dot", {})
+    if not os.path.isfile(outfn) and warned.get(job["graphviz_dot"], False):
+        return None, None
+
+    origin, error, _ = render_graph(job)
+    if origin == "timeout":
+        _record_timeout(builder, outfn, error)
+        logger.warning("[gdot] %s, a placeholder is displayed", error)
+        raise GraphvizTimeoutError(error)
+    if origin == "missing":
+        logger.warning(
+            "[gdot] dot command %r cannot be run (needed for graphviz output), "
+            "check the graphviz_dot setting",
+            job["graphviz_dot"],
+        )
+        if not hasattr(builder, "_graphviz_warned_dot"):
+            builder._graphviz_warned_dot = {}
+        builder._graphviz_warned_dot[job["graphviz_dot"]] = True
+        return None, None
+    if origin == "error":
+        raise GraphvizError(error)
+    return Path(relfn), Path(outfn)
+
+
+def _record_timeout(builder, outfn: str, message: str):
+    if not hasattr(builder, "_gdot_timeouts"):
+        builder._gdot_timeouts = {}
+    builder._gdot_timeouts[outfn] = message
+
+
+def render_graphs(app, graphs: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Renders all graphs collected while reading the documents
+    before the writer needs them. :epkg:`Graphviz` runs in
+    ``gdot_render_workers`` processes at the same time.
+    The writer finds the images already rendered.
+
+    :param app: sphinx application
+    :param graphs: list of dictionaries with keys *code*, *options*,
+        *format*
+    :return: number of images per origin, see :func:`render_graph`
+    """
+    builder = app.builder
+    counts = dict(exists=0, cache=0, dot=0, timeout=0, missing=0, error=0)
+    jobs = {}
+    for graph in graphs:
+        job = graph_job(builder, graph["code"], graph["options"], graph["format"])
+        if job is None or job["outfn"] in jobs:
+            continue
+        if os.path.isfile(job["outfn"]):
+            counts["exists"] += 1
+            continue
+        jobs[job["outfn"]] = job
+    if not jobs:
+        return counts
+
+    # every thread waits for a dot process, graphviz runs in parallel
+    with ThreadPoolExecutor(
+        max_workers=app.config.gdot_render_workers or os.cpu_count() or 1
+    ) as executor:
+        for job, (origin, error, _) in zip(
+            jobs.values(), executor.map(render_graph, jobs.values())
+        ):
+            counts[origin] += 1
+            if origin == "timeout":
+                # the writer displays a placeholder without running dot again
+                _record_timeout(builder, job["outfn"], error)
+            elif error:
+                # the writer renders the graph again and reports the error
+                logger.debug("[gdot] batch rendering failed due to %s", error)
+    return counts
@@ -1,6 +1,8 @@
 import hashlib
 import os
 import logging
+import posixpath
+import xml.etree.ElementTree as ET
 from docutils import nodes
 from docutils.parsers.rst import directives, Directive
 from typing import Any
@@ -8,14 +10,15 @@ import sphinx
 from sphinx.ext.graphviz import (
     latex_visit_graphviz,
     text_visit_graphviz,
-    render_dot,
     GraphvizError,
     ClickableMapDefinition,
     __,
 )
 from ..ext_helper import get_env_state_info
 from ..ext_io_helper import download_requirejs, get_url_content_timeout
+from ..ext_svg_helper import minify_svg
 from ..runpython.sphinx_runpython_extension import run_python_script
+from .gdot_render import GraphvizTimeoutError, cached_render_dot, render_graphs
 
 logger = logging.getLogger("gdot")
 
@@ -38,6 +41,7 @@ class GDotDirective(Directive):
     * *script*: boolean or a string to indicate than the standard output
         should only be considered after this substring
     * *url*: url to :epkg:`viz.js`, only if format *SVG* is selected
+      and ``gdot_vizjs`` is True, ``local`` for ``_static/viz.js``
     * *process*: run the script in an another process
 
     Example::
@@ -121,22 +125,15 @@ class GDotDirective(Directive):
             format = self.options["format"]
         else:
             format = "svg"
-        url = self.options.get("url", "local")
+        # "local" means _static/viz.js, it is resolved for every page
+        url = self.options.get("url", GDotDirective._default_url)
         bool_set_ = (True, 1, "True", "1", "true", "")
         process = "process" in self.options and self.options["process"] in bool_set_
-        if url == "local":
-            url = GDotDirective._default_url
 
         info = get_env_state_info(self)
         docname = info["docname"]
-        if url == "local":
-            if docname is None or "HERE" not in info:
-                url = GDotDirective._default_url
-                logger.warning("[gdot] docname is none, falling back to %r.", url)
-            else:
-                spl = docname.split("/")
-                sp = [".."] * (len(spl) - 1) + ["_static", "viz.js"]
-                url = "/".join(sp)
+        env = info.get("env")
+        vizjs = env is not None and env.config.gdot_vizjs
 
         if "script" in self.options:
             script = self.options["script"]
@@ -155,7 +152,6 @@ class GDotDirective(Directive):
         # executes script if any
         content = "\n".join(self.content)
         if script or script == "":
-            env = info.get("env")
             doc_prefix = docname.split("/")[-1] if docname else ""
             cache_key = (
                 f"{doc_prefix}:"
@@ -210,7 +206,7 @@ class GDotDirective(Directive):
             code=content,
             url=url,
             options={"docname": docname},
-            use_sphinx_graphviz=True,
+            use_sphinx_graphviz=format.lower() == "png" or not vizjs,
         )
         return [node]
 
@@ -258,6 +254,35 @@ def _emit_dummy_output(self, format: str = "svg"):
     raise nodes.SkipNode
 
 
+def _inline_svg(self, outfn) -> str | None:
+    """
+    Returns the minified svg to insert into the page if ``gdot_svg_embed``
+    is ``"inline"`` and the image is small enough, None otherwise.
+    """
+    config = self.builder.config
+    if config.gdot_svg_embed != "inline" or outfn is None:
+        return None
+    with open(outfn, encoding="utf-8") as f:
+        content = f.read()
+    # identifiers must be unique in the page
+    if not hasattr(self, "_gdot_svg_count"):
+        self._gdot_svg_count = 0
+    self._gdot_svg_count += 1
+    imgpath = self.builder.imgpath
+    try:
+        svg = minify_svg(
+            content,
+            prefix=f"gdot{self._gdot_svg_count}_",
+            relink=lambda href: posixpath.normpath(posixpath.join(imgpath, href)),
+        )
+    except ET.ParseError as e:
+        logger.warning("[gdot] unable to parse %r due to %s", str(outfn), e)
+        return None
+    if len(svg.encode("utf-8")) > config.gdot_svg_inline_limit:
+        return None
+    return svg
+
+
 def render_dot_html(
     self,
     node: gdot_node,
@@ -275,7 +300,13 @@ def render_dot_html(
     if format not in {"png", "svg"}:
         logger.warning(__("format must be either 'png' or 'svg', but is %r"), format)
     try:
-        fname, outfn = render_dot(self, code, options, format, prefix, filename)
+        fname, outfn = cached_render_dot(self, code, options, format, prefix, filename)
+    except GraphvizTimeoutError as exc:
+        # cached_render_dot logs the warning
+        self.body.append('<div class="graphviz gdot-timeout">')
+        self.body.append(f'<p class="warning">{self.encode(str(exc))}</p>')
+        self.body.append("</div>\n")
+        raise nodes.SkipNode from exc
     except GraphvizError as exc:
         logger.warning(__("dot code %r: %s"), code, exc)
         raise nodes.SkipNode from exc
@@ -292,7 +323,10 @@ def render_dot_html(
         if "align" in node:
             align = node["align"]
             self.body.append(f'<div align="{align}" class="align-{align}">')
-        if format == "svg":
+        svg = _inline_svg(self, outfn) if format == "svg" else None
+        if svg is not None:
+            self.body.append(f'<div class="graphviz {imgcls}">{svg}</div>\n')
+        elif format == "svg":
             self.body.append('<div class="graphviz">')
             self.body.append(
                 f'<object data="{src}" type="image/svg+xml" class="{imgcls}">\n'
@@ -331,65 +365,21 @@ def visit_gdot_node_html_svg(self, node):
         )
         return
 
-    def process(text):
-        text = text.replace("\\", "\\\\")
-        text = text.replace("\n", "\\n")
-        text = text.replace('"', '\\"')
-        return text
-
-    nid = str(id(node))
-
-    content = """
-    <div id="gdot-{0}-cont"><div id="gdot-{0}" style="width:100%;height:100%;"></div>
-    """.format(nid)
-
-    script = (
-        """
-    require(['__URL__'], function() { var svgGraph = Viz("__DOT__");
-    document.getElementById('gdot-__ID__').innerHTML = svgGraph; });
-    """.replace("__ID__", nid)
-        .replace("__DOT__", process(node["code"]))
-        .replace("__URL__", node["url"])
-    )
-
-    # find the path
-    source = self.document.attributes["source"]
-    folder = os.path.dirname(source)
-    # from_ = self.builder.get_target_uri(source)
-    # req = self.builder.get_target_uri("_static/require.js")
-    # rel = self.builder.get_relative_uri(from_, req)
-
-    if os.path.exists(folder):
-        while not os.path.exists(os.path.join(folder, "conf.py")):
-            cts = set(os.listdir(folder))
-            if "conf.py" in cts:
-                break
-            exts = {os.path.splitext(name)[-1] for name in cts}
-            if ".rst" not in exts:
-                folder = None
-                break
-            folder = os.path.split(folder)[0]
-    else:
-        folder = None
-
-    self.body.append(content)
-    if folder is None:
+    # identical graphs share the same source and are rendered once
+    code = node["code"]
+    key = hashlib.sha1(code.encode("utf-8")).hexdigest()[:16]  # noqa: S324
+    if not hasattr(self, "_gdot_vizjs"):
+        self._gdot_vizjs = set()
+    if key not in self._gdot_vizjs:
+        self._gdot_vizjs.add(key)
+        # the graph must not close the script tag
+        escaped = code.replace("</", "<\\/")
         self.body.append(
-            '<script src="_static/require.js"></script><script>'
-            "{0}{1}{0}</script>{0}".format("\n", script)
-        )
-    else:
-        current = os.path.dirname(source)
-        rel = os.path.relpath(current, folder)
-        if rel not in {"", "."}:
-            rel = rel.replace("\\", "/")
-            rel = f"{'/'.join(['..'] * len(rel.split('/')))}/"
-        else:
-            rel = ""
-        self.body.append(
-            '<script src="{2}_static/require.js"></script><script>'
-            "{0}{1}{0}</script>{0}".format("\n", script, rel)
+            f'<script type="text/vnd.graphviz" id="gdot-src-{key}">'
+            f"{escaped}</script>\n"
         )
+    self.body.append(f'<div class="gdot-vizjs" data-gdot="{key}"></div>\n')
+    raise nodes.SkipNode
 
 
 def depart_gdot_node_html_svg(self, node):
@@ -406,11 +396,14 @@ def visit_gdot_node_html(self, node):
     and the :epkg:`SVG` format.
     """
     if node["format"].lower() == "png":
-        if os.environ.get("UNITTEST_GOING", "0") == "1":
-            _emit_dummy_output(self, format="png")
-        from sphinx.ext.graphviz import html_visit_graphviz
-
-        return html_visit_graphviz(self, node)
+        return render_dot_html(
+            self,
+            node,
+            node["code"],
+            node["options"],
+            filename=node.get("filename"),
+            format="png",
+        )
     if node["format"].lower() in ("?", "svg"):
         return visit_gdot_node_html_svg(self, node)
     raise RuntimeError(f"Unexpected format for graphviz '{node['format']}'.")
@@ -425,7 +418,155 @@ def depart_gdot_node_html(self, node):
     return depart_gdot_node_html_svg(self, node)
 
 
+def collect_gdot_graphs(app, doctree):
+    """
+    Collects the graphs of a document, they are rendered by
+    :func:`render_gdot_graphs` once all documents are read.
+    """
+    env = app.builder.env
+    if not hasattr(env, "gdot_graphs"):
+        env.gdot_graphs = {}
+    graphs = []
+    for node in doctree.findall(gdot_node):
+        format = node["format"].lower()
+        if not node["use_sphinx_graphviz"] or format not in ("?", "png", "svg"):
+            continue
+        graphs.append(
+            dict(
+                code=node["code"],
+                options=node["options"],
+                format="svg" if format == "?" else format,
+                docname=env.docname,
+            )
+        )
+    if graphs:
+        env.gdot_graphs[env.docname] = graphs
+    else:
+        env.gdot_graphs.pop(env.docname, None)
+
+
+def purge_gdot_graphs(app, env, docname):
+    """
+    Removes the graphs of a document.
+    """
+    if hasattr(env, "gdot_graphs"):
+        env.gdot_graphs.pop(docname, None)
+
+
+def merge_gdot_graphs(app, env, docnames, other):
+    """
+    Merges the graphs collected by parallel readers.
+    """
+    if not hasattr(other, "gdot_graphs"):
+        return
+    if not hasattr(env, "gdot_graphs"):
+        env.gdot_graphs = {}
+    env.gdot_graphs.update(other.gdot_graphs)
+
+
+def render_gdot_graphs(app, env):
+    """
+    Renders every graph in parallel before the writer starts,
+    see :func:`render_graphs <sphinx_runpython.gdot.gdot_render.render_graphs>`.
+    """
+    if (
+        app.builder.format != "html"
+        or os.environ.get("UNITTEST_GOING", "0") == "1"
+        or not getattr(env, "gdot_graphs", None)
+    ):
+        return
+    graphs = [
+        g for docname in sorted(env.gdot_graphs) for g in env.gdot_graphs[docname]
+    ]
+    counts = render_graphs(app, graphs)
+    logger.info(
+        "[gdot] %d graphs, %d rendered, %d from cache, %d already rendered, "
+        "%d timeouts",
+        len(graphs),
+        counts["dot"],
+        counts["cache"],
+        counts["exists"],
+        counts["timeout"],
+    )
+
+
+_VIZJS_LOADER = r"""
+(function () {
+  var url = "__URL__";
+  var svgs = {};
+  var viz = null;
+  var waiting = [];
+  function withViz(callback) {
+    if (viz !== null) { callback(viz); return; }
+    waiting.push(callback);
+    if (waiting.length > 1) { return; }
+    var ready = function (v) {
+      viz = v || window.Viz;
+      waiting.forEach(function (cb) { cb(viz); });
+      waiting = [];
+    };
+    if (typeof window.Viz === "function") {
+      ready(window.Viz);
+    } else if (typeof define === "function" && define.amd && typeof require === "function") {
+      require([url], ready);
+    } else {
+      var script = document.createElement("script");
+      script.src = url;
+      script.onload = function () { ready(window.Viz); };
+      document.head.appendChild(script);
+    }
+  }
+  function render(div) {
+    var key = div.getAttribute("data-gdot");
+    withViz(function (Viz) {
+      if (!(key in svgs)) {
+        var src = document.getElementById("gdot-src-" + key).textContent;
+        svgs[key] = Viz(src.replace(/<\\\//g, "</"));
+      }
+      div.innerHTML = svgs[key];
+    });
+  }
+  document.addEventListener("DOMContentLoaded", function () {
+    var divs = document.querySelectorAll("div.gdot-vizjs");
+    if (!("IntersectionObserver" in window)) { divs.forEach(render); return; }
+    var observer = new IntersectionObserver(function (entries) {
+      entries.forEach(function (entry) {
+        if (entry.isIntersecting) {
+          observer.unobserve(entry.target);
+          render(entry.target);
+        }
+      });
+    }, {rootMargin: "200px"});
+    divs.forEach(function (div) { observer.observe(div); });
+  });
+})();
+"""
+
+
+def add_vizjs_loader(app, pagename, templatename, context, doctree):
+    """
+    Adds one script to every page containing graphs rendered by :epkg:`viz.js`.
+    It loads :epkg:`viz.js` once and renders every graph when it
+    becomes visible.
+    """
+    if doctree is None or app.builder.format != "html":
+        return
+    urls = [
+        node["url"]
+        for node in doctree.findall(gdot_node)
+        if not node["use_sphinx_graphviz"]
+    ]
+    if not urls:
+        return
+    url = urls[0]
+    if url == "local":
+        url = context["pathto"]("_static/viz.js", 1)
+    app.add_js_file(None, body=_VIZJS_LOADER.replace("__URL__", url))
+
+
 def copy_js_files(app):
+    if not app.config.gdot_vizjs:
+        return
     dest = app.config.html_static_path
     if isinstance(dest, list) and len(dest) > 0:
         dest = dest[0]
@@ -492,13 +633,53 @@ def copy_js_files(app):
 def setup(app):
     """
     setup for ``gdot`` (sphinx)
+
+    The extension adds the following configuration values:
+
+    * ``gdot_cache_dir``: folder (relative to the source folder) storing
+      the rendered images from one build to the next one, the images
+      are rendered again only if the graph, the format, the version
+      of :epkg:`Graphviz` or ``graphviz_dot_args`` change,
+      None to disable it
+    * ``gdot_cache_size``: maximum size in bytes of the cache
+    * ``gdot_render_workers``: number of graphs rendered at the same time
+      once all documents are read, None for the number of cores
+    * ``gdot_layout_engines``: list of tuples *(nodes, edges, engine)*,
+      the first rule whose number of nodes or edges is reached by a graph
+      chooses its layout engine (``-K<engine>``), ``"simplify"`` keeps
+      the default engine with straight edges and fewer layout iterations,
+      default is ``[(2000, 5000, "sfdp")]``, a graph defining attribute
+      ``layout`` keeps it
+    * ``gdot_vizjs``: svg graphs are rendered by :epkg:`viz.js` in the browser
+      instead of :epkg:`Graphviz`, every page loads it once and renders
+      a graph when it becomes visible
+    * ``gdot_svg_embed``: ``"object"`` to insert svg images with
+      ``<object data=...>``, ``"inline"`` to insert the minified svg
+      into the page
+    * ``gdot_svg_inline_limit``: an svg image bigger than this limit in bytes
+      (once minified) is still inserted with ``<object>``
+    * ``gdot_render_timeout``: :epkg:`Graphviz` is stopped after this delay
+      in seconds and a placeholder is displayed instead of the graph
     """
     if "sphinx.ext.graphviz" not in app.config.extensions:
         from sphinx.ext.graphviz import setup as setup_g  # pylint: disable=W0611
 
         setup_g(app)
 
+    app.add_config_value("gdot_cache_dir", None, "env")
+    app.add_config_value("gdot_cache_size", 2**28, "env")
+    app.add_config_value("gdot_render_workers", None, "env")
+    app.add_config_value("gdot_layout_engines", [(2000, 5000, "sfdp")], "env")
+    app.add_config_value("gdot_render_timeout", 300, "env")
+    app.add_config_value("gdot_vizjs", False, "env")
+    app.add_config_value("gdot_svg_embed", "object", "env")
+    app.add_config_value("gdot_svg_inline_limit", 2**15, "env")
     app.connect("builder-inited", copy_js_files)
+    app.connect("doctree-read", collect_gdot_graphs)
+    app.connect("env-purge-doc", purge_gdot_graphs)
+    app.connect("env-merge-info", merge_gdot_graphs)
+    app.connect("env-updated", render_gdot_graphs)
+    app.connect("html-page-context", add_vizjs_loader)
 
     app.add_node(
         gdot_node,
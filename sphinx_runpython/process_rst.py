@@ -108,6 +108,8 @@ def _rst2html_sphinx(
             else:
                 f.write(f"\nextensions = {_dummy_extensions + new_extensions}\n")
             f.write(f"\nepkg_dictionary = {_dummy_epkg_dictionary}\n")
+            for k, v in kwargs.items():
+                f.write(f"\n{k} = {v!r}\n")
         fout = os.path.join(folder, "output")
 
         rep = " -v" * report_level
@@ -0,0 +1,32 @@
+"""
+Program started by :func:`run_cmd <sphinx_runpython.runpython.run_cmd.run_cmd>`
+when a command must run with a memory limit. It limits its own address
+space and replaces itself with the command which inherits the limit.
+A ``preexec_fn`` would do the same but it is not safe when other threads
+start processes at the same time. It only depends on the standard library.
+
+::
+
+    python _exec_limit.py <maxmem> <command> <arg1> <arg2> ...
+"""
+
+import os
+import resource
+import sys
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    maxmem, cmd = int(argv[0]), argv[1:]
+    hard = resource.getrlimit(resource.RLIMIT_AS)[1]
+    if hard == resource.RLIM_INFINITY or hard >= maxmem:
+        resource.setrlimit(resource.RLIMIT_AS, (maxmem, hard))
+    try:
+        os.execvp(cmd[0], cmd)
+    except OSError as e:
+        sys.stderr.write(f"{cmd[0]}: {e}\n")
+        sys.exit(127)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""
+Worker program started by :class:`RunPythonPool
+<sphinx_runpython.runpython.run_pool.RunPythonPool>`.
+It only depends on the standard library because it must start as fast
+as possible and must not import anything the executed scripts do not expect.
+
+The worker reads one job per line (json) from a private copy of the standard
+input and writes one answer per line (json) on a private copy of the standard
+output. The executed scripts see a standard input connected to ``os.devnull``
+and their outputs (python or C level) are captured through temporary files.
+Anything else written on the standard output (a preloaded module printing
+something for example) goes to the standard error of the worker.
+In fork mode, the worker only imports the preloaded modules and every job
+runs in a child process forked from the worker. A job with a memory limit
+always runs in a forked process.
+"""
+
+import builtins
+import importlib.machinery
+import json
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+_OPENED = None
+_SESSIONS = {}
+_PRELOADED = []
+
+
+def _audit_hook(event, args):
+    if _OPENED is None or event != "open":
+        return
+    path, mode, flags = args
+    if mode is None:
+        # os.open
+        read = isinstance(flags, int) and (flags & 3) == os.O_RDONLY
+    else:
+        read = "r" in mode
+    if read and isinstance(path, (str, bytes)):
+        _OPENED.add(os.fsdecode(path))
+
+
+class JobTimeout(BaseException):
+    """
+    Raised in a script running longer than the timeout of its job.
+    It derives from *BaseException* to go through ``except Exception``.
+    """
+
+
+def _on_alarm(signum, frame):
+    raise JobTimeout()
+
+
+def _read(channel):
+    line = channel.readline()
+    if not line:
+        return None
+    return json.loads(line.decode("utf-8"))
+
+
+def _write(channel, obj):
+    channel.write(json.dumps(obj).encode("utf-8") + b"\n")
+    channel.flush()
+
+
+def preload_modules(names):
+    """
+    Imports modules before any job is received.
+
+    :param names: list of module names
+    :return: dictionary ``{name: duration or error message}``
+    """
+    res = {}
+    for name in names:
+        begin = time.perf_counter()
+        try:
+            __import__(name)
+        except Exception as e:
+            res[name] = f"{type(e).__name__}: {e}"
+            continue
+        res[name] = time.perf_counter() - begin
+    return res
+
+
+def check_preloaded(path):
+    """
+    Checks the preloaded modules are the ones a new interpreter
+    would import with this *sys.path*.
+
+    :param path: list of paths
+    :return: list of modules found elsewhere
+    """
+    mismatches = []
+    for name in _PRELOADED:
+        top = name.split(".")[0]
+        mod = sys.modules.get(top, None)
+        origin = getattr(mod, "__file__", None)
+        if origin is None:
+            continue
+        spec = importlib.machinery.PathFinder.find_spec(top, path)
+        found = None if spec is None else spec.origin
+        if found is None or os.path.abspath(found) != os.path.abspath(origin):
+            mismatches.append(f"{top}: {origin!r} != {found!r}")
+    return mismatches
+
+
+def _execute(script, filename, glob=None):
+    if glob is None:
+        glob = {"__name__": "__main__", "__builtins__": builtins}
+    if filename != "<stdin>":
+        glob["__file__"] = filename
+    try:
+        code = compile(script, filename, "exec")
+        exec(code, glob)
+    except SystemExit as e:
+        if e.code not in (None, 0) and not isinstance(e.code, int):
+            print(e.code, file=sys.stderr)
+    except BaseException as e:
+        # skips the frame of this function
+        tb = e.__traceback__.tb_next if e.__traceback__ is not None else None
+        traceback.print_exception(type(e), e, tb)
+        return e
+    return None
+
+
+def run_job(job, child=False):
+    """
+    Runs one job and restores the interpreter state
+    the job may have modified (path, cwd, attributes added to *sys*).
+
+    :param job: dictionary with keys *script*, *filename*, *cwd*,
+        *track* (records the files the script opens or imports),
+        *session* (the script runs in the namespace of this session,
+        the namespace is kept for the next scripts of the same session),
+        *timeout* (seconds, the script is interrupted after that),
+        *maxmem* (bytes, maximum size of the address space while the script runs),
+        *env* (environment variables while the script runs),
+        *path* (*sys.path* while the script runs, the job is rejected if
+        a preloaded module would be imported from another location)
+    :param child: True if the job runs in a forked process,
+        the memory limit is only applied in that case
+    :return: dictionary with keys *out*, *err*, *duration*, *cpu*,
+        *maxrss* (peak resident memory of the interpreter in bytes),
+        *files* if *track* is True, *reason* (``"timeout"``, ``"memory"``)
+        if the script was interrupted, ``"mismatch"`` if it was rejected
+    """
+    global _OPENED
+
+    if job.get("path", None) is not None:
+        mismatches = check_preloaded(job["path"])
+        if mismatches:
+            return {
+                "out": "",
+                "err": "The preloaded modules do not match the job: "
+                + ", ".join(mismatches),
+                "duration": 0,
+                "reason": "mismatch",
+            }
+
+    script = job["script"]
+    filename = job.get("filename", None) or "<stdin>"
+    cwd = job.get("cwd", None)
+
+    saved_path = list(sys.path)
+    saved_argv = list(sys.argv)
+    saved_sys = set(sys.__dict__)
+    saved_cwd = os.getcwd()
+    saved_environ = None
+    if job.get("env", None) is not None:
+        saved_environ = dict(os.environ)
+        os.environ.clear()
+        os.environ.update(job["env"])
+    if job.get("path", None) is not None:
+        sys.path[:] = job["path"]
+    track = job.get("track", False)
+    if track:
+        saved_modules = set(sys.modules)
+        _OPENED = set()
+
+    timeout = job.get("timeout", None)
+    maxmem = job.get("maxmem", None)
+    reason = None
+
+    with tempfile.TemporaryFile() as fout, tempfile.TemporaryFile() as ferr:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        save_out, save_err = os.dup(1), os.dup(2)
+        os.dup2(fout.fileno(), 1)
+        os.dup2(ferr.fileno(), 2)
+        begin = time.perf_counter()
+        begin_cpu = time.process_time()
+        if child:
+            _set_memory_limit(maxmem)
+        if timeout and hasattr(signal, "setitimer"):
+            saved_handler = signal.signal(signal.SIGALRM, _on_alarm)
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            if cwd:
+                os.chdir(cwd)
+            sys.argv[:] = [filename if filename != "<stdin>" else "-"]
+            session = job.get("session", None)
+            exc = _execute(
+                script,
+                filename,
+                (
+                    None
+                    if session is None
+                    else _SESSIONS.setdefault(
+                        session, {"__name__": "__main__", "__builtins__": builtins}
+                    )
+                ),
+            )
+            if isinstance(exc, JobTimeout):
+                reason = "timeout"
+            elif isinstance(exc, MemoryError):
+                reason = "memory"
+        except JobTimeout:
+            # the alarm went off after the script ended
+            pass
+        finally:
+            if timeout and hasattr(signal, "setitimer"):
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, saved_handler)
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            except Exception:
+                pass
+            duration = time.perf_counter() - begin
+            cpu = time.process_time() - begin_cpu
+            opened, _OPENED = _OPENED, None
+            os.dup2(save_out, 1)
+            os.dup2(save_err, 2)
+            os.close(save_out)
+            os.close(save_err)
+            os.chdir(saved_cwd)
+            if saved_environ is not None:
+                os.environ.clear()
+                os.environ.update(saved_environ)
+            sys.path[:] = saved_path
+            sys.argv[:] = saved_argv
+            for k in set(sys.__dict__) - saved_sys:
+                del sys.__dict__[k]
+
+        fout.seek(0)
+        ferr.seek(0)
+        out = fout.read().decode("utf-8", errors="ignore")
+        err = ferr.read().decode("utf-8", errors="ignore")
+    if resource is None:
+        maxrss = None
+    else:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != "darwin":
+            maxrss *= 1024
+    res = {"out": out, "err": err, "duration": duration, "cpu": cpu, "maxrss": maxrss}
+    if reason is not None:
+        res["reason"] = reason
+    if track:
+        for name in set(sys.modules) - saved_modules:
+            filename = getattr(sys.modules[name], "__file__", None)
+            if filename:
+                opened.add(filename)
+        res["files"] = sorted(opened)
+    return res
+
+
+def _set_memory_limit(maxmem):
+    # only called in a forked process, the limit is never removed
+    if not maxmem or resource is None or not hasattr(resource, "RLIMIT_AS"):
+        return
+    hard = resource.getrlimit(resource.RLIMIT_AS)[1]
+    if hard == resource.RLIM_INFINITY or hard >= maxmem:
+        resource.setrlimit(resource.RLIMIT_AS, (maxmem, hard))
+
+
+def can_fork():
+    """
+    Tells if the worker can safely fork itself. It cannot on Windows,
+    it should not on macOS (system frameworks do not survive a fork)
+    or if a preloaded module started threads.
+    """
+    if not hasattr(os, "fork") or sys.platform == "darwin":
+        return False
+    return threading.active_count() == 1
+
+
+def run_job_in_child(job):
+    """
+    Runs one job in a forked process, the worker state is never modified.
+
+    :param job: see :func:`run_job`
+    :return: see :func:`run_job`
+    """
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        try:
+            res = run_job(job, child=True)
+        except BaseException as e:
+            res = {"out": "", "err": f"{type(e).__name__}: {e}", "duration": 0}
+        with os.fdopen(w, "wb") as f:
+            f.write(json.dumps(res).encode("utf-8"))
+        os._exit(0)
+    os.close(w)
+    with os.fdopen(r, "rb") as f:
+        data = f.read()
+    _, status = os.waitpid(pid, 0)
+    if not data:
+        return {
+            "out": "",
+            "err": f"The forked process {pid} ended with status {status}.",
+            "duration": 0,
+        }
+    return json.loads(data.decode("utf-8"))
+
+
+def main():
+    """
+    Entry point of the worker.
+    """
+    channel_in = os.fdopen(os.dup(0), "rb")
+    channel_out = os.fdopen(os.dup(1), "wb")
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    # a preloaded module printing something must not write into the channel
+    os.dup2(2, 1)
+
+    config = _read(channel_in)
+    if config is None:
+        return
+    sys.addaudithook(_audit_hook)
+    _PRELOADED.extend(config.get("preload", None) or [])
+    preloaded = preload_modules(_PRELOADED)
+    fork = config.get("fork", False) and can_fork()
+    _write(
+        channel_out,
+        {"ready": True, "pid": os.getpid(), "preload": preloaded, "fork": fork},
+    )
+
+    while True:
+        job = _read(channel_in)
+        if job is None or job.get("stop", False):
+            break
+        # a memory limit only applies to a forked process,
+        # the worker itself is never limited
+        in_child = fork or (
+            job.get("maxmem", None) and job.get("session", None) is None and can_fork()
+        )
+        _write(channel_out, run_job_in_child(job) if in_child else run_job(job))
+
+
+if __name__ == "__main__":
+    main()
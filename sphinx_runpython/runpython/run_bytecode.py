@@ -0,0 +1,111 @@
+import collections
+import hashlib
+import importlib.util
+import linecache
+import marshal
+import sys
+import threading
+from types import CodeType
+from typing import Optional
+
+_CODE_CACHE = collections.OrderedDict()
+_CODE_LOCK = threading.Lock()
+MAX_CODES = 256
+_SOURCES = collections.OrderedDict()
+_SOURCES_LOCK = threading.Lock()
+MAX_SOURCES = 256
+
+
+def script_filename(script: str, prefix: str = "runpython") -> str:
+    """
+    Returns a filename for a script which does not exist on disk,
+    it depends on the script content so that the same script always
+    gets the same name.
+
+    :param script: script
+    :param prefix: prefix, usually the location of the script
+    :return: filename such as ``<runpython-6e1f2a9b0c4d>``
+    """
+    h = hashlib.sha256(script.encode("utf-8")).hexdigest()[:12]
+    return f"<{prefix}-{h}>"
+
+
+def register_source(script: str, filename: str):
+    """
+    Registers the source of a script in :mod:`linecache`
+    so that tracebacks and :mod:`inspect` can display it.
+    The entry has no modification time, :func:`linecache.checkcache`
+    does not remove it. Only the last :data:`MAX_SOURCES` registered scripts
+    are kept, the oldest entries are removed from :mod:`linecache`.
+    """
+    lines = [line + "\n" for line in script.split("\n")]
+    entry = (len(script), None, lines, filename)
+    with _SOURCES_LOCK:
+        linecache.cache[filename] = entry
+        _SOURCES[filename] = entry
+        _SOURCES.move_to_end(filename)
+        while len(_SOURCES) > MAX_SOURCES:
+            name, old = _SOURCES.popitem(last=False)
+            if linecache.cache.get(name, None) is old:
+                del linecache.cache[name]
+
+
+def compile_script(script: str, filename: str, cache=None) -> CodeType:
+    """
+    Compiles a script and keeps the code object in memory and
+    in *cache* (serialized with :mod:`marshal`) to skip
+    the compilation the next time the same script is executed.
+    Only the last :data:`MAX_CODES` code objects are kept in memory.
+    The source is registered in :mod:`linecache` (see :func:`register_source`).
+
+    :param script: script
+    :param filename: filename given to :func:`compile`
+    :param cache: a :class:`RunPythonCache
+        <sphinx_runpython.runpython.run_cache.RunPythonCache>` or None
+    :return: code object
+    """
+    register_source(script, filename)
+    key = hashlib.sha256(
+        b"\x00".join(
+            [
+                script.encode("utf-8"),
+                filename.encode("utf-8"),
+                sys.version.encode("utf-8"),
+                importlib.util.MAGIC_NUMBER,
+            ]
+        )
+    ).hexdigest()
+    with _CODE_LOCK:
+        code = _CODE_CACHE.get(key, None)
+        if code is not None:
+            _CODE_CACHE.move_to_end(key)
+            return code
+    if cache is not None:
+        data = cache.get(key)
+        if data is not None:
+            code = _loads(data)
+            if code is not None:
+                _remember_code(key, code)
+                return code
+
+    code = compile(script, filename, "exec")
+    _remember_code(key, code)
+    if cache is not None:
+        cache.set(key, marshal.dumps(code))
+    return code
+
+
+def _remember_code(key: str, code: CodeType):
+    with _CODE_LOCK:
+        _CODE_CACHE[key] = code
+        _CODE_CACHE.move_to_end(key)
+        while len(_CODE_CACHE) > MAX_CODES:
+            _CODE_CACHE.popitem(last=False)
+
+
+def _loads(data: bytes) -> Optional[CodeType]:
+    try:
+        code = marshal.loads(data)
+    except (EOFError, ValueError, TypeError):
+        return None
+    return code if isinstance(code, CodeType) else None
@@ -0,0 +1,192 @@
+import contextlib
+import glob
+import hashlib
+import os
+import pickle
+import sys
+import threading
+from typing import Any, Dict, List, Optional
+
+
+def runpython_cache_key(
+    script: str, options: Optional[Dict[str, Any]] = None, fingerprint: str = ""
+) -> str:
+    """
+    Computes the key used to store the outputs of a script in
+    :class:`RunPythonCache`.
+
+    :param script: script to run
+    :param options: options modifying the execution
+    :param fingerprint: any string summarizing what the script depends on,
+        see :func:`dependencies_fingerprint`
+    :return: hexadecimal digest
+    """
+    h = hashlib.sha256()
+    h.update(script.encode("utf-8"))
+    h.update(b"\x00")
+    h.update(repr(sorted((options or {}).items())).encode("utf-8"))
+    h.update(b"\x00")
+    h.update(sys.version.encode("utf-8"))
+    h.update(b"\x00")
+    h.update(fingerprint.encode("utf-8"))
+    return h.hexdigest()
+
+
+def dependencies_fingerprint(patterns: List[str], root: Optional[str] = None) -> str:
+    """
+    Hashes the content of every file matching one pattern.
+
+    :param patterns: list of glob patterns (``**`` is allowed)
+    :param root: relative patterns are relative to this folder
+    :return: hexadecimal digest, empty if *patterns* is empty
+    """
+    if not patterns:
+        return ""
+    h = hashlib.sha256()
+    for pattern in patterns:
+        if root is not None and not os.path.isabs(pattern):
+            pattern = os.path.join(root, pattern)
+        for name in sorted(glob.glob(pattern, recursive=True)):
+            if not os.path.isfile(name):
+                continue
+            h.update(name.encode("utf-8"))
+            with open(name, "rb") as f:
+                h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+class RunPythonCache:
+    """
+    Stores the outputs of scripts on disk.
+    Every entry is a pickled file named after its key.
+    The least recently used entries are removed when the total size
+    of the cache exceeds *max_size* bytes.
+
+    :param folder: cache location, created if it does not exist
+    :param max_size: maximum size in bytes
+    """
+
+    def __init__(self, folder: str, max_size: int = 2**28):
+        self.folder = folder
+        self.max_size = max_size
+        self._size = None
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def _filename(self, key: str) -> str:
+        return os.path.join(self.folder, key[:2], key + ".pkl")
+
+    def _entries(self):
+        for sub in os.scandir(self.folder):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith(".pkl"):
+                    yield entry
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._filename(key))
+
+    def get(self, key: str) -> Any:
+        """
+        Returns the value stored for *key* or None if there is none.
+        An entry which cannot be unpickled (truncated file, class
+        removed or renamed since it was stored) is removed.
+        """
+        name = self._filename(key)
+        try:
+            with open(name, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            self._remove(name)
+            return None
+        with contextlib.suppress(OSError):
+            # updates the access time for the eviction
+            os.utime(name)
+        return value
+
+    def remove(self, key: str):
+        """
+        Removes the entry stored for *key* if there is one.
+        """
+        self._remove(self._filename(key))
+
+    def _remove(self, name: str):
+        try:
+            size = os.stat(name).st_size
+            os.remove(name)
+        except OSError:
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size -= size
+
+    def set(self, key: str, value: Any) -> bool:
+        """
+        Stores a value.
+
+        :param key: key
+        :param value: value, it must be picklable
+        :return: False if the value cannot be pickled
+        """
+        try:
+            data = pickle.dumps(value)
+        except Exception:
+            return False
+        name = self._filename(key)
+        os.makedirs(os.path.dirname(name), exist_ok=True)
+        tmp = f"{name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, name)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(e.stat().st_size for e in self._entries())
+            else:
+                self._size += len(data)
+            if self._size > self.max_size:
+                self._evict()
+        return True
+
+    def _evict(self):
+        entries = []
+        for e in self._entries():
+            stat = e.stat()
+            entries.append((stat.st_mtime, stat.st_size, e.path))
+        entries.sort()
+        total = sum(e[1] for e in entries)
+        target = self.max_size * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._size = total
+
+    def clear(self):
+        """
+        Removes every entry.
+        """
+        with self._lock:
+            for entry in list(self._entries()):
+                os.remove(entry.path)
+            self._size = 0
+
+
+_CACHES = {}
+
+
+def get_cache(folder: str, max_size: int = 2**28) -> RunPythonCache:
+    """
+    Returns the instance of :class:`RunPythonCache` for a folder.
+    """
+    key = os.path.abspath(folder)
+    if key not in _CACHES:
+        _CACHES[key] = RunPythonCache(key, max_size=max_size)
+    _CACHES[key].max_size = max_size
+    return _CACHES[key]
@@ -0,0 +1,120 @@
+import collections
+import io
+from typing import Optional
+
+
+def _nbytes(s: str) -> int:
+    # lone surrogates are counted as they would be written by surrogatepass
+    return len(s.encode("utf-8", errors="surrogatepass"))
+
+
+class BoundedCapture(io.TextIOBase):
+    """
+    Text stream capturing the outputs of a script with a bounded memory.
+    Up to *limit* characters are kept in memory. Beyond that,
+    the stream only keeps the first and the last ``limit // 2`` characters,
+    the characters in between are lost.
+
+    :param limit: maximum number of characters kept in memory,
+        None for no limit
+
+    ::
+
+        from contextlib import redirect_stdout
+
+        sout = BoundedCapture(2**20)
+        with redirect_stdout(sout):
+            for i in range(10**6):
+                print(i)
+        print(sout.getvalue())
+        print(sout.truncated_bytes)
+        sout.close()
+    """
+
+    def __init__(self, limit: Optional[int] = None):
+        super().__init__()
+        if limit is not None and limit <= 0:
+            raise ValueError(f"limit={limit} must be strictly positive.")
+        self.limit = limit
+        self._truncated = False
+        self._head = io.StringIO()
+        self._tail = collections.deque()
+        self._tail_size = 0
+        self._bytes = 0
+        self._head_bytes = 0
+
+    def writable(self) -> bool:
+        return True
+
+    @property
+    def truncated(self) -> bool:
+        "Tells if the output exceeded the limit."
+        return self._truncated
+
+    @property
+    def truncated_bytes(self) -> int:
+        "Number of bytes (utf-8) which are not kept in memory."
+        if not self._truncated:
+            return 0
+        tail = "".join(self._tail)
+        return self._bytes - self._head_bytes - _nbytes(tail)
+
+    def write(self, s: str) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed stream.")
+        if not isinstance(s, str):
+            raise TypeError(f"write() argument must be str, not {type(s)}")
+        if self.limit is None:
+            return self._head.write(s)
+        self._bytes += _nbytes(s)
+        if not self._truncated:
+            if self._head.tell() + len(s) <= self.limit:
+                self._head.write(s)
+                return len(s)
+            self._truncate()
+        n = len(s)
+        room = self.limit // 2 - self._head.tell()
+        if room > 0:
+            part = s[:room]
+            self._head.write(part)
+            self._head_bytes += _nbytes(part)
+            s = s[room:]
+        if s:
+            self._tail.append(s)
+            self._tail_size += len(s)
+            self._shrink_tail()
+        return n
+
+    def _truncate(self):
+        value = self._head.getvalue()
+        half = self.limit // 2
+        self._truncated = True
+        self._head = io.StringIO(value[:half])
+        self._head.seek(0, io.SEEK_END)
+        self._head_bytes = _nbytes(value[:half])
+        self._tail = collections.deque([value[half:]])
+        self._tail_size = len(self._tail[0])
+        self._shrink_tail()
+
+    def _shrink_tail(self):
+        half = self.limit - self.limit // 2
+        while self._tail and self._tail_size - len(self._tail[0]) >= half:
+            self._tail_size -= len(self._tail.popleft())
+        if self._tail_size > half:
+            extra = self._tail_size - half
+            self._tail[0] = self._tail[0][extra:]
+            self._tail_size = half
+
+    def getvalue(self) -> str:
+        """
+        Returns the captured output. If it was truncated,
+        the first and the last characters are separated by a line telling
+        how many bytes were removed.
+        """
+        if not self._truncated:
+            return self._head.getvalue()
+        return (
+            f"{self._head.getvalue()}\n"
+            f"[... {self.truncated_bytes} bytes truncated ...]\n"
+            f"{''.join(self._tail)}"
+        )
@@ -0,0 +1,102 @@
+"""
+Snapshots of the context shared by scripts chained with options
+``:store:`` and ``:restore:``. A block is only executed again if itself
+or one of the previous blocks of the chain was modified.
+"""
+
+import hashlib
+import importlib
+import pickle
+import types
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class _ModuleReference:
+    # a module is pickled by name, unpickling it imports the module
+    def __init__(self, name: str):
+        self.name = name
+
+    def __reduce__(self):
+        return importlib.import_module, (self.name,)
+
+
+def _dumps(value: Any) -> bytes:
+    if isinstance(value, types.ModuleType):
+        return pickle.dumps(_ModuleReference(value.__name__))
+    try:
+        import cloudpickle
+    except ImportError:
+        return pickle.dumps(value)
+    return cloudpickle.dumps(value)
+
+
+def snapshot_context(
+    context: Optional[Dict[str, Any]], max_size: Optional[int] = None
+) -> Tuple[Dict[str, bytes], List[str]]:
+    """
+    Pickles every value of a context, with :epkg:`cloudpickle` if it is
+    installed. Modules are pickled by name. Values which cannot be pickled
+    are skipped, so are the biggest ones if the total size exceeds *max_size*.
+
+    :param context: context returned by :func:`run_python_script
+        <sphinx_runpython.runpython.sphinx_runpython_extension.run_python_script>`
+    :param max_size: maximum size of the snapshot in bytes, None for no limit
+    :return: snapshot ``{name: bytes}``, list of skipped names
+    """
+    snapshot, skipped = {}, []
+    for name, value in (context or {}).items():
+        try:
+            snapshot[name] = _dumps(value)
+        except Exception:
+            skipped.append(name)
+    if max_size is not None:
+        total = sum(len(v) for v in snapshot.values())
+        for name in sorted(snapshot, key=lambda n: -len(snapshot[n])):
+            if total <= max_size:
+                break
+            total -= len(snapshot.pop(name))
+            skipped.append(name)
+    return snapshot, sorted(skipped)
+
+
+def restore_context(snapshot: Dict[str, bytes]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Unpickles a snapshot built by :func:`snapshot_context`.
+
+    :param snapshot: snapshot
+    :return: context, list of the names which could not be restored
+    """
+    context, failed = {}, []
+    for name, data in snapshot.items():
+        try:
+            context[name] = pickle.loads(data)
+        except Exception:
+            failed.append(name)
+    return context, sorted(failed)
+
+
+def chain_block_key(previous: str, block_key: str) -> str:
+    """
+    Returns the key of a block in a chain, it depends on the key
+    of the previous block and the key of this one, and so on every
+    block since the beginning of the chain.
+
+    :param previous: key of the previous block, empty for the first one
+    :param block_key: see :func:`runpython_block_key
+        <sphinx_runpython.runpython.sphinx_runpython_extension.runpython_block_key>`
+    :return: hexadecimal digest
+    """
+    h = hashlib.sha256()
+    h.update(previous.encode("utf-8"))
+    h.update(b"\x00")
+    h.update(block_key.encode("utf-8"))
+    return h.hexdigest()
+
+
+def purge_chains(app, env, docname):
+    """
+    Forgets the chain of the document read again.
+    """
+    chain = getattr(env, "runpython_chain", None)
+    if chain is not None and chain["docname"] == docname:
+        env.runpython_chain = None
@@ -1,11 +1,26 @@
 import sys
 import os
+import signal
 import time
 import subprocess
 import threading
 import warnings
 import re
 import queue
+import selectors
+import codecs
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from .run_capture import BoundedCapture
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+
+_GROUP_KILL = hasattr(os, "killpg")
 
 
 class RunCmdException(Exception):
@@ -109,6 +124,11 @@ def skip_run_cmd(
     timeout_listen=None,
     tell_if_no_output=None,
     prefix_log=None,
+    cwd=None,
+    retention="full",
+    retention_limit=2**20,
+    output_file=None,
+    on_output=None,
 ):
     """
     Has the same signature as :func:`run_cmd` but does nothing.
@@ -133,6 +153,13 @@ def run_cmd(
     logf=None,
     tell_if_no_output=None,
     prefix_log=None,
+    cwd=None,
+    retention="full",
+    retention_limit=2**20,
+    output_file=None,
+    on_output=None,
+    maxmem=None,
+    stats=None,
 ):
     """
     Runs a command line and wait for the result.
@@ -167,6 +194,22 @@ def run_cmd(
     :param tell_if_no_output: tells if there is no output every
         *tell_if_no_output* seconds
     :param prefix_log: add a prefix to a line before printing it
+    :param cwd: current directory of the command, unlike *change_path*,
+        the current directory of this process is not modified
+    :param retention: what is kept of the outputs if *communicate* is True,
+        ``"full"`` keeps everything, ``"headtail"`` keeps the first and the last
+        *retention_limit* characters, ``"file"`` does the same
+        and writes the whole standard output in *output_file*
+    :param retention_limit: see *retention*
+    :param output_file: see *retention*
+    :param on_output: if not None and *communicate* is True, this function
+        is called every time the command writes something,
+        signature ``on_output(name, text)`` where *name* is ``"out"`` or ``"err"``
+    :param maxmem: maximum size of the address space of the command in bytes,
+        the command is started by a small program which sets the limit
+        and replaces itself with the command, ignored on Windows
+    :param stats: if not None and *wait* is True, the dictionary receives
+        the return code of the command (key *returncode*)
     :return: content of stdout, stdres  (only if wait is True)
 
     ::
@@ -202,6 +245,13 @@ def run_cmd(
         cmdl = cmd
     else:
         cmdl = split_cmp_command(cmd) if preprocess else cmd
+    if maxmem:
+        cmdl, shell = _limit_memory(cmdl, shell, maxmem)
+    # the command runs in its own process group if it may be killed,
+    # the processes it started are killed with it
+    new_session = (
+        _GROUP_KILL and wait and (timeout is not None or bool(stop_running_if))
+    )
 
     if catch_exit:
         try:
@@ -211,6 +261,8 @@ def run_cmd(
                 stdin=subprocess.PIPE if sin is not None and len(sin) > 0 else None,
                 stdout=subprocess.PIPE if wait else None,
                 stderr=subprocess.PIPE if wait else None,
+                cwd=cwd,
+                start_new_session=new_session,
             )
         except SystemExit as e:
             if change_path is not None:
@@ -224,6 +276,8 @@ def run_cmd(
             stdin=subprocess.PIPE if sin is not None and len(sin) > 0 else None,
             stdout=subprocess.PIPE if wait else None,
             stderr=subprocess.PIPE if wait else None,
+            cwd=cwd,
+            start_new_session=new_session,
         )
 
     pproc.__enter__()
@@ -252,20 +306,37 @@ def run_cmd(
                 if logf is not None:
                     logf(prefix_log + "[run_cmd] input", [input])
 
-            if catch_exit:
+            if retention != "full" or on_output is not None:
+                # the outputs are decoded while they are produced
                 try:
-                    stdoutdata, stderrdata = pproc.communicate(
-                        input=input, timeout=timeout
+                    out, err = _communicate_stream(
+                        pproc,
+                        input,
+                        timeout,
+                        encoding=encoding,
+                        encerror=encerror,
+                        retention=retention,
+                        retention_limit=retention_limit,
+                        output_file=output_file,
+                        on_output=on_output,
+                    )
+                except SystemExit as e:
+                    if change_path is not None:
+                        os.chdir(current)
+                    raise RunCmdException("SystemExit raised (2)") from e
+            elif catch_exit:
+                try:
+                    out, err = _communicate_kill(
+                        pproc, input, timeout, encoding, encerror, cmd
                     )
                 except SystemExit as e:
                     if change_path is not None:
                         os.chdir(current)
                     raise RunCmdException("SystemExit raised (2)") from e
             else:
-                stdoutdata, stderrdata = pproc.communicate(input=input, timeout=timeout)
-
-            out = decode_outerr(stdoutdata, encoding, encerror, cmd)
-            err = decode_outerr(stderrdata, encoding, encerror, cmd)
+                out, err = _communicate_kill(
+                    pproc, input, timeout, encoding, encerror, cmd
+                )
         else:
             # communicate is False: use of threads
             if sin is not None and len(sin) > 0:
@@ -278,66 +349,31 @@ def run_cmd(
                 )
             stdout, stderr = pproc.stdout, pproc.stderr
 
-            begin = time.perf_counter()
-            last_update = begin
-            # with threads
-            stdoutReader, stdoutQueue = _AsyncLineReader.getForFd(
-                stdout, catch_exit=catch_exit
-            )
-            stderrReader, stderrQueue = _AsyncLineReader.getForFd(
-                stderr, catch_exit=catch_exit
+            if sys.platform.startswith("win"):
+                read_outputs = _read_outputs_threads
+            else:
+                read_outputs = _read_outputs_selector
+            runloop, stdoutReader, stderrReader = read_outputs(
+                stdout,
+                stderr,
+                out,
+                err,
+                cmd=cmd,
+                encoding=encoding,
+                encerror=encerror,
+                stop_running_if=stop_running_if,
+                timeout=timeout,
+                logf=logf,
+                tell_if_no_output=tell_if_no_output,
+                prefix_log=prefix_log,
+                catch_exit=catch_exit,
             )
-            runloop = True
-
-            while (not stdoutReader.eof() or not stderrReader.eof()) and runloop:
-                while not stdoutQueue.empty():
-                    line = stdoutQueue.get()
-                    decol = decode_outerr(line, encoding, encerror, cmd)
-                    sdecol = decol.strip("\n\r")
-                    if logf is not None:
-                        logf(prefix_log + sdecol)
-                    out.append(sdecol)
-                    last_update = time.perf_counter()
-                    if stop_running_if is not None and stop_running_if(decol, None):
-                        runloop = False
-                        break
-
-                while not stderrQueue.empty():
-                    line = stderrQueue.get()
-                    decol = decode_outerr(line, encoding, encerror, cmd)
-                    sdecol = decol.strip("\n\r")
-                    if logf is not None:
-                        logf(prefix_log + sdecol)
-                    err.append(sdecol)
-                    last_update = time.perf_counter()
-                    if stop_running_if is not None and stop_running_if(None, decol):
-                        runloop = False
-                        break
-                time.sleep(0.05)
-
-                delta = time.perf_counter() - last_update
-                if tell_if_no_output is not None and delta >= tell_if_no_output:
-                    logf(
-                        prefix_log + "[run_cmd] No update in %5.1f seconds for cmd: %s",
-                        last_update - begin,
-                        cmd,
-                    )
-                    last_update = time.perf_counter()
-                full_delta = time.perf_counter() - begin
-                if timeout is not None and full_delta > timeout:
-                    runloop = False
-                    logf(
-                        prefix_log
-                        + "[run_cmd] Timeout after %5.1f seconds for cmd: %s",
-                        full_delta,
-                        cmd,
-                    )
-                    break
 
             if runloop:
-                # Waiting for async readers to finish...
-                stdoutReader.join()
-                stderrReader.join()
+                if stdoutReader is not None:
+                    # Waiting for async readers to finish...
+                    stdoutReader.join()
+                    stderrReader.join()
 
                 # Waiting for process to exit...
                 returnCode = pproc.wait()
@@ -380,7 +416,7 @@ def run_cmd(
                     prefix_log
                     + "[run_cmd] killing process because stop_running_if returned True."
                 )
-                pproc.kill()
+                _kill(pproc)
                 err_read = True
                 logf(prefix_log + "[run_cmd] process killed.")
                 skip_out_err = True
@@ -417,6 +453,8 @@ def run_cmd(
             os.chdir(current)
 
         pproc.__exit__(None, None, None)
+        if stats is not None:
+            stats["returncode"] = pproc.returncode
         if sys.platform.startswith("win"):
             if err is not None:
                 err = err.strip("\n\r\t ")
@@ -432,6 +470,458 @@ def run_cmd(
         return pproc, None
 
 
+def _limit_memory(cmdl, shell, maxmem):
+    # the command is started by a small program which limits
+    # the address space and replaces itself with the command
+    if resource is None or not hasattr(resource, "RLIMIT_AS"):
+        return cmdl, shell
+    if isinstance(cmdl, str):
+        cmdl = ["/bin/sh", "-c", cmdl] if shell else [cmdl]
+    elif shell:
+        cmdl = ["/bin/sh", "-c", *cmdl]
+    shim = os.path.join(os.path.dirname(__file__), "_exec_limit.py")
+    return [sys.executable, "-I", shim, str(maxmem), *cmdl], False
+
+
+def _kill(proc):
+    # kills a command, the whole process group if the command leads one,
+    # a process started by the command may still hold the pipes
+    if _GROUP_KILL:
+        try:
+            if os.getpgid(proc.pid) == proc.pid:
+                os.killpg(proc.pid, signal.SIGKILL)
+                return
+        except OSError:
+            pass
+    proc.kill()
+
+
+def _process_line(line, out, cmd, encoding, encerror, logf, prefix_log):
+    decol = decode_outerr(line, encoding, encerror, cmd)
+    sdecol = decol.strip("\n\r")
+    if logf is not None:
+        logf(prefix_log + sdecol)
+    out.append(sdecol)
+    return decol
+
+
+def _check_waiting(
+    begin, last_update, cmd, timeout, logf, tell_if_no_output, prefix_log
+):
+    # returns (last_update, continue)
+    delta = time.perf_counter() - last_update
+    if tell_if_no_output is not None and delta >= tell_if_no_output:
+        logf(
+            prefix_log + "[run_cmd] No update in %5.1f seconds for cmd: %s",
+            last_update - begin,
+            cmd,
+        )
+        last_update = time.perf_counter()
+    full_delta = time.perf_counter() - begin
+    if timeout is not None and full_delta > timeout:
+        logf(
+            prefix_log + "[run_cmd] Timeout after %5.1f seconds for cmd: %s",
+            full_delta,
+            cmd,
+        )
+        return last_update, False
+    return last_update, True
+
+
+def _read_outputs_threads(
+    stdout,
+    stderr,
+    out,
+    err,
+    cmd=None,
+    encoding="utf8",
+    encerror="ignore",
+    stop_running_if=None,
+    timeout=None,
+    logf=None,
+    tell_if_no_output=None,
+    prefix_log="",
+    catch_exit=False,
+):
+    # one thread reads every stream, the main loop polls the queues
+    begin = time.perf_counter()
+    last_update = begin
+    stdoutReader, stdoutQueue = _AsyncLineReader.getForFd(stdout, catch_exit=catch_exit)
+    stderrReader, stderrQueue = _AsyncLineReader.getForFd(stderr, catch_exit=catch_exit)
+    runloop = True
+
+    while (not stdoutReader.eof() or not stderrReader.eof()) and runloop:
+        while not stdoutQueue.empty():
+            decol = _process_line(
+                stdoutQueue.get(), out, cmd, encoding, encerror, logf, prefix_log
+            )
+            last_update = time.perf_counter()
+            if stop_running_if is not None and stop_running_if(decol, None):
+                runloop = False
+                break
+
+        while not stderrQueue.empty():
+            decol = _process_line(
+                stderrQueue.get(), err, cmd, encoding, encerror, logf, prefix_log
+            )
+            last_update = time.perf_counter()
+            if stop_running_if is not None and stop_running_if(None, decol):
+                runloop = False
+                break
+        time.sleep(0.05)
+
+        last_update, cont = _check_waiting(
+            begin, last_update, cmd, timeout, logf, tell_if_no_output, prefix_log
+        )
+        if not cont:
+            runloop = False
+            break
+    return runloop, stdoutReader, stderrReader
+
+
+def _read_outputs_selector(
+    stdout,
+    stderr,
+    out,
+    err,
+    cmd=None,
+    encoding="utf8",
+    encerror="ignore",
+    stop_running_if=None,
+    timeout=None,
+    logf=None,
+    tell_if_no_output=None,
+    prefix_log="",
+    catch_exit=False,
+):
+    # both streams are read by the current thread as soon as data is available
+    begin = time.perf_counter()
+    last_update = begin
+    sel = selectors.DefaultSelector()
+    sel.register(stdout, selectors.EVENT_READ, (out, 0))
+    sel.register(stderr, selectors.EVENT_READ, (err, 1))
+    pending = {stdout: b"", stderr: b""}
+    runloop = True
+
+    try:
+        while sel.get_map() and runloop:
+            now = time.perf_counter()
+            waits = []
+            if tell_if_no_output is not None:
+                waits.append(last_update + tell_if_no_output - now)
+            if timeout is not None:
+                waits.append(begin + timeout - now)
+            wait = max(min(waits), 0) if waits else None
+
+            for key, _ in sel.select(wait):
+                lines, index = key.data
+                data = os.read(key.fd, 65536)
+                if data:
+                    data = pending[key.fileobj] + data
+                    chunks = data.split(b"\n")
+                    pending[key.fileobj] = chunks.pop()
+                    chunks = [c + b"\n" for c in chunks]
+                else:
+                    sel.unregister(key.fileobj)
+                    chunks = [pending[key.fileobj]] if pending[key.fileobj] else []
+                    pending[key.fileobj] = b""
+                for line in chunks:
+                    decol = _process_line(
+                        line, lines, cmd, encoding, encerror, logf, prefix_log
+                    )
+                    last_update = time.perf_counter()
+                    if stop_running_if is not None and stop_running_if(
+                        *((decol, None) if index == 0 else (None, decol))
+                    ):
+                        runloop = False
+                        break
+                if not runloop:
+                    break
+
+            if runloop:
+                last_update, runloop = _check_waiting(
+                    begin,
+                    last_update,
+                    cmd,
+                    timeout,
+                    logf,
+                    tell_if_no_output,
+                    prefix_log,
+                )
+    finally:
+        sel.close()
+    return runloop, None, None
+
+
+def _communicate_kill(proc, input, timeout, encoding, encerror, cmd):
+    # proc.communicate but the process is killed if it times out,
+    # the partial outputs are attached to the exception
+    try:
+        stdoutdata, stderrdata = proc.communicate(input=input, timeout=timeout)
+    except subprocess.TimeoutExpired as e:
+        _kill(proc)
+        stdoutdata, stderrdata = proc.communicate()
+        e.output = decode_outerr(stdoutdata or b"", encoding, encerror, cmd)
+        e.stderr = decode_outerr(stderrdata or b"", encoding, encerror, cmd)
+        raise
+    out = decode_outerr(stdoutdata, encoding, encerror, cmd)
+    err = decode_outerr(stderrdata, encoding, encerror, cmd)
+    return out, err
+
+
+class _OutputStream:
+    # decodes the output of a command while it is produced
+    def __init__(self, name, encoding, encerror, retention, limit, file, on_output):
+        # file is opened and closed by the caller
+        self.name = name
+        self.decoder = codecs.getincrementaldecoder(encoding or "ascii")(
+            errors=encerror
+        )
+        self.capture = BoundedCapture(None if retention == "full" else limit)
+        self.file = file
+        self.on_output = on_output
+        self.lock = threading.Lock()
+
+    def feed(self, data, final=False):
+        with self.lock:
+            text = self.decoder.decode(data, final)
+            if not text:
+                return
+            self.capture.write(text)
+            if self.file is not None:
+                self.file.write(text)
+            if self.on_output is not None:
+                self.on_output(self.name, text)
+
+    def close(self):
+        self.feed(b"", final=True)
+        value = self.capture.getvalue()
+        self.capture.close()
+        return value
+
+
+def _communicate_stream(
+    proc,
+    input,
+    timeout,
+    encoding="utf8",
+    encerror="ignore",
+    retention="full",
+    retention_limit=2**20,
+    output_file=None,
+    on_output=None,
+):
+    # same as proc.communicate but the outputs are decoded
+    # chunk by chunk and only what retention requires is kept
+    if retention not in ("full", "headtail", "file"):
+        raise ValueError(f"Unexpected value {retention!r} for retention.")
+    if retention == "file" and output_file is None:
+        raise ValueError("output_file must be specified if retention='file'.")
+    with contextlib.ExitStack() as stack:
+        file = (
+            stack.enter_context(open(output_file, "w", encoding="utf-8"))
+            if retention == "file"
+            else None
+        )
+        streams = {
+            proc.stdout: _OutputStream(
+                "out", encoding, encerror, retention, retention_limit, file, on_output
+            ),
+            proc.stderr: _OutputStream(
+                "err", encoding, encerror, retention, retention_limit, None, on_output
+            ),
+        }
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        try:
+            if sys.platform.startswith("win"):
+                _communicate_threads(proc, input, timeout, deadline, streams)
+            else:
+                _communicate_selector(proc, input, timeout, deadline, streams)
+        except subprocess.TimeoutExpired as e:
+            _kill(proc)
+            proc.wait()
+            e.output = streams[proc.stdout].close()
+            e.stderr = streams[proc.stderr].close()
+            raise
+        except BaseException:
+            streams[proc.stdout].close()
+            streams[proc.stderr].close()
+            raise
+        values = [streams[proc.stdout].close(), streams[proc.stderr].close()]
+    remaining = None if deadline is None else max(deadline - time.perf_counter(), 0)
+    proc.wait(timeout=remaining)
+    return values[0], values[1]
+
+
+def _communicate_selector(proc, input, timeout, deadline, streams):
+    sel = selectors.DefaultSelector()
+    view = memoryview(input or b"")
+    offset = 0
+    if proc.stdin is not None:
+        if view:
+            sel.register(proc.stdin, selectors.EVENT_WRITE)
+        else:
+            proc.stdin.close()
+    for stream in streams:
+        sel.register(stream, selectors.EVENT_READ)
+    try:
+        while sel.get_map():
+            wait = None if deadline is None else deadline - time.perf_counter()
+            if wait is not None and wait <= 0:
+                raise subprocess.TimeoutExpired(proc.args, timeout)
+            for key, _ in sel.select(wait):
+                if key.fileobj is proc.stdin:
+                    try:
+                        offset += os.write(key.fd, view[offset : offset + 65536])
+                    except BrokenPipeError:
+                        offset = len(view)
+                    if offset >= len(view):
+                        sel.unregister(proc.stdin)
+                        proc.stdin.close()
+                    continue
+                data = os.read(key.fd, 65536)
+                if data:
+                    streams[key.fileobj].feed(data)
+                else:
+                    sel.unregister(key.fileobj)
+    finally:
+        sel.close()
+
+
+def _communicate_threads(proc, input, timeout, deadline, streams):
+    def read(stream, output):
+        for data in iter(lambda: stream.read1(65536), b""):
+            output.feed(data)
+
+    threads = [
+        threading.Thread(target=read, args=(stream, output), daemon=True)
+        for stream, output in streams.items()
+    ]
+    for th in threads:
+        th.start()
+    if proc.stdin is not None:
+        try:
+            if input:
+                proc.stdin.write(input)
+        except BrokenPipeError:
+            pass
+        proc.stdin.close()
+    for th in threads:
+        th.join(None if deadline is None else max(deadline - time.perf_counter(), 0))
+        if th.is_alive():
+            raise subprocess.TimeoutExpired(proc.args, timeout)
+
+
+def _run_one_cmd(cmd, cwd, timeout, shell, encoding, encerror, preprocess):
+    if shell is None:
+        shell = sys.platform.startswith("win")
+    if sys.platform.startswith("win") or not preprocess:
+        cmdl = cmd
+    else:
+        cmdl = split_cmp_command(cmd)
+    scmd = " ".join(cmd) if isinstance(cmd, (list, tuple)) else cmd
+    res = dict(cmd=cmd, returncode=None, out="", err="", duration=0.0, exception=None)
+    begin = time.perf_counter()
+    try:
+        with subprocess.Popen(
+            cmdl,
+            shell=shell,
+            cwd=cwd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=_GROUP_KILL and timeout is not None,
+        ) as proc:
+            try:
+                stdoutdata, stderrdata = proc.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired as e:
+                _kill(proc)
+                stdoutdata, stderrdata = proc.communicate()
+                res["exception"] = RunCmdException(
+                    f"Timeout after {timeout} seconds for cmd: {scmd}"
+                )
+                res["exception"].__cause__ = e
+            res["returncode"] = proc.returncode
+    except (OSError, ValueError, subprocess.SubprocessError) as e:
+        res["duration"] = time.perf_counter() - begin
+        res["exception"] = RunCmdException(f"Unable to run cmd: {scmd}\n{e}")
+        res["exception"].__cause__ = e
+        return res
+    res["duration"] = time.perf_counter() - begin
+    res["out"] = decode_outerr(stdoutdata, encoding, encerror, scmd).replace(
+        "\r\n", "\n"
+    )
+    res["err"] = (
+        decode_outerr(stderrdata, encoding, encerror, scmd)
+        .replace("\r\n", "\n")
+        .strip("\n\r\t ")
+    )
+    if res["exception"] is None and res["returncode"] != 0:
+        res["exception"] = RunCmdException(
+            f"Command {scmd!r} failed with error code {res['returncode']}"
+            f"\nCWD:\n{cwd or os.getcwd()}\n#---OUT---#\n{res['out']}"
+            f"\n#---ERR---#\n{res['err']}"
+        )
+    return res
+
+
+def run_cmds(
+    commands,
+    max_workers=None,
+    cwd=None,
+    timeout=None,
+    shell=None,
+    encoding="utf8",
+    encerror="ignore",
+    preprocess=True,
+):
+    """
+    Runs many command lines concurrently and waits for all of them.
+
+    :param commands: list of command lines (strings or lists)
+    :param max_workers: maximum number of commands running at the same time,
+        None for the default value of :class:`concurrent.futures.ThreadPoolExecutor`
+    :param cwd: current directory of every command, it can be a list
+        with one directory per command, the current directory
+        of this process is not modified
+    :param timeout: a command running longer than *timeout* seconds is killed
+    :param shell: see :func:`run_cmd`
+    :param encoding: encoding of the outputs
+    :param encerror: how to handle encoding errors
+    :param preprocess: see :func:`run_cmd`
+    :return: list of dictionaries in the same order as *commands*
+        with keys *cmd*, *returncode* (None if the command could not start),
+        *out*, *err*, *duration* (seconds), *exception*
+        (a :class:`RunCmdException` if the command failed,
+        timed out or could not start, None otherwise)
+
+    ::
+
+        from sphinx_runpython.runpython.run_cmd import run_cmds
+
+        for res in run_cmds(["dot -V", "pandoc --version"], timeout=10):
+            print(res["cmd"], res["returncode"], res["duration"])
+    """
+    if cwd is None or isinstance(cwd, (str, os.PathLike)):
+        cwds = [cwd] * len(commands)
+    else:
+        cwds = list(cwd)
+        if len(cwds) != len(commands):
+            raise ValueError(
+                f"cwd has {len(cwds)} elements but there are {len(commands)} commands."
+            )
+    if not commands:
+        return []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                _run_one_cmd, cmd, wd, timeout, shell, encoding, encerror, preprocess
+            )
+            for cmd, wd in zip(commands, cwds)
+        ]
+        return [f.result() for f in futures]
+
+
 def parse_exception_message(exc):
     """
     Parses the message embedded in an exception and returns the
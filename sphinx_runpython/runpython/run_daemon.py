@@ -0,0 +1,294 @@
+"""
+A daemon keeping a pool of interpreters shared by every documentation
+built on the same machine, see command line ``worker``. Scripts with option
+``:process:`` are sent to the daemon through a Unix socket if
+``runpython_daemon_socket`` is defined and the daemon is running.
+Every job carries the environment variables, *sys.path* and the current
+directory of the build which sent it, the daemon rejects a job sent
+by another python installation.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from .run_cmd import RunCmdException
+from .run_pool import PoolMemoryError, RunPythonPool
+
+
+class DaemonConnectionError(RunCmdException):
+    """
+    Raised by :meth:`DaemonClient.run` when the daemon cannot be reached
+    or stops before it answers, the script did not run or its outputs are lost.
+    """
+
+
+class _DaemonHandler(socketserver.StreamRequestHandler):
+    # one connection, one job
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        res = self.server.process(json.loads(line.decode("utf-8")))
+        self.wfile.write(json.dumps(res).encode("utf-8") + b"\n")
+
+
+if hasattr(socket, "AF_UNIX"):
+
+    class _DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+        def __init__(self, path: str, pool: RunPythonPool):
+            super().__init__(path, _DaemonHandler)
+            self.pool = pool
+
+        def process(self, job: Dict) -> Dict:
+            if job.get("ping", False):
+                return dict(
+                    ready=True,
+                    pid=os.getpid(),
+                    prefix=sys.prefix,
+                    version=sys.version,
+                    size=self.pool.size,
+                    preload=self.pool.preload,
+                )
+            if (
+                job.get("prefix", None) != sys.prefix
+                or job.get("version", None) != sys.version
+            ):
+                return dict(
+                    error=f"The daemon runs python {sys.version!r} from "
+                    f"{sys.prefix!r}, the job was sent by python "
+                    f"{job.get('version', None)!r} from {job.get('prefix', None)!r}."
+                )
+            stats = {}
+            files = set() if job.get("track", False) else None
+            try:
+                out, err = self.pool.run(
+                    job["script"],
+                    filename=job.get("filename", None),
+                    cwd=job.get("cwd", None),
+                    stats=stats,
+                    files=files,
+                    timeout=job.get("timeout", None),
+                    maxmem=job.get("maxmem", None),
+                    env=job.get("env", None),
+                    path=job.get("path", None),
+                )
+            except subprocess.TimeoutExpired as e:
+                return dict(timeout=True, out=e.output or "", err=e.stderr or "")
+            except PoolMemoryError as e:
+                return dict(memory=str(e), out=e.out, err=e.err)
+            except Exception as e:
+                return dict(error=f"{type(e).__name__}: {e}")
+            return dict(
+                out=out,
+                err=err,
+                stats=stats,
+                files=None if files is None else sorted(files),
+            )
+
+
+def serve(
+    path: str,
+    size: int = 1,
+    recycle: Optional[int] = None,
+    preload: Optional[List[str]] = None,
+    fork: bool = True,
+    verbose: int = 0,
+):
+    """
+    Starts a daemon listening to a Unix socket and running the scripts
+    it receives in a pool of interpreters :class:`RunPythonPool
+    <sphinx_runpython.runpython.run_pool.RunPythonPool>`.
+    It stops on a keyboard interruption.
+
+    :param path: socket path, the file is removed when the daemon stops,
+        only the user who started the daemon can use it
+    :param size: number of interpreters
+    :param recycle: see :class:`RunPythonPool
+        <sphinx_runpython.runpython.run_pool.RunPythonPool>`,
+        it is set to 1 if the interpreters cannot fork themselves
+        so that no module imported by a build leaks into the next one
+    :param preload: modules every interpreter imports when it starts
+    :param fork: every interpreter forks itself to run a script
+    :param verbose: verbosity
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        raise NotImplementedError("Unix sockets are not available on this platform.")
+    if os.path.exists(path):
+        if ping_daemon(path) is not None:
+            raise RuntimeError(f"A daemon is already listening to {path!r}.")
+        # a daemon did not stop properly
+        os.remove(path)
+    pool = RunPythonPool(size, recycle=recycle, preload=preload, fork=fork)
+    if recycle is None and not pool.supports_fork():
+        pool.close()
+        recycle = 1
+        pool = RunPythonPool(size, recycle=recycle, preload=preload)
+    # the socket is created with permissions 0o600
+    umask = os.umask(0o177)
+    try:
+        server = _DaemonServer(path, pool)
+    except Exception:
+        pool.close()
+        raise
+    finally:
+        os.umask(umask)
+    os.chmod(path, 0o600)
+    if verbose:
+        print(
+            f"[worker] listening to {path!r} with {size} interpreters "
+            f"in mode {pool.mode!r}, recycle={recycle}"
+        )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def ping_daemon(path: str, timeout: float = 1.0) -> Optional[Dict]:
+    """
+    Checks a daemon is listening to a socket.
+
+    :param path: socket path
+    :param timeout: timeout in seconds
+    :return: daemon description (pid, prefix, version, size, preload)
+        or None if there is no daemon
+    """
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    try:
+        return _request(path, {"ping": True}, timeout=timeout)
+    except (OSError, ValueError):
+        return None
+
+
+def _request(path: str, job: Dict, timeout: Optional[float] = None) -> Dict:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(json.dumps(job).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError(f"The daemon listening to {path!r} did not answer.")
+    return json.loads(line.decode("utf-8"))
+
+
+class DaemonClient:
+    """
+    Sends scripts to the daemon started by :func:`serve`.
+    It implements the same method :meth:`run` as :class:`RunPythonPool
+    <sphinx_runpython.runpython.run_pool.RunPythonPool>` and can be given to
+    :func:`run_python_script
+    <sphinx_runpython.runpython.sphinx_runpython_extension.run_python_script>`.
+
+    :param path: socket path
+    """
+
+    mode = "daemon"
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def run(
+        self,
+        script: str,
+        filename: Optional[str] = None,
+        cwd: Optional[str] = None,
+        stats: Optional[Dict] = None,
+        files: Optional[Set[str]] = None,
+        session: Optional[str] = None,
+        timeout: Optional[float] = None,
+        maxmem: Optional[int] = None,
+    ) -> Tuple[str, str]:
+        """
+        Runs a script in one interpreter of the daemon,
+        see :meth:`RunPythonPool.run
+        <sphinx_runpython.runpython.run_pool.RunPythonPool.run>`.
+        Sessions are not supported. The script runs with the environment
+        variables, *sys.path* and the current directory of this process.
+        :class:`DaemonConnectionError` is raised if the daemon cannot be
+        reached, :func:`get_daemon_client` checks the daemon again
+        the next time it is called.
+        """
+        if session is not None:
+            raise NotImplementedError("The daemon does not support sessions.")
+        job = dict(
+            script=script,
+            filename=filename,
+            cwd=cwd or os.getcwd(),
+            prefix=sys.prefix,
+            version=sys.version,
+            env=dict(os.environ),
+            path=list(sys.path),
+        )
+        if files is not None:
+            job["track"] = True
+        if timeout:
+            job["timeout"] = timeout
+        if maxmem:
+            job["maxmem"] = maxmem
+        try:
+            res = _request(self.path, job)
+        except (OSError, ValueError) as e:
+            with _CLIENTS_LOCK:
+                _CLIENTS.pop(self.path, None)
+            raise DaemonConnectionError(
+                f"Unable to reach the daemon listening to {self.path!r} due to {e}."
+            ) from e
+        if "error" in res:
+            raise RunCmdException(res["error"])
+        if res.get("timeout", False):
+            raise subprocess.TimeoutExpired(
+                "<script>", timeout, output=res["out"], stderr=res["err"]
+            )
+        if "memory" in res:
+            raise PoolMemoryError(res["memory"], out=res["out"], err=res["err"])
+        if stats is not None:
+            stats.update(res["stats"])
+        if files is not None:
+            files.update(res["files"] or [])
+        return res["out"], res["err"]
+
+
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_daemon_client(path: str, delay: float = 5.0) -> Optional[DaemonClient]:
+    """
+    Returns a client if a daemon running with the same python installation
+    listens to this socket, None otherwise. The answer is kept
+    for *delay* seconds.
+
+    :param path: socket path
+    :param delay: the daemon is checked again after this delay
+    :return: :class:`DaemonClient` or None
+    """
+    now = time.perf_counter()
+    with _CLIENTS_LOCK:
+        if path in _CLIENTS and now - _CLIENTS[path][0] < delay:
+            return _CLIENTS[path][1]
+    info = ping_daemon(path)
+    client = (
+        DaemonClient(path)
+        if info is not None
+        and info["prefix"] == sys.prefix
+        and info["version"] == sys.version
+        else None
+    )
+    with _CLIENTS_LOCK:
+        _CLIENTS[path] = (now, client)
+    return client
@@ -0,0 +1,237 @@
+import ast
+import hashlib
+import importlib.util
+import os
+import sys
+import sysconfig
+from typing import Dict, Iterable, List, Optional, Set
+from sphinx.util import logging
+
+logger = logging.getLogger("runpython")
+
+_RECORDERS = []
+_HOOK_INSTALLED = False
+
+
+def _audit_hook(event, args):
+    if not _RECORDERS or event != "open":
+        return
+    path, mode, flags = args
+    if mode is None:
+        # os.open
+        read = isinstance(flags, int) and (flags & 3) == os.O_RDONLY
+    else:
+        read = "r" in mode
+    if read and isinstance(path, (str, bytes)):
+        path = os.fsdecode(path)
+        for files in _RECORDERS:
+            files.add(path)
+
+
+def _ignored_folders() -> List[str]:
+    folders = {sys.prefix, sys.base_prefix, sys.exec_prefix}
+    for name in ["stdlib", "platstdlib", "purelib", "platlib"]:
+        path = sysconfig.get_paths().get(name, None)
+        if path:
+            folders.add(path)
+    return [os.path.normcase(os.path.abspath(f)) + os.sep for f in folders]
+
+
+def imported_modules(script: str) -> List[str]:
+    """
+    Returns the modules a script imports (absolute imports only)
+    without executing it.
+
+    :param script: python code
+    :return: sorted list of module names
+    """
+    try:
+        tree = ast.parse(script)
+    except SyntaxError:
+        return []
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names |= {alias.name for alias in node.names}
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.add(node.module)
+    return sorted(names)
+
+
+def module_files(names: Iterable[str]) -> Set[str]:
+    """
+    Returns the source files of modules and of their submodules
+    already imported. A module not imported yet is located
+    with :func:`importlib.util.find_spec` without importing it.
+
+    :param names: module names
+    :return: set of files
+    """
+    files = set()
+    for name in names:
+        top = name.split(".")[0]
+        loaded = [
+            mod
+            for key, mod in list(sys.modules.items())
+            if key == top or key.startswith(top + ".")
+        ]
+        if loaded:
+            for mod in loaded:
+                filename = getattr(mod, "__file__", None)
+                if filename:
+                    files.add(filename)
+            continue
+        try:
+            spec = importlib.util.find_spec(top)
+        except (ImportError, ValueError):
+            continue
+        if spec is not None and spec.origin and os.path.exists(spec.origin):
+            files.add(spec.origin)
+    return files
+
+
+def file_signature(filename: str) -> Optional[str]:
+    """
+    Returns the sha256 of a file content or None if it does not exist.
+    """
+    try:
+        h = hashlib.sha256()
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(2**20), b""):
+                h.update(chunk)
+        return h.hexdigest()
+    except OSError:
+        return None
+
+
+def unchanged_dependencies(signatures: Dict[str, str]) -> bool:
+    """
+    Tells if the files recorded by :class:`DependencyRecorder`
+    still have the same content.
+    """
+    return all(file_signature(k) == v for k, v in signatures.items())
+
+
+class DependencyRecorder:
+    """
+    Records the files a script executed in the current process reads
+    and the modules it imports. Files read by the script are detected with
+    an audit hook (:func:`sys.addaudithook`), the modules are the one
+    imported by the script (see :func:`imported_modules`)
+    and the one the execution imported for the first time.
+    Files belonging to the python installation are ignored.
+
+    :param script: executed script
+
+    ::
+
+        rec = DependencyRecorder(script)
+        with rec:
+            run_python_script(script, dependencies=rec.files)
+        print(rec.signatures())
+
+    The set *files* can be given to :func:`run_python_script
+    <sphinx_runpython.runpython.sphinx_runpython_extension.run_python_script>`
+    which fills it if the script runs in a pool of interpreters.
+    """
+
+    def __init__(self, script: str):
+        self.script = script
+        self.files = set()
+
+    def __enter__(self):
+        global _HOOK_INSTALLED
+
+        if not _HOOK_INSTALLED:
+            # an audit hook cannot be removed, it is installed once
+            sys.addaudithook(_audit_hook)
+            _HOOK_INSTALLED = True
+        self._modules = set(sys.modules)
+        _RECORDERS.append(self.files)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        _RECORDERS.remove(self.files)
+        names = set(imported_modules(self.script)) | (set(sys.modules) - self._modules)
+        self.files |= module_files(names)
+        return False
+
+    def signatures(self) -> Dict[str, str]:
+        """
+        Returns the recorded files, ignoring the files from the python
+        installation and missing files, with their signature
+        (see :func:`file_signature`).
+
+        :return: dictionary *{absolute filename: signature}*
+        """
+        ignored = _ignored_folders()
+        res = {}
+        for filename in self.files:
+            filename = os.path.abspath(filename)
+            if filename in res or not os.path.isfile(filename):
+                continue
+            if os.path.normcase(filename).startswith(tuple(ignored)):
+                continue
+            sig = file_signature(filename)
+            if sig is not None:
+                res[filename] = sig
+        return res
+
+
+def record_dependencies(env, docname: str, signatures: Dict[str, str]):
+    """
+    Registers the files a script depends on as dependencies of a document
+    and stores their signatures in the environment.
+    """
+    if not signatures:
+        return
+    if not hasattr(env, "runpython_dependencies"):
+        env.runpython_dependencies = {}
+    env.runpython_dependencies.setdefault(docname, {}).update(signatures)
+    for filename in signatures:
+        env.note_dependency(filename)
+
+
+def purge_dependencies(app, env, docname):
+    """
+    Removes the dependencies of a document about to be read again.
+    """
+    if hasattr(env, "runpython_dependencies"):
+        env.runpython_dependencies.pop(docname, None)
+
+
+def merge_dependencies(app, env, docnames, other):
+    """
+    Merges the dependencies collected by parallel readers.
+    """
+    if not hasattr(other, "runpython_dependencies"):
+        return
+    if not hasattr(env, "runpython_dependencies"):
+        env.runpython_dependencies = {}
+    for docname in docnames:
+        if docname in other.runpython_dependencies:
+            env.runpython_dependencies[docname] = other.runpython_dependencies[docname]
+
+
+def outdated_dependencies(app, env, added, changed, removed) -> List[str]:
+    """
+    Returns the documents one of the recorded dependencies has changed
+    (event ``env-get-outdated``). :epkg:`sphinx` compares modification
+    times, this function compares the content.
+    """
+    if not hasattr(env, "runpython_dependencies"):
+        return []
+    signatures = {}
+    outdated = []
+    for docname, deps in env.runpython_dependencies.items():
+        if docname in changed or docname in removed:
+            continue
+        for filename, sig in deps.items():
+            if filename not in signatures:
+                signatures[filename] = file_signature(filename)
+            if signatures[filename] != sig:
+                outdated.append(docname)
+                break
+    if outdated:
+        logger.info("[runpython] %d documents depend on modified files", len(outdated))
+    return sorted(outdated)
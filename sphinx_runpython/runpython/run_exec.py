@@ -0,0 +1,217 @@
+"""
+Executes every script of the directive *runpython* found in a folder
+without building the documentation, see command line ``exec``.
+"""
+
+import ast
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+from .run_prepass import find_runpython_blocks
+
+
+def _docstrings(text: str):
+    # yields (lineno, docstring) for the module, every class and function
+    tree = ast.parse(text)
+    for node in ast.walk(tree):
+        if not isinstance(
+            node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)
+        ):
+            continue
+        if not node.body or not isinstance(node.body[0], ast.Expr):
+            continue
+        value = node.body[0].value
+        if isinstance(value, ast.Constant) and isinstance(value.value, str):
+            yield value.lineno, value.value
+
+
+def collect_runpython_blocks(
+    path: str, recursive: bool = False, encoding: str = "utf-8"
+) -> List[Dict[str, Any]]:
+    """
+    Finds every directive *runpython* in the :epkg:`RST` files and
+    the docstrings of the python files of a folder.
+
+    :param path: folder or file
+    :param recursive: looks into subfolders as well
+    :param encoding: encoding of the files
+    :return: list of blocks, a block is a dictionary with keys
+        *filename*, *lineno*, *docname*, *options*, *content*,
+        see :func:`find_runpython_blocks
+        <sphinx_runpython.runpython.run_prepass.find_runpython_blocks>`
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Unable to find {path!r}.")
+    if os.path.isfile(path):
+        root, names = os.path.dirname(path), [path]
+    else:
+        root, names = path, []
+        for ext in ["rst", "py"]:
+            pattern = os.path.join(path, "**" if recursive else "", f"*.{ext}")
+            names.extend(glob.glob(pattern, recursive=recursive))
+    blocks = []
+    for name in sorted(set(names)):
+        try:
+            with open(name, "r", encoding=encoding) as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError):
+            continue
+        if "runpython::" not in text:
+            continue
+        docname = os.path.splitext(os.path.relpath(name, root))[0].replace("\\", "/")
+        if name.endswith(".py"):
+            try:
+                docstrings = list(_docstrings(text))
+            except SyntaxError:
+                continue
+        else:
+            docstrings = [(1, text)]
+        for first, doc in docstrings:
+            for block in find_runpython_blocks(doc):
+                block.update(
+                    dict(
+                        filename=name,
+                        lineno=first + block["lineno"] - 1,
+                        docname=docname,
+                    )
+                )
+                blocks.append(block)
+    return blocks
+
+
+def _run_blocks(
+    blocks: List[Dict[str, Any]], timeout: Optional[float]
+) -> List[Dict[str, Any]]:
+    # runs blocks one after another, a block may depend on the previous one
+    from .sphinx_runpython_extension import (
+        build_runpython_script,
+        get_runpython_options,
+        runpython_block_key,
+        run_python_script,
+    )
+    from .run_session import close_sessions, get_session_namespace, get_session_pool
+
+    records = []
+    context = None
+    for block in blocks:
+        record = dict(
+            filename=block["filename"],
+            lineno=block["lineno"],
+            options=block["options"],
+            hash=None,
+            duration=0.0,
+            status="ok",
+            error=None,
+        )
+        records.append(record)
+        try:
+            p = get_runpython_options(block["options"], timeout=timeout)
+        except ValueError as e:
+            record.update(dict(status="error", error=f"invalid options: {e}"))
+            continue
+        wd = os.path.dirname(os.path.abspath(block["filename"])).replace("\\", "/")
+        name = "run_python_script"
+        script = build_runpython_script(
+            "\n".join(block["content"]),
+            p,
+            name,
+            context=context if p["restore"] else None,
+        )
+        record["hash"] = runpython_block_key(script, p, block["docname"])
+        pool, namespace = None, None
+        if p["session"] and p["process"]:
+            pool = get_session_pool(block["docname"], p["session"])
+        elif p["session"]:
+            namespace = get_session_namespace(block["docname"], p["session"])
+        begin = time.perf_counter()
+        try:
+            _, err, new_context = run_python_script(
+                script.replace("## __WD__ ##", f"__WD__ = '{wd}'"),
+                setsysvar=p["setsysvar"],
+                process=p["process"],
+                exception=p["exception"],
+                warningout=p["warningout"],
+                chdir=wd if p["current"] else None,
+                context=context if p["restore"] else None,
+                store_in_file=p["store_in_file"],
+                pool=pool,
+                namespace=namespace,
+                session=p["session"] if pool is not None else None,
+                numpy_precision=p["numpy_precision"],
+                timeout=p["timeout"],
+                maxmem=p["maxmem"],
+            )
+        except Exception as e:
+            record.update(
+                dict(status=type(e).__name__, error=str(e).strip().split("\n")[-1])
+            )
+            new_context = None
+        else:
+            if (
+                not p["exception"]
+                and err
+                and "Traceback (most recent call last)" in err
+            ):
+                record.update(dict(status="error", error=err.strip().split("\n")[-1]))
+        record["duration"] = time.perf_counter() - begin
+        context = new_context if p["store"] else None
+    close_sessions()
+    return records
+
+
+def execute_runpython_blocks(
+    blocks: List[Dict[str, Any]],
+    max_workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Executes the blocks returned by :func:`collect_runpython_blocks`
+    in parallel in a pool of processes. The blocks of a file depending
+    on each other (options ``:store:``, ``:restore:``, ``:session:``)
+    run one after another in the same process.
+
+    :param blocks: blocks
+    :param max_workers: number of processes, None for the number of cores
+    :param timeout: default timeout for every block (seconds)
+    :return: one record per block in the same order, a record is a dictionary
+        with keys *filename*, *lineno*, *options*, *hash* (the key used by
+        the cache, see :func:`runpython_block_key
+        <sphinx_runpython.runpython.sphinx_runpython_extension.runpython_block_key>`),
+        *duration*, *status* (``"ok"`` or the error type), *error*
+    """
+    tasks, chains = [], {}
+    for i, block in enumerate(blocks):
+        options = block["options"]
+        if any(k in options for k in ["store", "restore", "session"]):
+            if block["filename"] not in chains:
+                chains[block["filename"]] = []
+                tasks.append(chains[block["filename"]])
+            chains[block["filename"]].append((i, block))
+        else:
+            tasks.append([(i, block)])
+
+    records = [None] * len(blocks)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            (
+                [i for i, _ in task],
+                executor.submit(_run_blocks, [b for _, b in task], timeout),
+            )
+            for task in tasks
+        ]
+        for indices, future in futures:
+            for i, record in zip(indices, future.result()):
+                records[i] = record
+    return records
+
+
+def write_manifest(records: List[Dict[str, Any]], filename: str):
+    """
+    Saves the records returned by :func:`execute_runpython_blocks`
+    in a json file.
+    """
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(records, f, indent=2)
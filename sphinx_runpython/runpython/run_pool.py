@@ -0,0 +1,348 @@
+import atexit
+import json
+import os
+import queue
+import signal
+import subprocess
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+from .run_cmd import RunCmdException, get_interpreter_path
+
+
+class PoolMemoryError(RunCmdException):
+    """
+    Raised by :meth:`RunPythonPool.run` when a script needs more memory
+    than allowed. Attributes *out* and *err* contain what the script
+    wrote before it failed.
+    """
+
+    def __init__(self, message: str = "", out: str = "", err: str = ""):
+        super().__init__(message)
+        self.out = out
+        self.err = err
+
+
+_WORKER = os.path.join(os.path.dirname(__file__), "_pool_worker.py")
+_BOOT = "import runpy, sys; runpy.run_path(sys.argv[1], run_name='__main__')"
+
+
+class _PoolWorker:
+    """
+    Holds one interpreter started by :class:`RunPythonPool`.
+    """
+
+    def __init__(self, preload: Optional[List[str]] = None, fork: bool = False):
+        env = os.environ.copy()
+        env["PYTHONIOENCODING"] = "utf-8"
+        self.proc = subprocess.Popen(
+            [get_interpreter_path(), "-u", "-c", _BOOT, _WORKER],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=env,
+            # the worker and the processes it forks share a process group
+            start_new_session=True,
+        )
+        self.n_jobs = 0
+        self.ready = None
+        self._send({"preload": list(preload or []), "fork": fork})
+
+    def _send(self, obj):
+        self.proc.stdin.write(json.dumps(obj).encode("utf-8") + b"\n")
+        self.proc.stdin.flush()
+
+    def _receive(self):
+        line = self.proc.stdout.readline()
+        if not line:
+            code = self.proc.poll()
+            raise RunCmdException(
+                f"The worker (pid={self.proc.pid}) stopped unexpectedly "
+                f"with exit code {code}."
+            )
+        try:
+            return json.loads(line.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise RunCmdException(
+                f"The worker (pid={self.proc.pid}) sent an unexpected "
+                f"answer {line[:200]!r}."
+            ) from e
+
+    def wait_ready(self) -> Dict:
+        if self.ready is None:
+            self.ready = self._receive()
+        return self.ready
+
+    def run(self, job: Dict, deadline: Optional[float] = None) -> Dict:
+        self.wait_ready()
+        killed = []
+        if deadline is not None:
+            # the worker interrupts the script itself, this timer
+            # only kills the worker if the script does not return
+            def kill():
+                killed.append(True)
+                self.kill()
+
+            timer = threading.Timer(deadline, kill)
+            timer.daemon = True
+            timer.start()
+        try:
+            self._send(job)
+            res = self._receive()
+        except RunCmdException:
+            if killed:
+                raise subprocess.TimeoutExpired(self.proc.args, deadline) from None
+            raise
+        finally:
+            if deadline is not None:
+                timer.cancel()
+        self.n_jobs += 1
+        return res
+
+    def kill(self):
+        # kills the worker and the process it forked to run a script
+        if hasattr(os, "killpg"):
+            try:
+                os.killpg(self.proc.pid, signal.SIGKILL)
+                return
+            except OSError:
+                pass
+        self.proc.kill()
+
+    def close(self):
+        if self.proc.poll() is None:
+            try:
+                self._send({"stop": True})
+                self.proc.stdin.close()
+                self.proc.wait(timeout=5)
+            except Exception:
+                self.kill()
+                self.proc.wait()
+        for stream in [self.proc.stdin, self.proc.stdout]:
+            if stream is not None and not stream.closed:
+                stream.close()
+
+
+class RunPythonPool:
+    """
+    Keeps a pool of started interpreters to run scripts
+    without paying the cost of starting a new process every time.
+
+    :param size: number of interpreters
+    :param recycle: an interpreter is replaced by a new one after it
+        executed *recycle* scripts, None to never replace it
+    :param preload: modules to import when an interpreter starts
+    :param fork: every interpreter forks itself to run a script,
+        the script benefits from the preloaded modules but cannot modify
+        the interpreter, see :meth:`supports_fork`
+
+    Every script runs in a new namespace and the interpreter restores
+    ``sys.path``, ``sys.argv``, the current directory and removes the attributes
+    the script added to module *sys*. Modules imported by a script remain
+    imported until the interpreter is recycled. The standard output
+    and the standard error are captured at file descriptor level,
+    an exception is reported in the standard error with its traceback
+    as python does when a script fails.
+
+    ::
+
+        from sphinx_runpython.runpython.run_pool import RunPythonPool
+
+        pool = RunPythonPool(2, preload=["numpy"])
+        out, err = pool.run("import numpy;print(numpy.arange(3))")
+        pool.close()
+    """
+
+    def __init__(
+        self,
+        size: int = 1,
+        recycle: Optional[int] = None,
+        preload: Optional[List[str]] = None,
+        fork: bool = False,
+    ):
+        if size <= 0:
+            raise ValueError(f"size={size} must be strictly positive.")
+        self.size = size
+        self.recycle = recycle
+        self.preload = list(preload or [])
+        self.fork = fork
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        for _ in range(size):
+            self._add_worker()
+
+    def _add_worker(self):
+        worker = _PoolWorker(self.preload, fork=self.fork)
+        with self._lock:
+            self._workers.append(worker)
+        self._idle.put(worker)
+
+    def _remove_worker(self, worker):
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        worker.close()
+
+    @property
+    def mode(self) -> str:
+        """
+        Returns ``"forkserver"`` if the interpreters fork themselves,
+        ``"pool"`` otherwise.
+        """
+        return "forkserver" if self.fork else "pool"
+
+    def supports_fork(self) -> bool:
+        """
+        Tells if the interpreters fork themselves to run a script.
+        It waits for one interpreter to be ready.
+        It is False if *fork* is False or if the interpreter
+        cannot safely fork itself (no fork on Windows, not safe on macOS
+        or if a preloaded module started threads).
+        """
+        if not self.fork:
+            return False
+        with self._lock:
+            worker = self._workers[0] if self._workers else None
+        if worker is None:
+            return False
+        return worker.wait_ready().get("fork", False)
+
+    def run(
+        self,
+        script: str,
+        filename: Optional[str] = None,
+        cwd: Optional[str] = None,
+        stats: Optional[Dict] = None,
+        files: Optional[Set[str]] = None,
+        session: Optional[str] = None,
+        timeout: Optional[float] = None,
+        maxmem: Optional[int] = None,
+        env: Optional[Dict[str, str]] = None,
+        path: Optional[List[str]] = None,
+    ) -> Tuple[str, str]:
+        """
+        Runs a script in one of the interpreters.
+
+        :param script: script to run
+        :param filename: filename to use to compile the script,
+            the file should contain the script if module :mod:`inspect`
+            needs to retrieve the source
+        :param cwd: current directory while the script runs
+        :param stats: if not None, the dictionary receives the duration,
+            the cpu time and the peak resident memory (*duration*, *cpu*,
+            *maxrss*) measured by the interpreter
+        :param files: if not None, the set receives the files the script
+            opened for reading and the files of the modules it imported
+        :param session: if not None, the script runs in the namespace
+            associated to this name and kept by the interpreter,
+            it only makes sense with a pool of one interpreter which is not
+            recycled and does not fork
+        :param timeout: the script is interrupted after *timeout* seconds,
+            the interpreter is killed and replaced if it does not return
+            a few seconds later
+        :param maxmem: maximum size of the address space while the script
+            runs (bytes), the script runs in a process forked from the
+            interpreter so that the interpreter itself is never limited,
+            the limit is ignored if the interpreter cannot fork itself
+            or if *session* is specified
+        :param env: environment variables while the script runs,
+            the interpreter keeps its own if None
+        :param path: *sys.path* while the script runs, :class:`RunCmdException
+            <sphinx_runpython.runpython.run_cmd.RunCmdException>` is raised
+            if a preloaded module would be imported from another location
+        :return: stdout, stderr
+
+        :class:`subprocess.TimeoutExpired` is raised if the script
+        exceeds *timeout*, attributes *output* and *stderr* contain what
+        the script wrote before it was interrupted.
+        :class:`PoolMemoryError` is raised if the script exceeds *maxmem*.
+        """
+        job = dict(script=script, filename=filename, cwd=cwd)
+        if files is not None:
+            job["track"] = True
+        if session is not None:
+            job["session"] = session
+        if timeout:
+            job["timeout"] = timeout
+        if maxmem:
+            job["maxmem"] = maxmem
+        if env is not None:
+            job["env"] = dict(env)
+        if path is not None:
+            job["path"] = list(path)
+        worker = self._idle.get()
+        try:
+            res = worker.run(job, deadline=timeout + 5 if timeout else None)
+        except Exception:
+            self._remove_worker(worker)
+            self._add_worker()
+            raise
+        if self.recycle is not None and worker.n_jobs >= self.recycle:
+            self._remove_worker(worker)
+            self._add_worker()
+        else:
+            self._idle.put(worker)
+        if stats is not None:
+            stats.update({k: res[k] for k in ["duration", "cpu", "maxrss"] if k in res})
+        if files is not None:
+            files.update(res.get("files", []))
+        err = res["err"].replace("\r\n", "\n").strip("\n\r\t ")
+        if res.get("reason", None) == "mismatch":
+            raise RunCmdException(err)
+        if res.get("reason", None) == "timeout":
+            raise subprocess.TimeoutExpired(
+                "<script>", timeout, output=res["out"], stderr=err
+            )
+        if res.get("reason", None) == "memory":
+            raise PoolMemoryError(
+                f"The script needs more than {maxmem} bytes.", out=res["out"], err=err
+            )
+        return res["out"], err
+
+    def close(self):
+        """
+        Stops all interpreters.
+        """
+        with self._lock:
+            workers = self._workers
+            self._workers = []
+        for worker in workers:
+            worker.close()
+
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_process_pool(
+    size: int,
+    recycle: Optional[int] = None,
+    preload: Optional[List[str]] = None,
+    fork: bool = False,
+) -> RunPythonPool:
+    """
+    Returns a pool of interpreters shared by all callers
+    requesting the same parameters in the current process.
+    See :class:`RunPythonPool`.
+    """
+    key = (os.getpid(), size, recycle, tuple(preload or []), fork)
+    with _POOLS_LOCK:
+        if key not in _POOLS:
+            _POOLS[key] = RunPythonPool(
+                size, recycle=recycle, preload=preload, fork=fork
+            )
+        return _POOLS[key]
+
+
+def close_process_pools():
+    """
+    Closes every pool created by :func:`get_process_pool`
+    in the current process.
+    """
+    pid = os.getpid()
+    with _POOLS_LOCK:
+        pools = [_POOLS.pop(key) for key in list(_POOLS) if key[0] == pid]
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_process_pools)
@@ -0,0 +1,64 @@
+"""
+Imports the modules the scripts running in the current process need
+before sphinx parses the documents and sets the print options of numpy once.
+"""
+
+import sys
+import threading
+import time
+from typing import Union
+from sphinx.util import logging
+from ._pool_worker import preload_modules
+
+logger = logging.getLogger("runpython")
+
+_NUMPY_LOCK = threading.Lock()
+
+
+def set_numpy_precision(precision: Union[int, str, None]) -> bool:
+    """
+    Calls ``numpy.set_printoptions(precision)`` unless numpy
+    already uses this precision.
+
+    :param precision: precision, None, ``"None"``, ``"-"`` or ``""``
+        to do nothing
+    :return: True if numpy uses this precision
+    """
+    if precision in (None, "None", "-", ""):
+        return False
+    try:
+        precision = int(precision)
+    except ValueError:
+        return False
+    try:
+        import numpy
+    except ImportError:
+        return False
+    with _NUMPY_LOCK:
+        # a script may have changed the options since the last call
+        if numpy.get_printoptions()["precision"] != precision:
+            numpy.set_printoptions(precision)
+    return True
+
+
+def preload_runpython(app):
+    """
+    Imports the modules listed in ``runpython_preload_modules``
+    and logs the time every import took. numpy print options are set
+    if numpy is imported.
+    """
+    names = app.config.runpython_preload_modules
+    if names:
+        begin = time.perf_counter()
+        for name, res in preload_modules(names).items():
+            if isinstance(res, str):
+                logger.warning("[runpython] unable to preload %r: %s", name, res)
+            else:
+                logger.info("[runpython] preloaded %r in %1.2f seconds", name, res)
+        logger.info(
+            "[runpython] preloaded %d modules in %1.2f seconds",
+            len(names),
+            time.perf_counter() - begin,
+        )
+    if "numpy" in sys.modules:
+        set_numpy_precision(app.config.runpython_numpy_precision)
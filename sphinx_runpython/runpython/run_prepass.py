@@ -0,0 +1,319 @@
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from sphinx.util import logging
+from .run_schedule import longest_first, over_budget
+
+logger = logging.getLogger("runpython")
+
+_PREPASS_RESULTS = {}
+
+_directive_regex = re.compile(r"^(\s*)\.\.\s+([\w:-]+)::(.*)$")
+_option_regex = re.compile(r"^:([^:\s][^:]*):(?:\s+(.*))?$")
+
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip())
+
+
+def _in_literal_block(lines: List[str], index: int, indent: int) -> bool:
+    # A directive is only an example if the nearest paragraph
+    # with a smaller indentation ends with '::' and is not a directive.
+    for i in range(index - 1, -1, -1):
+        line = lines[i]
+        if not line.strip() or _indent(line) >= indent:
+            continue
+        return line.rstrip().endswith("::") and not _directive_regex.match(line)
+    return False
+
+
+def find_runpython_blocks(
+    text: str, directive: str = "runpython"
+) -> List[Dict[str, Any]]:
+    """
+    Finds every directive *runpython* in a :epkg:`RST` text
+    without parsing the document with :epkg:`docutils`.
+    The directives written inside a literal block are skipped.
+
+    :param text: text
+    :param directive: directive name
+    :return: list of dictionaries with keys *lineno* (starting at 1),
+        *options*, *content* (a list of lines)
+    """
+    lines = text.replace("\r", "").split("\n")
+    blocks = []
+    for i, line in enumerate(lines):
+        match = _directive_regex.match(line)
+        if match is None or match.group(2) != directive:
+            continue
+        indent = len(match.group(1))
+        if _in_literal_block(lines, i, indent):
+            continue
+
+        block = []
+        for row in lines[i + 1 :]:
+            if row.strip() and _indent(row) <= indent:
+                break
+            block.append(row)
+        while block and not block[-1].strip():
+            block.pop()
+        non_blank = [_indent(row) for row in block if row.strip()]
+        if not non_blank:
+            continue
+        dedent = min(non_blank)
+        block = [row[dedent:] for row in block]
+
+        options = {}
+        pos = 0
+        last = None
+        while pos < len(block) and block[pos].strip():
+            row = block[pos]
+            opt = _option_regex.match(row.strip())
+            if opt is not None and _indent(row) == 0:
+                last = opt.group(1)
+                options[last] = (opt.group(2) or "").strip()
+            elif last is not None:
+                options[last] = (options[last] + "\n" + row.strip()).strip()
+            else:
+                break
+            pos += 1
+        if pos == 0:
+            # no option, the content may start immediately
+            content = block
+        else:
+            content = block[pos:]
+        while content and not content[0].strip():
+            content = content[1:]
+        blocks.append(dict(lineno=i + 1, options=options, content=content))
+    return blocks
+
+
+def collect_prepass_jobs(
+    documents: List[Tuple[str, str]],
+    encoding: str = "utf-8-sig",
+    numpy_precision: int = 3,
+    timeout: Optional[float] = None,
+    maxmem: Optional[Any] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Builds the scripts the directive *runpython* would execute for every
+    document. Scripts depending on another one (options ``:store:``,
+    ``:restore:``, ``:session:``) or writing a file (``:store_in_file:``) are skipped.
+
+    :param documents: list of *(docname, filename)*
+    :param encoding: encoding of the documents
+    :param numpy_precision: precision used by numpy
+        if option ``:numpy_precision:`` is missing
+    :param timeout: timeout if option ``:timeout:`` is missing
+    :param maxmem: memory limit if option ``:maxmem:`` is missing
+    :return: list of jobs, a job is a dictionary with keys *key*,
+        *docname*, *lineno*, *script* (see :func:`runpython_block_key
+        <sphinx_runpython.runpython.sphinx_runpython_extension.runpython_block_key>`),
+        *options*, *kwargs* (arguments of :func:`run_python_script
+        <sphinx_runpython.runpython.sphinx_runpython_extension.run_python_script>`)
+    """
+    from .sphinx_runpython_extension import (
+        build_runpython_script,
+        get_runpython_options,
+        runpython_block_key,
+    )
+
+    jobs = []
+    for docname, filename in documents:
+        try:
+            with open(filename, "r", encoding=encoding) as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError):
+            continue
+        if "runpython::" not in text:
+            continue
+        wd = os.path.dirname(os.path.abspath(filename)).replace("\\", "/")
+        for block in find_runpython_blocks(text):
+            try:
+                p = get_runpython_options(
+                    block["options"],
+                    numpy_precision=numpy_precision,
+                    timeout=timeout,
+                    maxmem=maxmem,
+                )
+            except ValueError:
+                continue
+            if p["store"] or p["restore"] or p["store_in_file"] or p["session"]:
+                continue
+            name = "run_python_script"
+            script = build_runpython_script("\n".join(block["content"]), p, name)
+            jobs.append(
+                dict(
+                    key=runpython_block_key(script, p, docname),
+                    docname=docname,
+                    lineno=block["lineno"],
+                    script=script,
+                    options=p,
+                    kwargs=dict(
+                        script=script.replace("## __WD__ ##", f"__WD__ = '{wd}'"),
+                        setsysvar=p["setsysvar"],
+                        process=p["process"],
+                        exception=p["exception"],
+                        warningout=p["warningout"],
+                        chdir=wd if p["current"] else None,
+                        timeout=p["timeout"],
+                        maxmem=p["maxmem"],
+                        numpy_precision=p["numpy_precision"],
+                    ),
+                )
+            )
+    return jobs
+
+
+def _run_prepass_job(
+    kwargs: Dict[str, Any],
+) -> Tuple[Optional[Tuple[str, str, Any]], float]:
+    from .sphinx_runpython_extension import run_python_script
+
+    begin = time.perf_counter()
+    try:
+        res = run_python_script(**kwargs)
+    except Exception:
+        # the directive runs it again and reports the error
+        res = None
+    return res, time.perf_counter() - begin
+
+
+def run_prepass(
+    jobs: List[Dict[str, Any]],
+    max_workers: Optional[int] = None,
+    threads: bool = False,
+    durations: Optional[Dict[str, float]] = None,
+) -> Dict[str, Tuple[str, str, Any]]:
+    """
+    Executes jobs returned by :func:`collect_prepass_jobs` in parallel
+    in a pool of processes. The outputs are kept until the directive
+    retrieves them with :func:`pop_prepass_result`.
+
+    :param jobs: jobs
+    :param max_workers: number of processes, None for the number of cores
+    :param threads: uses threads instead of processes, the scripts
+        run in the current process (see parameter *threadsafe* of
+        :func:`run_python_script
+        <sphinx_runpython.runpython.sphinx_runpython_extension.run_python_script>`)
+    :param durations: durations of the previous executions, the longest
+        scripts start first, the dictionary receives the new durations
+    :return: the results, a dictionary *{key: (stdout, stderr, context)}*
+    """
+    unique = {}
+    for job in jobs:
+        unique.setdefault(job["key"], job)
+    if not unique:
+        return {}
+    results = {}
+    executor_class = ThreadPoolExecutor if threads else ProcessPoolExecutor
+    with executor_class(max_workers=max_workers) as executor:
+        futures = {
+            job["key"]: executor.submit(
+                _run_prepass_job,
+                dict(job["kwargs"], threadsafe=True) if threads else job["kwargs"],
+            )
+            for job in longest_first(list(unique.values()), durations or {})
+        }
+        for key, future in futures.items():
+            try:
+                res, duration = future.result()
+            except Exception:
+                res = None
+            if res is None:
+                continue
+            results[key] = res
+            if durations is not None:
+                durations[key] = duration
+    _PREPASS_RESULTS.update(results)
+    return results
+
+
+def pop_prepass_result(key: str) -> Optional[Tuple[str, str, Any]]:
+    """
+    Returns and forgets the outputs computed by :func:`run_prepass`
+    for a script or None if there is none.
+    """
+    return _PREPASS_RESULTS.pop(key, None)
+
+
+def prepass_runpython(app, env, docnames):
+    """
+    Executes every script of the documents to read before
+    :epkg:`sphinx` parses them if ``runpython_prepass`` is True.
+    """
+    if not app.config.runpython_prepass or not docnames:
+        return
+    suffixes = app.config.source_suffix
+    documents = []
+    for docname in docnames:
+        filename = str(env.doc2path(docname))
+        ext = os.path.splitext(filename)[-1]
+        if isinstance(suffixes, dict) and suffixes.get(ext, None) not in (
+            "restructuredtext",
+            None,
+        ):
+            continue
+        documents.append((docname, filename))
+    begin = time.perf_counter()
+    jobs = collect_prepass_jobs(
+        documents,
+        encoding=app.config.source_encoding,
+        numpy_precision=app.config.runpython_numpy_precision,
+        timeout=app.config.runpython_timeout,
+        maxmem=app.config.runpython_maxmem,
+    )
+
+    from .sphinx_runpython_extension import (
+        get_latest_cache,
+        get_runpython_cache,
+        runpython_block_key,
+    )
+
+    cache = get_runpython_cache(env)
+    if cache is not None:
+        fingerprint = getattr(env, "runpython_cache_fingerprint", "")
+        jobs = [
+            job
+            for job in jobs
+            if job["options"]["nocache"]
+            or runpython_block_key(
+                job["script"], job["options"], job["docname"], fingerprint
+            )
+            not in cache
+        ]
+    if not hasattr(env, "runpython_durations"):
+        env.runpython_durations = {}
+    latest_cache = get_latest_cache(env)
+    if latest_cache is not None and app.config.runpython_time_budget:
+        # the directive displays the latest outputs of these scripts
+        jobs = [
+            job
+            for job in jobs
+            if not over_budget(
+                env.runpython_durations.get(job["key"], None),
+                app.config.runpython_time_budget,
+                latest_cache.get(job["key"]),
+            )
+        ]
+    results = run_prepass(
+        jobs,
+        max_workers=app.config.runpython_prepass_workers,
+        threads=app.config.runpython_prepass_threads,
+        durations=env.runpython_durations,
+    )
+    logger.info(
+        "[runpython] pre-executed %d/%d scripts in %1.1f seconds",
+        len(results),
+        len(jobs),
+        time.perf_counter() - begin,
+    )
+
+
+def clear_prepass_results(app, exception):
+    """
+    Removes the outputs the directive did not retrieve.
+    """
+    _PREPASS_RESULTS.clear()
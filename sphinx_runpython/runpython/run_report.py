@@ -0,0 +1,170 @@
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, Optional
+from sphinx.util import logging
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+logger = logging.getLogger("runpython")
+
+
+def max_rss(who: str = "self") -> Optional[int]:
+    """
+    Returns the peak resident memory in bytes of the current process
+    (*who* is ``"self"``) or of the largest terminated child
+    (*who* is ``"children"``), None if it is not available.
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(
+        resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN
+    )
+    # kilobytes on Linux, bytes on macOS
+    return usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+
+def _children_cpu() -> float:
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class ExecutionMeasure:
+    """
+    Measures the wall time, the cpu time and the peak memory
+    of a script run by :func:`run_python_script
+    <sphinx_runpython.runpython.sphinx_runpython_extension.run_python_script>`.
+
+    :param in_process: the script runs in the current process,
+        the peak memory is measured with :mod:`tracemalloc`,
+        otherwise, it is the peak resident memory of the child process
+        if it is larger than any previous child
+
+    ::
+
+        with ExecutionMeasure(True) as m:
+            out, err, _ = run_python_script(script, stats=m.stats)
+        print(m.record)
+    """
+
+    def __init__(self, in_process: bool):
+        self.in_process = in_process
+        self.stats = {}
+        self.record = {}
+
+    def __enter__(self):
+        if self.in_process:
+            self._tracing = tracemalloc.is_tracing()
+            if not self._tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        else:
+            self._children_rss = max_rss("children")
+        self._cpu = time.process_time()
+        self._children_cpu = _children_cpu()
+        self._begin = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        wall = time.perf_counter() - self._begin
+        cpu = time.process_time() - self._cpu
+        children_cpu = _children_cpu() - self._children_cpu
+        if self.in_process:
+            peak = tracemalloc.get_traced_memory()[1]
+            if not self._tracing:
+                tracemalloc.stop()
+        else:
+            rss = max_rss("children")
+            peak = (
+                rss
+                if rss is not None
+                and self._children_rss is not None
+                and rss > self._children_rss
+                else None
+            )
+        if "cpu" in self.stats:
+            # measured by the interpreter which ran the script
+            cpu = self.stats["cpu"]
+        elif not self.in_process:
+            cpu = children_cpu
+        if "maxrss" in self.stats:
+            peak = self.stats["maxrss"]
+        self.record = dict(
+            mode=self.stats.get("mode", "in-process" if self.in_process else "?"),
+            wall=wall,
+            cpu=cpu,
+            peak_memory=peak,
+        )
+        return False
+
+
+def record_execution(env, record: Dict[str, Any]):
+    """
+    Stores the measures of one execution in the environment.
+    """
+    if not hasattr(env, "runpython_report"):
+        env.runpython_report = []
+    env.runpython_report.append(record)
+
+
+def purge_report(app, env, docname):
+    """
+    Removes the measures of a document about to be read again.
+    """
+    if hasattr(env, "runpython_report"):
+        env.runpython_report = [
+            r for r in env.runpython_report if r["docname"] != docname
+        ]
+
+
+def merge_report(app, env, docnames, other):
+    """
+    Merges the measures collected by parallel readers.
+    """
+    if not hasattr(other, "runpython_report"):
+        return
+    if not hasattr(env, "runpython_report"):
+        env.runpython_report = []
+    env.runpython_report.extend(
+        r for r in other.runpython_report if r["docname"] in docnames
+    )
+
+
+def write_report(app, exception):
+    """
+    Writes the measures of every execution in file ``runpython_report``
+    (relative to the output folder) and logs the slowest scripts.
+    """
+    if exception is not None or not app.config.runpython_report:
+        return
+    records = sorted(
+        getattr(app.env, "runpython_report", []),
+        key=lambda r: (-r["wall"], r["docname"], r["lineno"]),
+    )
+    name = os.path.join(app.outdir, app.config.runpython_report)
+    os.makedirs(os.path.dirname(name), exist_ok=True)
+    with open(name, "w", encoding="utf-8") as f:
+        json.dump(records, f, indent=1)
+    total = sum(r["wall"] for r in records)
+    logger.info(
+        "[runpython] %d scripts, %1.1f seconds, report in %r",
+        len(records),
+        total,
+        name,
+    )
+    for r in records[: app.config.runpython_report_top]:
+        logger.info(
+            "[runpython] %8.3fs %-10s %s:%d",
+            r["wall"],
+            r["mode"],
+            r["docname"],
+            r["lineno"],
+        )
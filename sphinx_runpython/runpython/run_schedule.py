@@ -0,0 +1,144 @@
+"""
+Keeps the duration of every script from one build to the next one
+to start the longest scripts first and to skip the scripts
+exceeding ``runpython_time_budget``.
+"""
+
+from typing import Any, Dict, List, Optional
+
+
+def record_duration(env, key: str, duration: float):
+    """
+    Stores the duration of a script in the environment,
+    it is kept for the next builds.
+
+    :param env: sphinx environment
+    :param key: see :func:`runpython_block_key
+        <sphinx_runpython.runpython.sphinx_runpython_extension.runpython_block_key>`
+    :param duration: duration in seconds
+    """
+    if env is None:
+        return
+    if not hasattr(env, "runpython_durations"):
+        env.runpython_durations = {}
+    env.runpython_durations[key] = duration
+
+
+def keep_duration(env, key: str, docname: str):
+    """
+    Tells the duration of a script belongs to a document,
+    it is removed once the document is read again without this script.
+
+    :param env: sphinx environment
+    :param key: see :func:`record_duration`
+    :param docname: document name
+    """
+    if env is None:
+        return
+    if not hasattr(env, "runpython_duration_docs"):
+        env.runpython_duration_docs = {}
+    env.runpython_duration_docs.setdefault(docname, set()).add(key)
+    purged = getattr(env, "runpython_purged_durations", None)
+    if purged:
+        purged.discard(key)
+
+
+def get_duration(env, key: str) -> Optional[float]:
+    """
+    Returns the duration of a script measured by a previous execution
+    or None if it is unknown.
+    """
+    return getattr(env, "runpython_durations", {}).get(key, None)
+
+
+def merge_durations(app, env, docnames, other):
+    """
+    Merges the durations measured by parallel readers.
+    """
+    if not hasattr(other, "runpython_durations"):
+        return
+    if not hasattr(env, "runpython_durations"):
+        env.runpython_durations = {}
+    env.runpython_durations.update(other.runpython_durations)
+    if not hasattr(env, "runpython_duration_docs"):
+        env.runpython_duration_docs = {}
+    purged = getattr(env, "runpython_purged_durations", set())
+    for docname, keys in getattr(other, "runpython_duration_docs", {}).items():
+        if docname in docnames:
+            env.runpython_duration_docs[docname] = keys
+            purged -= keys
+
+
+def purge_durations(app, env, docname):
+    """
+    Marks the durations of a document about to be read again,
+    the ones the document does not use anymore are removed
+    by :func:`drop_purged_durations`.
+    """
+    keys = getattr(env, "runpython_duration_docs", {}).pop(docname, None)
+    if not keys:
+        return
+    if not hasattr(env, "runpython_purged_durations"):
+        env.runpython_purged_durations = set()
+    env.runpython_purged_durations |= keys
+
+
+def drop_purged_durations(app, env):
+    """
+    Removes the durations and the latest outputs of the scripts
+    which disappeared from the documents read again.
+    """
+    purged = getattr(env, "runpython_purged_durations", None)
+    if not purged:
+        return
+    from .sphinx_runpython_extension import get_latest_cache
+
+    latest_cache = get_latest_cache(env)
+    durations = getattr(env, "runpython_durations", {})
+    for key in purged:
+        durations.pop(key, None)
+        if latest_cache is not None:
+            latest_cache.remove(key)
+    purged.clear()
+
+
+def longest_first(
+    jobs: List[Dict[str, Any]], durations: Dict[str, float]
+) -> List[Dict[str, Any]]:
+    """
+    Sorts jobs by decreasing duration (longest processing time first),
+    the jobs never executed come first as their duration is unknown.
+
+    :param jobs: jobs with a key *key*
+    :param durations: known durations
+    :return: sorted jobs
+    """
+    return sorted(
+        jobs,
+        key=lambda job: (
+            job["key"] in durations,
+            -durations.get(job["key"], 0.0),
+        ),
+    )
+
+
+def over_budget(
+    duration: Optional[float], budget: Optional[float], latest: Optional[Dict]
+) -> bool:
+    """
+    Tells if a script should not run because its last execution
+    exceeded the time budget and its latest outputs are available.
+    The latest outputs are stored with the same key as the duration,
+    a modified script always runs.
+
+    :param duration: duration of the script or None if unknown
+    :param budget: ``runpython_time_budget``
+    :param latest: latest outputs of the same script, a dictionary with keys
+        *out*, *err*, *duration*
+    :return: boolean
+    """
+    if not budget or latest is None:
+        return False
+    if duration is None:
+        duration = latest.get("duration", None)
+    return duration is not None and duration > budget
@@ -0,0 +1,82 @@
+import builtins
+import threading
+from typing import Any, Dict, List, Optional
+from .run_pool import RunPythonPool
+
+_NAMESPACES = {}
+_SESSION_POOLS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+def get_session_namespace(docname: str, name: str) -> Dict[str, Any]:
+    """
+    Returns the namespace of a session for scripts running
+    in the current process. The namespace lives until the document
+    is read again or the build ends.
+
+    :param docname: document name
+    :param name: session name (option ``:session:``)
+    :return: namespace
+    """
+    key = (docname, name)
+    with _SESSIONS_LOCK:
+        if key not in _NAMESPACES:
+            _NAMESPACES[key] = {"__name__": "__main__", "__builtins__": builtins}
+        return _NAMESPACES[key]
+
+
+def get_session_pool(
+    docname: str, name: str, preload: Optional[List[str]] = None
+) -> RunPythonPool:
+    """
+    Returns the interpreter dedicated to a session for scripts running
+    in a separate process (option ``:process:``). The interpreter lives until
+    the document is read again or the build ends.
+
+    :param docname: document name
+    :param name: session name (option ``:session:``)
+    :param preload: modules to import when the interpreter starts
+    :return: a pool with one interpreter, see :class:`RunPythonPool
+        <sphinx_runpython.runpython.run_pool.RunPythonPool>`
+    """
+    key = (docname, name)
+    with _SESSIONS_LOCK:
+        if key not in _SESSION_POOLS:
+            _SESSION_POOLS[key] = RunPythonPool(1, preload=preload)
+        return _SESSION_POOLS[key]
+
+
+def close_sessions(docname: Optional[str] = None):
+    """
+    Removes the namespaces and stops the interpreters of every session
+    of a document or of all documents if *docname* is None.
+    """
+    with _SESSIONS_LOCK:
+        keys = [k for k in _NAMESPACES if docname is None or k[0] == docname]
+        for k in keys:
+            del _NAMESPACES[k]
+        keys = [k for k in _SESSION_POOLS if docname is None or k[0] == docname]
+        pools = [_SESSION_POOLS.pop(k) for k in keys]
+    for pool in pools:
+        pool.close()
+
+
+def purge_sessions(app, env, docname):
+    """
+    Removes the sessions of a document about to be read again.
+    """
+    close_sessions(docname)
+
+
+def end_document_sessions(app, doctree):
+    """
+    Removes the sessions of a document once it is read.
+    """
+    close_sessions(app.env.docname)
+
+
+def end_sessions(app, exception):
+    """
+    Removes all sessions at the end of the build.
+    """
+    close_sessions()
@@ -0,0 +1,222 @@
+"""
+Helpers to run several scripts at the same time in the current process,
+every thread gets its own standard output, its own warning filters.
+Scripts changing the current directory run alone.
+"""
+
+import io
+import os
+import sys
+import threading
+import warnings
+from contextlib import contextmanager
+from typing import Iterator, Optional, Sequence, TextIO, Type
+
+_LOCAL = threading.local()
+_LOCK = threading.Lock()
+_STATE = {"routed": 0, "showwarning": None, "filter": None}
+_SYSVARS = {}
+
+
+class _ThreadRouter(io.TextIOBase):
+    """
+    Replaces *sys.stdout* or *sys.stderr*, sends what a thread writes
+    to the stream this thread registered with :func:`route_output`
+    or to the original stream.
+    """
+
+    def __init__(self, original: TextIO):
+        super().__init__()
+        self.original = original
+
+    def _target(self) -> TextIO:
+        target = getattr(_LOCAL, "stream", None)
+        return self.original if target is None else target
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, s: str) -> int:
+        return self._target().write(s)
+
+    def flush(self):
+        self._target().flush()
+
+    def isatty(self) -> bool:
+        return self._target().isatty()
+
+    @property
+    def encoding(self):
+        return getattr(self._target(), "encoding", "utf-8")
+
+    def fileno(self) -> int:
+        return self.original.fileno()
+
+
+class _RoutedThread:
+    """
+    Used as the message of a warning filter, it only matches
+    the warnings emitted by a thread registered with :func:`route_output`,
+    the other threads keep the filters of the process.
+    """
+
+    def match(self, text: str) -> bool:
+        return getattr(_LOCAL, "stream", None) is not None
+
+
+def _add_thread_filter():
+    # filterwarnings compiles the message, the filter is replaced
+    # by the same one matching only the routed threads
+    marker = f"<route_output-{id(_LOCK)}>"
+    warnings.filterwarnings("always", message=marker)
+    index = next(
+        i
+        for i, f in enumerate(warnings.filters)
+        if getattr(f[1], "pattern", None) == marker
+    )
+    item = ("always", _RoutedThread(), Warning, None, 0)
+    warnings.filters[index] = item
+    return item
+
+
+def _remove_thread_filter(item):
+    # the filter never modified any warning registry, removing it is enough
+    if item in warnings.filters:
+        warnings.filters.remove(item)
+
+
+def _thread_showwarning(message, category, filename, lineno, file=None, line=None):
+    stream = getattr(_LOCAL, "stream", None)
+    if stream is None:
+        # a thread not running a script
+        _STATE["showwarning"](message, category, filename, lineno, file=file, line=line)
+        return
+    ignored = getattr(_LOCAL, "ignored", None)
+    if ignored and issubclass(category, ignored):
+        return
+    stream.write(warnings.formatwarning(message, category, filename, lineno, line))
+
+
+@contextmanager
+def route_output(
+    stream: TextIO, ignored_warnings: Optional[Sequence[Type[Warning]]] = None
+) -> Iterator[TextIO]:
+    """
+    Sends everything the current thread writes on the standard output
+    or the standard error to *stream*, other threads are not impacted.
+    Warnings are always displayed except the categories in *ignored_warnings*.
+
+    :param stream: stream receiving the outputs
+    :param ignored_warnings: warning categories the current thread ignores
+    """
+    with _LOCK:
+        if not isinstance(sys.stdout, _ThreadRouter):
+            sys.stdout = _ThreadRouter(sys.stdout)
+        if not isinstance(sys.stderr, _ThreadRouter):
+            sys.stderr = _ThreadRouter(sys.stderr)
+        if _STATE["routed"] == 0:
+            _STATE["showwarning"] = warnings.showwarning
+            # filters are global, the routed threads always see the warnings,
+            # the thread filtering happens in showwarning
+            _STATE["filter"] = _add_thread_filter()
+            warnings.showwarning = _thread_showwarning
+        _STATE["routed"] += 1
+    previous = getattr(_LOCAL, "stream", None), getattr(_LOCAL, "ignored", None)
+    _LOCAL.stream = stream
+    _LOCAL.ignored = tuple(ignored_warnings or ())
+    try:
+        yield stream
+    finally:
+        _LOCAL.stream, _LOCAL.ignored = previous
+        with _LOCK:
+            _STATE["routed"] -= 1
+            if _STATE["routed"] == 0:
+                _remove_thread_filter(_STATE["filter"])
+                _STATE["filter"] = None
+                if warnings.showwarning is _thread_showwarning:
+                    warnings.showwarning = _STATE["showwarning"]
+                _STATE["showwarning"] = None
+                for name in ["stdout", "stderr"]:
+                    router = getattr(sys, name)
+                    if isinstance(router, _ThreadRouter):
+                        setattr(sys, name, router.original)
+
+
+class _CwdLock:
+    # many threads may run scripts which do not change the current directory,
+    # a script changing it runs alone
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._shared = 0
+        self._exclusive = False
+
+    @contextmanager
+    def shared(self):
+        with self._cond:
+            while self._exclusive:
+                self._cond.wait()
+            self._shared += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._shared -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self._cond:
+            while self._exclusive or self._shared:
+                self._cond.wait()
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
+
+
+_CWD_LOCK = _CwdLock()
+
+
+@contextmanager
+def working_directory(path: Optional[str]) -> Iterator[None]:
+    """
+    Changes the current directory if *path* is not None and waits
+    for every other script running in another thread to finish.
+    If *path* is None, the function only prevents another
+    thread from changing the current directory meanwhile.
+    """
+    if path is None:
+        with _CWD_LOCK.shared():
+            yield
+        return
+    with _CWD_LOCK.exclusive():
+        current = os.getcwd()
+        os.chdir(path)
+        try:
+            yield
+        finally:
+            os.chdir(current)
+
+
+@contextmanager
+def sys_variable(name: Optional[str]) -> Iterator[None]:
+    """
+    Sets ``sys.<name> = True`` while at least one thread needs it.
+    """
+    if name is None:
+        yield
+        return
+    with _LOCK:
+        _SYSVARS[name] = _SYSVARS.get(name, 0) + 1
+        sys.__dict__[name] = True
+    try:
+        yield
+    finally:
+        with _LOCK:
+            _SYSVARS[name] -= 1
+            if _SYSVARS[name] == 0:
+                del _SYSVARS[name]
+                sys.__dict__.pop(name, None)
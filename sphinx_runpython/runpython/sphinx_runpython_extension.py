@@ -1,6 +1,13 @@
 import sys
 import os
-from contextlib import redirect_stdout, redirect_stderr
+import hashlib
+import signal
+import subprocess
+import threading
+import time
+import importlib.metadata
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext, redirect_stdout, redirect_stderr
 import traceback
 import warnings
 from io import StringIO
@@ -12,13 +19,139 @@ from sphinx.util.nodes import nested_parse_with_titles
 from sphinx.util import logging
 from ..language import TITLES
 from .run_cmd import run_cmd
+from .run_pool import PoolMemoryError, get_process_pool, close_process_pools
+from .run_daemon import DaemonConnectionError, get_daemon_client
+from .run_capture import BoundedCapture
+from .run_threads import route_output, sys_variable, working_directory
+from .run_preload import preload_runpython, set_numpy_precision
+from .run_schedule import (
+    drop_purged_durations,
+    get_duration,
+    keep_duration,
+    merge_durations,
+    over_budget,
+    purge_durations,
+    record_duration,
+)
+from .run_chain import chain_block_key, purge_chains, restore_context, snapshot_context
+from .run_session import (
+    end_document_sessions,
+    end_sessions,
+    get_session_namespace,
+    get_session_pool,
+    purge_sessions,
+)
+from .run_bytecode import compile_script, script_filename
+from .run_dependencies import (
+    DependencyRecorder,
+    merge_dependencies,
+    outdated_dependencies,
+    purge_dependencies,
+    record_dependencies,
+    unchanged_dependencies,
+)
+from .run_cache import get_cache, runpython_cache_key, dependencies_fingerprint
+from .run_prepass import clear_prepass_results, pop_prepass_result, prepass_runpython
+from .run_report import (
+    ExecutionMeasure,
+    merge_report,
+    purge_report,
+    record_execution,
+    write_report,
+)
 from ..collapse.sphinx_collapse_extension import collapse_node
 
 logger = logging.getLogger("runpython")
 
+# values for runpython_process_mode
+_PROCESS_MODES = ("", "subprocess", "pool", "forkserver")
+
+# options changing the outputs of a script
+_CACHE_OPTIONS = (
+    "process",
+    "setsysvar",
+    "exception",
+    "warningout",
+    "current",
+    "store",
+    "store_in_file",
+    "numpy_precision",
+    "session",
+    "timeout",
+    "maxmem",
+)
+
+
+_BLACK_MEMORY = OrderedDict()
+_BLACK_LOCK = threading.Lock()
+_BLACK_VERSION = None
+MAX_BLACK_MEMORY = 1024
+
+
+def _black_version():
+    global _BLACK_VERSION
+    if _BLACK_VERSION is None:
+        try:
+            _BLACK_VERSION = importlib.metadata.version("black")
+        except importlib.metadata.PackageNotFoundError:
+            _BLACK_VERSION = ""
+    return _BLACK_VERSION
+
+
+def _remember_black(key, formatted):
+    with _BLACK_LOCK:
+        _BLACK_MEMORY[key] = formatted
+        _BLACK_MEMORY.move_to_end(key)
+        while len(_BLACK_MEMORY) > MAX_BLACK_MEMORY:
+            _BLACK_MEMORY.popitem(last=False)
+
+
+def format_with_black(code: str, cache=None) -> str:
+    """
+    Formats a piece of code with :epkg:`black` and memorizes the result.
+    :epkg:`black` is only imported if the result is not known yet.
+    Black output is also stored as its own result since formatting twice
+    does not change anything. Only a code :epkg:`black` already returned
+    is recognized as formatted, any other code is formatted once
+    before its result is known, the function does not guess
+    whether a code never seen before is already formatted.
+    Only the last :data:`MAX_BLACK_MEMORY` results are kept in memory.
+
+    :param code: code to format
+    :param cache: a :class:`RunPythonCache
+        <sphinx_runpython.runpython.run_cache.RunPythonCache>`
+        to keep the results for the next builds, it can be None
+    :return: formatted code
+    """
+    version = _black_version()
+    key = hashlib.sha256(f"{version}\x00{code}".encode()).hexdigest()
+    with _BLACK_LOCK:
+        formatted = _BLACK_MEMORY.get(key, None)
+        if formatted is not None:
+            _BLACK_MEMORY.move_to_end(key)
+            return formatted
+    if cache is not None:
+        formatted = cache.get(key)
+        if formatted is not None:
+            _remember_black(key, formatted)
+            return formatted
+
+    # delayed import to speed up import of pycode
+    from black import format_str, FileMode
+
+    formatted = format_str(code, mode=FileMode())
+    fkey = hashlib.sha256(f"{version}\x00{formatted}".encode()).hexdigest()
+    _remember_black(key, formatted)
+    _remember_black(fkey, formatted)
+    if cache is not None:
+        cache.set(key, formatted)
+        if fkey != key:
+            cache.set(fkey, formatted)
+    return formatted
+
 
 def remove_extra_spaces_and_black(
-    filename: str, apply_black=True, is_string=None
+    filename: str, apply_black=True, is_string=None, cache=None
 ) -> str:
     """
     Removes extra spaces in a filename, replaces the file in place.
@@ -26,6 +159,7 @@ def remove_extra_spaces_and_black(
     :param filename: file name or string (but it assumes it is python).
     :param apply_black: if True, calls :epkg:`black` on the file
     :param is_string: force *filename* to be a string
+    :param cache: see :func:`format_with_black`
     :return: number of removed extra spaces
     """
     encoding = None
@@ -109,10 +243,7 @@ def remove_extra_spaces_and_black(
     if filename is not None:
         ext = os.path.splitext(filename)[-1]
     if ext in (".py",) and apply_black:
-        # delayed import to speed up import of pycode
-        from black import format_str, FileMode
-
-        r = format_str("\n".join(lines2), mode=FileMode())
+        r = format_with_black("\n".join(lines2), cache=cache)
 
         if len(lines) > 0 and (len(lines2) == 0 or len(lines2) < len(lines) // 2):
             raise ValueError(
@@ -210,11 +341,124 @@ class RunPythonExecutionError(Exception):
     """
     Exception raised when a piece of code
     included in the documentation raises an exception.
+
+    :param message: error message
+    :param out: what the script wrote on the standard output
+        before it failed if it is known
+    :param err: what the script wrote on the standard error
+        before it failed if it is known
+    :param reason: why the script was stopped if it was,
+        ``"timeout"`` or ``"memory"``
     """
 
+    def __init__(self, message="", out=None, err=None, reason=None):
+        super().__init__(message)
+        self.out = out
+        self.err = err
+        self.reason = reason
+
+
+class RunPythonTimeoutError(RunPythonExecutionError):
+    """
+    Exception raised when a piece of code
+    included in the documentation runs longer than its timeout
+    (option ``:timeout:``).
+    """
+
+
+class RunPythonMemoryError(RunPythonExecutionError):
+    """
+    Exception raised when a piece of code
+    included in the documentation needs more memory than allowed
+    (option ``:maxmem:``).
+    """
+
+
+def _memory_error(maxmem, script, comment, out, err):
+    return RunPythonMemoryError(
+        f"The script needs more than {maxmem} bytes."
+        f"\n--SCRIPT--\n{script}\n--COMMENT--\n{comment}"
+        f"\n--ERR--\n{err}\n--OUT--\n{out}",
+        out=out,
+        err=err,
+        reason="memory",
+    )
+
+
+def _parse_memory_size(value):
+    """
+    Converts a memory size such as ``512M`` or ``2G`` into bytes.
+    """
+    if value in (None, ""):
+        return None
+    if isinstance(value, int):
+        return value
+    value = str(value).strip().upper().rstrip("B")
+    units = {"K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def _script_timeout_handler(signum, frame):
+    raise _ScriptTimeout()
+
+
+class _ScriptTimeout(BaseException):
+    # raised by an alarm, it goes through the except Exception of the script
     pass
 
 
+def _warning_categories(warningout):
+    # converts option warningout into a list of warning categories
+    if warningout in (None, ""):
+        return []
+    if isinstance(warningout, str):
+        return _warning_categories([_.strip() for _ in warningout.split()])
+    if isinstance(warningout, list):
+        return [eval(w) if isinstance(w, str) else w for w in warningout]
+    raise ValueError(f"Unexpected value for warningout: {warningout}")
+
+
+def _warning_filter(warningout):
+    categories = _warning_categories(warningout)
+    if not categories:
+        warnings.simplefilter("always")
+    for w in categories:
+        warnings.simplefilter("ignore", w)
+
+
+@contextmanager
+def _process_isolation(sout, warningout, chdir, setsysvar):
+    # redirects the outputs, changes the warnings, the current directory
+    # for the whole process
+    if setsysvar is not None:
+        sys.__dict__[setsysvar] = True
+    try:
+        with redirect_stdout(sout), redirect_stderr(sout), warnings.catch_warnings():
+            _warning_filter(warningout)
+            if chdir is not None:
+                current = os.getcwd()
+                os.chdir(chdir)
+            try:
+                yield
+            finally:
+                if chdir is not None:
+                    os.chdir(current)
+    finally:
+        if setsysvar is not None:
+            del sys.__dict__[setsysvar]
+
+
+@contextmanager
+def _thread_isolation(sout, warningout, chdir, setsysvar):
+    # same as _process_isolation but only for the current thread
+    with sys_variable(setsysvar), working_directory(chdir), route_output(
+        sout, _warning_categories(warningout)
+    ):
+        yield
+
+
 def run_python_script(
     script,
     params=None,
@@ -226,6 +470,19 @@ def run_python_script(
     chdir=None,
     context=None,
     store_in_file=None,
+    pool=None,
+    stats=None,
+    dependencies=None,
+    filename=None,
+    bytecode_cache=None,
+    capture_limit=None,
+    namespace=None,
+    session=None,
+    on_output=None,
+    timeout=None,
+    maxmem=None,
+    threadsafe=False,
+    numpy_precision=None,
 ):
     """
     Executes a script :epkg:`python` as a string.
@@ -248,6 +505,52 @@ def run_python_script(
         that is useful is the script is using module
         ``inspect`` to retrieve the source which are not
         stored in memory
+    :param pool: a :class:`RunPythonPool
+        <sphinx_runpython.runpython.run_pool.RunPythonPool>`,
+        if not None and *process* is True, the script runs in one of the
+        interpreters the pool keeps alive instead of a new process
+    :param stats: if not None, this dictionary receives how the script
+        was executed (key *mode*) and the measures done by the pool if any
+    :param dependencies: if not None, the set receives the files the script
+        opened or imported when it runs in a pool of interpreters,
+        see :class:`DependencyRecorder
+        <sphinx_runpython.runpython.run_dependencies.DependencyRecorder>`
+    :param filename: filename used to compile the script if it runs in the
+        current process, the source is registered in :mod:`linecache`,
+        the default name depends on the script content
+    :param bytecode_cache: a :class:`RunPythonCache
+        <sphinx_runpython.runpython.run_cache.RunPythonCache>` keeping
+        the compiled scripts, see :func:`compile_script
+        <sphinx_runpython.runpython.run_bytecode.compile_script>`
+    :param capture_limit: maximum number of characters of the outputs kept
+        in memory if the script runs in the current process or in a new process,
+        see :class:`BoundedCapture
+        <sphinx_runpython.runpython.run_capture.BoundedCapture>`
+    :param namespace: if not None, the script runs in this dictionary
+        (global and local variables) if it runs in the current process,
+        the variables it defines remain in the dictionary
+    :param session: if not None, the script runs in the namespace of
+        this session kept by the interpreter of the pool (*pool* is required)
+    :param on_output: if not None and the script runs in a new process,
+        the function is called every time the script writes something,
+        see :func:`run_cmd <sphinx_runpython.runpython.run_cmd.run_cmd>`
+    :param timeout: the script is stopped after *timeout* seconds,
+        :class:`RunPythonTimeoutError` is raised, if the script runs in the
+        current process, it only works in the main thread on Linux and macOS
+    :param maxmem: maximum size of the address space of the process running
+        the script in bytes, :class:`RunPythonMemoryError` is raised
+        if the script needs more (an uncaught :class:`MemoryError`,
+        the error is returned if *exception* is True), it is only applied
+        if the script runs in a separate process on Linux or macOS
+    :param threadsafe: if True and the script runs in the current process,
+        the outputs, the warnings and the variable *setsysvar* are redirected
+        or modified only for the current thread, a script changing
+        the current directory (*chdir*) waits for every other script
+        to finish, see module :mod:`sphinx_runpython.runpython.run_threads`
+    :param numpy_precision: if the script runs in the current process
+        and mentions numpy, numpy print options use this precision,
+        see :func:`set_numpy_precision
+        <sphinx_runpython.runpython.run_preload.set_numpy_precision>`
     :return: stdout, stderr, context
 
     If the execution throws an exception such as
@@ -283,23 +586,6 @@ def run_python_script(
     how to display an image with this directive.
     """
 
-    def warning_filter(warningout):
-        if warningout in (None, ""):
-            warnings.simplefilter("always")
-        elif isinstance(warningout, str):
-            li = [_.strip() for _ in warningout.split()]
-            warning_filter(li)
-        elif isinstance(warningout, list):
-
-            def interpret(s):
-                return eval(s) if isinstance(s, str) else s
-
-            warns = [interpret(w) for w in warningout]
-            for w in warns:
-                warnings.simplefilter("ignore", w)
-        else:
-            raise ValueError(f"Unexpected value for warningout: {warningout}")
-
     if params is None:
         params = {}
 
@@ -372,9 +658,57 @@ def run_python_script(
         else:
             script_arg = script
 
+        if stats is not None:
+            if pool is None:
+                stats["mode"] = "subprocess"
+            else:
+                stats["mode"] = pool.mode
+        cmd_stats = {}
         try:
-            out, err = run_cmd(cmd, script_arg, wait=True, change_path=chdir)
-            return out, _filter_error(err), None
+            if pool is not None:
+                try:
+                    out, err = pool.run(
+                        script,
+                        filename=store_in_file,
+                        cwd=chdir,
+                        stats=stats,
+                        files=dependencies,
+                        session=session,
+                        timeout=timeout,
+                        maxmem=maxmem,
+                    )
+                except DaemonConnectionError as ee:
+                    # the daemon stopped, the script runs locally
+                    logger.info("[runpython] %s, the script runs locally", ee)
+                    pool = None
+                    if stats is not None:
+                        stats["mode"] = "subprocess"
+            if pool is None:
+                out, err = run_cmd(
+                    cmd,
+                    script_arg,
+                    wait=True,
+                    cwd=chdir,
+                    retention="full" if capture_limit is None else "headtail",
+                    retention_limit=capture_limit or 2**20,
+                    on_output=on_output,
+                    timeout=timeout,
+                    maxmem=maxmem,
+                    stats=cmd_stats,
+                )
+        except subprocess.TimeoutExpired as ee:
+            raise RunPythonTimeoutError(
+                f"The script did not end after {timeout} seconds."
+                f"\n--SCRIPT--\n{script}\n--COMMENT--\n{comment}"
+                f"\n--ERR--\n{ee.stderr}\n--OUT--\n{ee.output}",
+                out=ee.output,
+                err=ee.stderr,
+                reason="timeout",
+            ) from ee
+        except PoolMemoryError as ee:
+            if exception:
+                return ee.out, _filter_error(ee.err), None
+            raise _memory_error(maxmem, script, comment, ee.out, ee.err) from ee
         except Exception as ee:
             if not exception:
                 message = (  # noqa: UP030
@@ -386,13 +720,26 @@ def run_python_script(
                     message += f"\n---EXC--\n{exc_path}"
                 raise RunPythonExecutionError(message) from ee
             return str(ee), _filter_error(str(ee)), None
+        if (
+            maxmem
+            and not exception
+            and cmd_stats.get("returncode", 0)
+            and err.split("\n")[-1].startswith("MemoryError")
+        ):
+            # the interpreter ended with an uncaught MemoryError
+            raise _memory_error(maxmem, script, comment, out, err)
+        return out, _filter_error(err), None
     else:
         if store_in_file:
             raise NotImplementedError(
                 "store_in_file is only implemented if process is True."
             )
+        if stats is not None:
+            stats["mode"] = "in-process"
         try:
-            obj = compile(script, "", "exec")
+            obj = compile_script(
+                script, filename or script_filename(script), cache=bytecode_cache
+            )
         except Exception as ec:
             if comment is None:
                 comment = ""
@@ -401,8 +748,11 @@ def run_python_script(
                 raise RunPythonCompileError(message) from ec
             return "", f"Cannot compile the do to {ec}", None
 
-        globs = globals().copy()
-        loc = locals()
+        if namespace is None:
+            globs = globals().copy()
+            loc = locals()
+        else:
+            globs = loc = namespace
         for k, v in params.items():
             loc[k] = v
         loc["__dict__"] = params
@@ -411,60 +761,227 @@ def run_python_script(
                 globs["__runpython__" + k] = v
         globs["__runpython__script__"] = script
 
-        if setsysvar is not None:
-            sys.__dict__[setsysvar] = True
+        if "numpy" in script:
+            set_numpy_precision(numpy_precision)
 
-        sout = StringIO()
-        serr = StringIO()
-        with redirect_stdout(sout), redirect_stderr(sout), warnings.catch_warnings():
-            warning_filter(warningout)
+        try:
+            # stderr is sent into the same stream as stdout
+            sout = BoundedCapture(capture_limit)
+            isolation = _thread_isolation if threadsafe else _process_isolation
+            with isolation(sout, warningout, chdir, setsysvar):
+                alarm = (
+                    timeout
+                    and hasattr(signal, "setitimer")
+                    and threading.current_thread() is threading.main_thread()
+                )
+                if alarm:
+                    saved_handler = signal.signal(
+                        signal.SIGALRM, _script_timeout_handler
+                    )
+                    signal.setitimer(signal.ITIMER_REAL, timeout)
+                try:
+                    try:
+                        exec(obj, globs, loc)
+                    finally:
+                        if alarm:
+                            signal.setitimer(signal.ITIMER_REAL, 0)
+                            signal.signal(signal.SIGALRM, saved_handler)
+                except _ScriptTimeout:
+                    gout = sout.getvalue()
+                    sout.close()
+                    raise RunPythonTimeoutError(
+                        f"The script did not end after {timeout} seconds."
+                        f"\n--SCRIPT--\n{script}\n--COMMENT--\n{comment}"
+                        f"\n--OUT--\n{gout}",
+                        out=gout,
+                        err="",
+                        reason="timeout",
+                    ) from None
+                except Exception as ee:
+                    if comment is None:
+                        comment = ""
+                    gout = sout.getvalue()
+                    gerr = ""
+                    sout.close()
+
+                    excs = traceback.format_exc()
+                    lines = excs.split("\n")
+                    excs = "\n".join(
+                        _ for _ in lines if "sphinx_runpython_extension.py" not in _
+                    )
 
-            if chdir is not None:
-                current = os.getcwd()
-                os.chdir(chdir)
+                    if not exception:
+                        message = (  # noqa: UP030
+                            "--SCRIPT--\n{0}\n--PARAMS--\n{1}\n--COMMENT--"
+                            "\n{2}\n--ERR--\n{3}\n--OUT--\n{4}\n--EXC--"
+                            "\n{5}\n--TRACEBACK--\n{6}"
+                        ).format(script, params, comment, gout, gerr, ee, excs)
+                        raise RunPythonExecutionError(message) from ee
+                    return (gout + "\n" + gerr), _filter_error(gerr + "\n" + excs), None
+
+            gout = sout.getvalue()
+            gerr = ""
+            sout.close()
+            avoid = {"__runpython____WD__", "__runpython____k__", "__runpython____w__"}
+            context = {
+                k[13:]: v
+                for k, v in globs.items()
+                if k.startswith("__runpython__") and k not in avoid
+            }
+            return gout, _filter_error(gerr), context
+        finally:
+            if namespace is not None:
+                # a session keeps the namespace, only the variables
+                # of the script remain after it ends
+                namespace.pop("__dict__", None)
+                for k in [k for k in namespace if k.startswith("__runpython__")]:
+                    del namespace[k]
+
+
+_DAEMON_FALLBACK_LOGGED = set()
+
+
+def get_runpython_pool(config):
+    """
+    Returns the pool of interpreters :class:`RunPythonPool
+    <sphinx_runpython.runpython.run_pool.RunPythonPool>`
+    defined by the configuration or None if it is disabled.
+    It returns a :class:`DaemonClient
+    <sphinx_runpython.runpython.run_daemon.DaemonClient>`
+    if a daemon listens to ``runpython_daemon_socket``.
+
+    :param config: sphinx configuration
+    :return: pool or None
+    """
+    if config is None:
+        return None
+    if config.runpython_daemon_socket:
+        client = get_daemon_client(config.runpython_daemon_socket)
+        if client is not None:
+            return client
+        if config.runpython_daemon_socket not in _DAEMON_FALLBACK_LOGGED:
+            _DAEMON_FALLBACK_LOGGED.add(config.runpython_daemon_socket)
+            logger.info(
+                "[runpython] no daemon with the same python installation "
+                "listens to %r, scripts run locally",
+                config.runpython_daemon_socket,
+            )
+    mode = config.runpython_process_mode
+    size = config.runpython_pool_size
+    if mode not in _PROCESS_MODES:
+        raise ValueError(
+            f"Unexpected value {mode!r} for runpython_process_mode, "
+            f"it should be in {_PROCESS_MODES}."
+        )
+    if mode == "subprocess" or (mode == "" and not size):
+        return None
+    if mode == "forkserver":
+        if not hasattr(os, "fork"):
+            return None
+        pool = get_process_pool(
+            max(size, 1), preload=config.runpython_process_preload, fork=True
+        )
+        if pool.supports_fork():
+            return pool
+        if not getattr(pool, "fallback_logged", False):
+            pool.fallback_logged = True
+            logger.info(
+                "[runpython] fork is not available or not safe, "
+                "runpython_process_mode='forkserver' falls back to 'subprocess'"
+            )
+        return None
+    return get_process_pool(
+        max(size, 1),
+        recycle=config.runpython_pool_recycle,
+        preload=config.runpython_process_preload,
+    )
 
-            try:
-                exec(obj, globs, loc)
-            except Exception as ee:
-                if chdir is not None:
-                    os.chdir(current)
-                if setsysvar is not None:
-                    del sys.__dict__[setsysvar]
-                if comment is None:
-                    comment = ""
-                gout = sout.getvalue()
-                gerr = serr.getvalue()
-
-                excs = traceback.format_exc()
-                lines = excs.split("\n")
-                excs = "\n".join(
-                    _ for _ in lines if "sphinx_runpython_extension.py" not in _
-                )
 
-                if not exception:
-                    message = (  # noqa: UP030
-                        "--SCRIPT--\n{0}\n--PARAMS--\n{1}\n--COMMENT--"
-                        "\n{2}\n--ERR--\n{3}\n--OUT--\n{4}\n--EXC--"
-                        "\n{5}\n--TRACEBACK--\n{6}"
-                    ).format(script, params, comment, gout, gerr, ee, excs)
-                    raise RunPythonExecutionError(message) from ee
-                return (gout + "\n" + gerr), _filter_error(gerr + "\n" + excs), None
+def get_runpython_cache(env):
+    """
+    Returns the cache :class:`RunPythonCache
+    <sphinx_runpython.runpython.run_cache.RunPythonCache>`
+    defined by the configuration or None if it is disabled.
 
-            if chdir is not None:
-                os.chdir(current)
+    :param env: sphinx environment
+    :return: cache or None
+    """
+    if env is None:
+        return None
+    folder = getattr(env.config, "runpython_cache_dir", None)
+    if not folder:
+        return None
+    if not os.path.isabs(folder):
+        folder = os.path.join(env.srcdir, folder)
+    return get_cache(folder, max_size=env.config.runpython_cache_size)
+
+
+def _get_runpython_subcache(env, name):
+    cache = get_runpython_cache(env)
+    if cache is None:
+        return None
+    return get_cache(
+        os.path.join(cache.folder, name), max_size=env.config.runpython_cache_size
+    )
 
-        if setsysvar is not None:
-            del sys.__dict__[setsysvar]
 
-        gout = sout.getvalue()
-        gerr = serr.getvalue()
-        avoid = {"__runpython____WD__", "__runpython____k__", "__runpython____w__"}
-        context = {
-            k[13:]: v
-            for k, v in globs.items()
-            if k.startswith("__runpython__") and k not in avoid
-        }
-        return gout, _filter_error(gerr), context
+def get_black_cache(env):
+    """
+    Returns the cache used by :func:`format_with_black`, it is stored
+    in a subfolder of the cache defined by ``runpython_cache_dir``,
+    None if it is disabled.
+    """
+    return _get_runpython_subcache(env, "black")
+
+
+def get_chain_cache(env):
+    """
+    Returns the cache storing the outputs and a snapshot of the context
+    of the scripts chained with options ``:store:`` and ``:restore:``,
+    it is stored in a subfolder of the cache defined by ``runpython_cache_dir``,
+    None if it is disabled.
+    """
+    return _get_runpython_subcache(env, "chain")
+
+
+def _replay_chain(steps, chain_cache):
+    # runs again the previous scripts of a chain from the last complete snapshot
+    # to rebuild the context, the outputs are ignored
+    start, context = 0, None
+    for i in range(len(steps) - 1, -1, -1):
+        if steps[i]["partial"]:
+            continue
+        entry = chain_cache.get(steps[i]["key"])
+        if entry is None:
+            continue
+        restored, failed = restore_context(entry["context"])
+        if not failed:
+            start, context = i + 1, restored
+            break
+    for step in steps[start:]:
+        _, _, context = run_python_script(context=context, **step["kwargs"])
+    return context
+
+
+def get_latest_cache(env):
+    """
+    Returns the cache storing the latest outputs of every script
+    with the same key as its duration, they are displayed instead
+    of running a script exceeding ``runpython_time_budget``.
+    It is stored in a subfolder of the cache defined by ``runpython_cache_dir``,
+    None if it is disabled.
+    """
+    return _get_runpython_subcache(env, "latest")
+
+
+def get_bytecode_cache(env):
+    """
+    Returns the cache used by :func:`compile_script
+    <sphinx_runpython.runpython.run_bytecode.compile_script>`,
+    it is stored in a subfolder of the cache defined by ``runpython_cache_dir``,
+    None if it is disabled.
+    """
+    return _get_runpython_subcache(env, "bytecode")
 
 
 def _filter_error(err):
@@ -481,6 +998,319 @@ def _filter_error(err):
     return res
 
 
+def get_runpython_options(
+    options, language_code="en", numpy_precision=3, timeout=None, maxmem=None
+):
+    """
+    Interprets the options of directive :class:`RunPythonDirective`.
+
+    :param options: options given to the directive
+    :param language_code: language
+    :param numpy_precision: precision if option ``:numpy_precision:`` is missing
+    :param timeout: timeout if option ``:timeout:`` is missing
+        (``runpython_timeout``)
+    :param maxmem: memory limit if option ``:maxmem:`` is missing
+        (``runpython_maxmem``, a number of bytes or a string such as ``"4G"``)
+    :return: dictionary with every option
+    """
+    bool_set = (True, 1, "True", "1", "true")
+    bool_set_ = (True, 1, "True", "1", "true", "")
+    p = {
+        "showcode": "showcode" in options,
+        "linenos": "linenos" in options,
+        "showout": "showout" in options,
+        "rst": "rst" in options,
+        "debug": "debug" in options,
+        "sin": options.get("sin", TITLES[language_code]["In"]),
+        "sout": options.get("sout", TITLES[language_code]["Out"]),
+        "sout2": options.get("sout2", TITLES[language_code]["Out2"]),
+        "sphinx": "sphinx" not in options or options["sphinx"] in bool_set,
+        "setsysvar": options.get("setsysvar", None),
+        "process": "process" in options and options["process"] in bool_set_,
+        "exception": "exception" in options and options["exception"] in bool_set_,
+        "noblack": "noblack" in options and options["noblack"] in bool_set_,
+        "warningout": options.get("warningout", "").strip(),
+        "toggle": options.get("toggle", "").strip(),
+        "current": "current" in options and options["current"] in bool_set_,
+        "assert": options.get("assert", "").strip(),
+        "language": options.get("language", "").strip(),
+        "store_in_file": options.get("store_in_file", None),
+        "numpy_precision": options.get("numpy_precision", "").strip(),
+        "store": "store" in options and options["store"] in bool_set_,
+        "restore": "restore" in options and options["restore"] in bool_set_,
+        "hide-err": "hide-err" in options,
+        "nocache": "nocache" in options and options["nocache"] in bool_set_,
+        "session": options.get("session", "").strip(),
+        "timeout": (
+            float(options["timeout"]) if options.get("timeout", "").strip() else None
+        ),
+        "maxmem": _parse_memory_size(options.get("maxmem", "").strip()),
+    }
+
+    if not p["numpy_precision"]:
+        p["numpy_precision"] = str(numpy_precision)
+    if p["timeout"] is None and timeout is not None:
+        p["timeout"] = float(timeout)
+    if p["maxmem"] is None:
+        p["maxmem"] = _parse_memory_size(maxmem)
+    if p["setsysvar"] is not None and len(p["setsysvar"]) == 0:
+        p["setsysvar"] = "enable_disabled_documented_pieces_of_code"
+    dind = 0 if p["rst"] else 4
+    p["indent"] = int(options.get("indent", dind))
+    return p
+
+
+def build_runpython_script(code, p, name, context=None):
+    """
+    Builds the script :class:`RunPythonDirective` executes.
+    The script still contains the placeholder ``## __WD__ ##``
+    which must be replaced by the definition of ``__WD__``.
+
+    :param code: code inside the directive
+    :param p: options returned by :func:`get_runpython_options`
+    :param name: name of the function wrapping the code
+        if it runs in the current process without session
+    :param context: names of the variables to restore (option ``:restore:``)
+    :return: script
+    """
+    if p["process"] or p["session"]:
+        content = ["if True:"]
+    else:
+        content = [f"def {name}():"]
+
+    if (
+        p["process"]
+        and "numpy" in code
+        and p["numpy_precision"] not in (None, "None", "-", "")
+    ):
+        # a script running in the current process relies on set_numpy_precision
+        try:
+            import numpy  # noqa: F401
+
+            prec = int(p["numpy_precision"])
+            content.append("    import numpy")
+            content.append("    numpy.set_printoptions(%d)" % prec)
+        except (ImportError, ValueError):
+            pass
+
+    content.append("    ## __WD__ ##")
+
+    if p["restore"] and context:
+        for k in sorted(context):
+            content.append("    {0} = globals()['__runpython__{0}']".format(k))
+
+    if p["assert"]:
+        footer = []
+        assert_condition = p["assert"].split("\n")
+        for cond in assert_condition:
+            footer.append(f"if not({cond}):")
+            footer.append(f"    raise AssertionError('''Condition '{cond}' failed.''')")
+        code += "\n\n" + "\n".join(footer)
+
+    for line in code.split("\n"):
+        content.append("    " + line)
+
+    if p["store"]:
+        content.append("    for __k__, __v__ in locals().copy().items():")
+        content.append("        globals()['__runpython__' + __k__] = __v__")
+
+    if not p["process"] and not p["session"]:
+        content.append(f"{name}()")
+
+    return "\n".join(content)
+
+
+def runpython_block_key(script, p, docname, fingerprint=""):
+    """
+    Returns the key identifying the outputs of a script
+    run by :class:`RunPythonDirective`.
+
+    :param script: script returned by :func:`build_runpython_script`
+        before the placeholder for ``__WD__`` is replaced and
+        with the name of the function replaced by ``run_python_script``
+    :param p: options returned by :func:`get_runpython_options`
+    :param docname: document name
+    :param fingerprint: see :func:`runpython_cache_key
+        <sphinx_runpython.runpython.run_cache.runpython_cache_key>`
+    :return: key
+    """
+    key_options = {k: p[k] for k in _CACHE_OPTIONS}
+    key_options["docname"] = docname
+    return runpython_cache_key(script, key_options, fingerprint=fingerprint)
+
+
+def _block_caches(env, p, chain):
+    # returns the caches a block may use: the chain cache for scripts
+    # chained with :store: and :restore:, the cache of the outputs
+    # for independent scripts, the cache of the latest outputs
+    chain_cache = (
+        None
+        if p["nocache"]
+        or p["session"]
+        or p["process"]
+        or not (p["store"] or p["restore"])
+        or (p["restore"] and chain is None)
+        else get_chain_cache(env)
+    )
+    # The cache is not used if the script depends on a previous one.
+    cache = (
+        None
+        if p["nocache"] or p["restore"] or p["session"] or chain_cache is not None
+        else get_runpython_cache(env)
+    )
+    latest_cache = (
+        None
+        if p["nocache"]
+        or p["store"]
+        or p["restore"]
+        or p["session"]
+        or p["store_in_file"]
+        else get_latest_cache(env)
+    )
+    return chain_cache, cache, latest_cache
+
+
+def _lookup_chain(env, chain_cache, chain, script_key, p, docname):
+    # the key depends on every previous script of the chain,
+    # returns the key, the cached outputs or None, partial, names
+    chain_key = chain_block_key(
+        "" if chain is None else chain["key"],
+        runpython_block_key(
+            script_key,
+            p,
+            docname,
+            fingerprint=getattr(env, "runpython_cache_fingerprint", ""),
+        ),
+    )
+    entry = chain_cache.get(chain_key)
+    if (
+        entry is not None
+        and entry["signatures"] is not None
+        and not unchanged_dependencies(entry["signatures"])
+    ):
+        entry = None
+    if entry is None:
+        return chain_key, None, False, None
+    restored, failed = restore_context(entry["context"])
+    partial = bool(entry["skipped"] or failed)
+    names = sorted(set(restored) | set(entry["skipped"]) | set(failed))
+    cached = (entry["out"], entry["err"], restored)
+    if entry["signatures"] is not None:
+        cached = (*cached, entry["signatures"])
+    return chain_key, cached, partial, names
+
+
+def _lookup_cache(env, cache, script_key, p, docname):
+    # the key does not depend on the absolute location of the documentation,
+    # returns the key and the cached outputs or None
+    cache_key = runpython_block_key(
+        script_key,
+        p,
+        docname,
+        fingerprint=getattr(env, "runpython_cache_fingerprint", ""),
+    )
+    cached = cache.get(cache_key)
+    if cached is not None and len(cached) > 3 and not unchanged_dependencies(cached[3]):
+        # a file the script depends on was modified
+        cached = None
+    return cache_key, cached
+
+
+def _lookup_prepass(env, p, block_key, latest_cache, docname, lineno):
+    # returns the outputs computed by the pre-pass or the latest outputs
+    # if the script exceeds the time budget, None otherwise, and the mode
+    cached = None
+    if not p["restore"] and not p["session"]:
+        cached = pop_prepass_result(block_key)
+    if cached is not None or latest_cache is None:
+        return cached, "prepass"
+    latest = latest_cache.get(block_key)
+    duration = get_duration(env, block_key)
+    if not over_budget(duration, env.config.runpython_time_budget, latest):
+        return None, "prepass"
+    logger.warning(
+        "[runpython] the script in %r, line %d, needs %1.1f seconds "
+        "(runpython_time_budget=%r), the latest outputs are displayed",
+        docname,
+        lineno,
+        duration or latest["duration"],
+        env.config.runpython_time_budget,
+    )
+    return (latest["out"], latest["err"], {}), "budget"
+
+
+def _store_outputs(
+    env, cache, cache_key, latest_cache, block_key, docname, lineno, outputs
+):
+    # stores the outputs of a script which was just executed,
+    # outputs is (out, err, context) or (out, err, context, signatures)
+    out, err = outputs[:2]
+    if latest_cache is not None:
+        duration = get_duration(env, block_key)
+        if duration is not None:
+            latest_cache.set(block_key, dict(out=out, err=err, duration=duration))
+    if cache is not None and not cache.set(cache_key, outputs):
+        logger.info(
+            "[runpython] unable to cache the outputs of a script in %r, "
+            "line %d, the context cannot be pickled",
+            docname,
+            lineno,
+        )
+
+
+def _store_chain(
+    env,
+    chain,
+    chain_cache,
+    chain_key,
+    p,
+    step_kwargs,
+    outputs,
+    from_cache,
+    partial,
+    names,
+    docname,
+    lineno,
+):
+    # stores a snapshot of the context and returns the chain
+    # the next script restores or None if the script does not store anything
+    out, err, context, signatures = outputs
+    if not from_cache:
+        snapshot, skipped = snapshot_context(
+            context, max_size=env.config.runpython_snapshot_size
+        )
+        chain_cache.set(
+            chain_key,
+            dict(
+                out=out,
+                err=err,
+                context=snapshot,
+                skipped=skipped,
+                signatures=signatures,
+            ),
+        )
+        if skipped:
+            logger.info(
+                "[runpython] the snapshot of the context after the script "
+                "in %r, line %d, does not include %r",
+                docname,
+                lineno,
+                skipped,
+            )
+        partial = bool(skipped)
+        names = sorted(context or {})
+    if not p["store"]:
+        return None
+    step = dict(key=chain_key, partial=partial, kwargs=step_kwargs)
+    return dict(
+        docname=docname,
+        key=chain_key,
+        partial=partial,
+        names=names,
+        steps=([] if chain is None else chain["steps"]) + [step],
+    )
+
+
 class runpython_node(nodes.Structural, nodes.Element):
     """
     Defines *runpython* node.
@@ -527,7 +1357,8 @@ class RunPythonDirective(Directive):
     * ``:noblack:`` if present, leaves the code as it is and does
       not apply black by default,
     * ``:numpy_precision: <precision>``, run ``numpy.set_printoptions(precision=...)``,
-      precision is 3 by default
+      precision is 3 by default (``runpython_numpy_precision``),
+      it is set once for all scripts running in the current process
     * ``:process:`` run the script in an another process
     * ``:restore:`` restore the local context stored in :epkg:`sphinx` application
       by the previous call to *runpython*
@@ -563,6 +1394,18 @@ class RunPythonDirective(Directive):
       otherwise be appended as ``[runpythonerror]`` in the content. This is
       useful when the code produces stderr output (such as deprecation warnings)
       that should not appear in the rendered documentation.
+    * ``:nocache:`` the outputs of the script are never stored in the cache
+      defined by ``runpython_cache_dir``, the script must run every time,
+      it is needed when the script produces files such as images
+    * ``:session: <name>`` the script runs in the namespace of a session,
+      every variable it defines is available to the next scripts of the same
+      session in the same document without any copy, with ``:process:``,
+      the session is kept by a dedicated interpreter
+    * ``:timeout: <seconds>`` the script is stopped if it runs longer,
+      the build fails with :class:`RunPythonTimeoutError`
+    * ``:maxmem: <size>`` maximum memory (address space) of the process
+      running a script with ``:process:`` such as ``512M`` or ``2G``,
+      the build fails with :class:`RunPythonMemoryError` if the script needs more
 
     Option *rst* can be used the following way::
 
@@ -635,6 +1478,10 @@ class RunPythonDirective(Directive):
         "linenos": directives.unchanged,
         "debug": directives.unchanged,
         "hide-err": directives.unchanged,
+        "nocache": directives.unchanged,
+        "session": directives.unchanged,
+        "timeout": directives.unchanged,
+        "maxmem": directives.unchanged,
     }
     has_content = True
     runpython_class = runpython_node
@@ -667,103 +1514,43 @@ class RunPythonDirective(Directive):
             docname = env.docname
 
         # post
-        bool_set = (True, 1, "True", "1", "true")
-        bool_set_ = (True, 1, "True", "1", "true", "")
-        p = {
-            "showcode": "showcode" in self.options,
-            "linenos": "linenos" in self.options,
-            "showout": "showout" in self.options,
-            "rst": "rst" in self.options,
-            "debug": "debug" in self.options,
-            "sin": self.options.get("sin", TITLES[language_code]["In"]),
-            "sout": self.options.get("sout", TITLES[language_code]["Out"]),
-            "sout2": self.options.get("sout2", TITLES[language_code]["Out2"]),
-            "sphinx": "sphinx" not in self.options
-            or self.options["sphinx"] in bool_set,
-            "setsysvar": self.options.get("setsysvar", None),
-            "process": "process" in self.options
-            and self.options["process"] in bool_set_,
-            "exception": "exception" in self.options
-            and self.options["exception"] in bool_set_,
-            "noblack": "noblack" in self.options
-            and self.options["noblack"] in bool_set_,
-            "warningout": self.options.get("warningout", "").strip(),
-            "toggle": self.options.get("toggle", "").strip(),
-            "current": "current" in self.options
-            and self.options["current"] in bool_set_,
-            "assert": self.options.get("assert", "").strip(),
-            "language": self.options.get("language", "").strip(),
-            "store_in_file": self.options.get("store_in_file", None),
-            "numpy_precision": self.options.get("numpy_precision", "3").strip(),
-            "store": "store" in self.options and self.options["store"] in bool_set_,
-            "restore": "restore" in self.options
-            and self.options["restore"] in bool_set_,
-            "hide-err": "hide-err" in self.options,
-        }
-
-        if p["setsysvar"] is not None and len(p["setsysvar"]) == 0:
-            p["setsysvar"] = "enable_disabled_documented_pieces_of_code"
-        dind = 0 if p["rst"] else 4
-        p["indent"] = int(self.options.get("indent", dind))
+        p = get_runpython_options(
+            self.options,
+            language_code,
+            numpy_precision=(
+                3 if env is None else env.config.runpython_numpy_precision
+            ),
+            timeout=None if env is None else env.config.runpython_timeout,
+            maxmem=None if env is None else env.config.runpython_maxmem,
+        )
 
         # run the script
-        name = f"run_python_script_{id(p)}"
-        if p["process"]:
-            content = ["if True:"]
-        else:
-            content = [f"def {name}():"]
-
-        if "numpy" in "\n".join(self.content) and p["numpy_precision"] not in (
-            None,
-            "None",
-            "-",
-            "",
-        ):
-            try:
-                import numpy
-
-                prec = int(p["numpy_precision"])
-                content.append("    import numpy")
-                content.append("    numpy.set_printoptions(%d)" % prec)
-            except (ImportError, ValueError):
-                pass
-
-        content.append("    ## __WD__ ##")
-
         if p["restore"]:
             context = getattr(env, "runpython_context", None)
-            for k in sorted(context):
-                content.append("    {0} = globals()['__runpython__{0}']".format(k))
         else:
             context = None
+        chain = getattr(env, "runpython_chain", None)
+        if chain is not None and (chain["docname"] != docname or not p["restore"]):
+            chain = None
 
         modified_content = self.modify_script_before_running("\n".join(self.content))
-
-        if p["assert"]:
-            footer = []
-            assert_condition = p["assert"].split("\n")
-            for cond in assert_condition:
-                footer.append(f"if not({cond}):")
-                footer.append(
-                    f"    raise AssertionError('''Condition '{cond}' failed.''')"
-                )
-            modified_content += "\n\n" + "\n".join(footer)
-
-        for line in modified_content.split("\n"):
-            content.append("    " + line)
-
-        if p["store"]:
-            content.append("    for __k__, __v__ in locals().copy().items():")
-            content.append("        globals()['__runpython__' + __k__] = __v__")
-
-        if not p["process"]:
-            content.append(f"{name}()")
-
-        script = "\n".join(content)
+        # the name only depends on the code to keep the script stable
+        name = "run_python_script_{}".format(
+            hashlib.sha256(modified_content.encode("utf-8")).hexdigest()[:16]
+        )
+        script = build_runpython_script(
+            modified_content,
+            p,
+            name,
+            # a context restored from an incomplete snapshot misses some names
+            context=chain["names"] if chain is not None else context,
+        )
         script_disp = "\n".join(self.content)
         if not p["noblack"]:
             try:
-                script_disp = remove_extra_spaces_and_black(script_disp, is_string=True)
+                script_disp = remove_extra_spaces_and_black(
+                    script_disp, is_string=True, cache=get_black_cache(env)
+                )
             except Exception as e:
                 if "." in docname:
                     comment = f'  File "{docname}", line {lineno}'
@@ -801,19 +1588,152 @@ class RunPythonDirective(Directive):
 
         # Add __WD__.
         cs_source_dir = os.path.dirname(cs_source).replace("\\", "/")
+        script_key = script.replace(name, "run_python_script")
         script = script.replace("## __WD__ ##", f"__WD__ = '{cs_source_dir}'")
 
-        out, err, context = run_python_script(
-            script,
-            comment=comment,
-            setsysvar=p["setsysvar"],
-            process=p["process"],
-            exception=p["exception"],
-            warningout=p["warningout"],
-            chdir=cs_source_dir if p["current"] else None,
-            context=context,
-            store_in_file=p["store_in_file"],
+        # Scripts chained with :store: and :restore: are cached
+        # with a snapshot of the context, the key depends on every previous script.
+        chain_cache, cache, latest_cache = _block_caches(env, p, chain)
+        chain_key, cache_key, partial, names = None, None, False, None
+        if chain_cache is not None:
+            chain_key, cached, partial, names = _lookup_chain(
+                env, chain_cache, chain, script_key, p, docname
+            )
+            if cached is None and chain is not None and chain["partial"]:
+                # the context restored from a snapshot is incomplete
+                context = _replay_chain(chain["steps"], chain_cache)
+        elif cache is not None:
+            cache_key, cached = _lookup_cache(env, cache, script_key, p, docname)
+        else:
+            cached = None
+        from_cache = cached is not None
+        block_key = runpython_block_key(script_key, p, docname)
+        mode = "cached"
+        if cached is None:
+            cached, mode = _lookup_prepass(
+                env, p, block_key, latest_cache, docname, lineno
+            )
+            # the outputs may not be the outputs of this script
+            from_cache = mode == "budget"
+
+        report = env is not None and env.config.runpython_report
+        track = env is not None and env.config.runpython_track_dependencies
+        recorder = DependencyRecorder(script) if track else None
+        signatures = None
+        if cached is not None:
+            out, err, context = cached[:3]
+            if len(cached) > 3:
+                signatures = cached[3]
+            measure = None
+        else:
+            measure = ExecutionMeasure(not p["process"]) if report else None
+            pool, namespace = None, None
+            if p["process"] and p["session"]:
+                pool = get_session_pool(
+                    docname,
+                    p["session"],
+                    preload=(
+                        None if env is None else env.config.runpython_process_preload
+                    ),
+                )
+            elif p["process"] and env is not None:
+                pool = get_runpython_pool(env.config)
+            elif p["session"]:
+                namespace = get_session_namespace(docname, p["session"])
+            begin = time.perf_counter()
+            with measure or nullcontext(), recorder or nullcontext():
+                out, err, context = run_python_script(
+                    script,
+                    comment=comment,
+                    setsysvar=p["setsysvar"],
+                    process=p["process"],
+                    exception=p["exception"],
+                    warningout=p["warningout"],
+                    chdir=cs_source_dir if p["current"] else None,
+                    context=context,
+                    store_in_file=p["store_in_file"],
+                    pool=pool,
+                    stats=None if measure is None else measure.stats,
+                    dependencies=None if recorder is None else recorder.files,
+                    filename=script_filename(
+                        script, prefix=f"runpython {docname}:{lineno}"
+                    ),
+                    bytecode_cache=get_bytecode_cache(env),
+                    capture_limit=(
+                        None if env is None else env.config.runpython_capture_limit
+                    ),
+                    namespace=namespace,
+                    session=p["session"] if p["process"] and p["session"] else None,
+                    numpy_precision=p["numpy_precision"],
+                    timeout=p["timeout"],
+                    maxmem=p["maxmem"],
+                )
+            record_duration(env, block_key, time.perf_counter() - begin)
+        keep_duration(env, block_key, docname)
+        if recorder is not None:
+            if signatures is None:
+                if cached is not None:
+                    # executed by the pre-pass, only the imported modules are known
+                    with recorder:
+                        pass
+                signatures = recorder.signatures()
+            record_dependencies(env, docname, signatures)
+        if report:
+            record = (
+                dict(mode=mode, wall=0.0, cpu=0.0, peak_memory=None)
+                if measure is None
+                else measure.record
+            )
+            record.update(
+                dict(
+                    docname=docname,
+                    lineno=lineno,
+                    output_size=len(out or "") + len(err or ""),
+                )
+            )
+            record_execution(env, record)
+        outputs = (
+            (out, err, context)
+            if signatures is None
+            else (out, err, context, signatures)
         )
+        if not from_cache:
+            _store_outputs(
+                env,
+                cache,
+                cache_key,
+                latest_cache,
+                block_key,
+                docname,
+                lineno,
+                outputs,
+            )
+        if env is not None:
+            env.runpython_chain = (
+                None
+                if chain_cache is None
+                else _store_chain(
+                    env,
+                    chain,
+                    chain_cache,
+                    chain_key,
+                    p,
+                    dict(
+                        script=script,
+                        setsysvar=p["setsysvar"],
+                        exception=p["exception"],
+                        warningout=p["warningout"],
+                        chdir=cs_source_dir if p["current"] else None,
+                        numpy_precision=p["numpy_precision"],
+                    ),
+                    (out, err, context, signatures),
+                    from_cache,
+                    partial,
+                    names,
+                    docname,
+                    lineno,
+                )
+            )
 
         if p["store"]:
             # Stores modified local context.
@@ -1031,11 +1951,113 @@ def depart_runpython_node(self, node):
     pass
 
 
+def _close_pools(app, exception):
+    close_process_pools()
+
+
+def _init_cache(app):
+    if not app.config.runpython_cache_dir:
+        return
+    app.env.runpython_cache_fingerprint = dependencies_fingerprint(
+        app.config.runpython_cache_dependencies, root=app.srcdir
+    )
+
+
 def setup(app):
     """
     setup for ``runpython`` (sphinx)
+
+    The extension adds the following configuration values:
+
+    * ``runpython_pool_size``: if > 0, scripts with option ``:process:``
+      runs in a pool of interpreters started once instead of a new
+      process every time
+    * ``runpython_pool_recycle``: replaces an interpreter of the pool after
+      it executed this number of scripts, None to never replace it
+    * ``runpython_process_preload``: modules every interpreter of the pool
+      imports when it starts
+    * ``runpython_process_mode``: how scripts with option ``:process:`` run,
+      ``"subprocess"`` starts a new interpreter every time,
+      ``"pool"`` uses the pool of interpreters, ``"forkserver"`` starts
+      an interpreter once, imports ``runpython_process_preload`` and forks it
+      for every script, it falls back to ``"subprocess"`` if fork is not
+      available or not safe, the default value ``""`` means ``"pool"``
+      if ``runpython_pool_size > 0`` and ``"subprocess"`` otherwise
+    * ``runpython_cache_dir``: if not empty, the outputs of every script
+      are stored in this folder (relative to the source folder) and reused
+      by the next builds as long as the script, its options, the python
+      version and the dependencies do not change
+    * ``runpython_cache_size``: maximum size of the cache in bytes,
+      the least recently used outputs are removed first
+    * ``runpython_cache_dependencies``: list of files or glob patterns
+      (relative to the source folder), the cache is invalidated
+      if one of them is modified
+    * ``runpython_prepass``: if True, the scripts of every document to read
+      which do not depend on another one are executed in parallel
+      before sphinx parses the documents
+    * ``runpython_prepass_workers``: number of processes used by the pre-pass,
+      None for the number of cores
+    * ``runpython_prepass_threads``: the pre-pass uses threads instead of
+      processes, scripts without ``:process:`` run in the current process
+    * ``runpython_report``: if not empty, the wall time, the cpu time,
+      the peak memory, the output size of every script and the way it was
+      run are saved in this json file (relative to the output folder)
+      at the end of the build, the slowest scripts are logged
+    * ``runpython_report_top``: number of slowest scripts to log
+    * ``runpython_track_dependencies``: if True, the files a script reads
+      and the modules it imports (outside the python installation)
+      become dependencies of the document, the document is read again
+      if one of them is modified
+    * ``runpython_capture_limit``: maximum number of characters of the output
+      of a script kept in memory if it runs in the current process
+      or in a new process,
+      only the beginning and the end are displayed beyond that limit,
+      None for no limit
+    * ``runpython_timeout``: default value for option ``:timeout:``,
+      None for no timeout
+    * ``runpython_maxmem``: default value for option ``:maxmem:``,
+      None for no limit
+    * ``runpython_preload_modules``: modules imported once before sphinx
+      parses the documents, the scripts running in the current process
+      do not pay for the first import, the time every import takes is logged
+    * ``runpython_numpy_precision``: default value for option
+      ``:numpy_precision:``
+    * ``runpython_snapshot_size``: if the cache is enabled, the context
+      of every script chained with ``:store:`` and ``:restore:`` is pickled
+      and stored in the cache, a script is only executed again if itself
+      or a previous script of the chain was modified, this is the maximum
+      size of a snapshot in bytes, the biggest values are skipped beyond that
+    * ``runpython_daemon_socket``: scripts with option ``:process:`` are sent
+      to the daemon listening to this Unix socket
+      (``python -m sphinx_runpython worker --socket <path>``) if it runs
+      with the same python installation, they run locally otherwise
+    * ``runpython_time_budget``: if the cache is enabled, a script which
+      needed more than this number of seconds the last time it ran is not
+      executed, its latest outputs are displayed with a warning
+      if the script did not change, it is meant for preview builds
     """
     app.add_config_value("out_runpythonlist", [], "env")
+    app.add_config_value("runpython_pool_size", 0, "")
+    app.add_config_value("runpython_pool_recycle", None, "")
+    app.add_config_value("runpython_process_preload", [], "")
+    app.add_config_value("runpython_process_mode", "", "")
+    app.add_config_value("runpython_cache_dir", None, "env")
+    app.add_config_value("runpython_cache_size", 2**28, "")
+    app.add_config_value("runpython_cache_dependencies", [], "env")
+    app.add_config_value("runpython_prepass", False, "")
+    app.add_config_value("runpython_prepass_workers", None, "")
+    app.add_config_value("runpython_prepass_threads", False, "")
+    app.add_config_value("runpython_report", None, "")
+    app.add_config_value("runpython_report_top", 10, "")
+    app.add_config_value("runpython_track_dependencies", False, "env")
+    app.add_config_value("runpython_capture_limit", None, "env")
+    app.add_config_value("runpython_timeout", None, "env")
+    app.add_config_value("runpython_maxmem", None, "env")
+    app.add_config_value("runpython_preload_modules", [], "")
+    app.add_config_value("runpython_numpy_precision", 3, "env")
+    app.add_config_value("runpython_snapshot_size", 2**26, "")
+    app.add_config_value("runpython_daemon_socket", None, "")
+    app.add_config_value("runpython_time_budget", None, "")
     if hasattr(app, "add_mapping"):
         app.add_mapping("runpython", runpython_node)
 
@@ -1051,4 +2073,22 @@ def setup(app):
     )
 
     app.add_directive("runpython", RunPythonDirective)
+    app.connect("builder-inited", _init_cache)
+    app.connect("builder-inited", preload_runpython)
+    app.connect("env-before-read-docs", prepass_runpython)
+    app.connect("build-finished", _close_pools)
+    app.connect("build-finished", clear_prepass_results)
+    app.connect("env-purge-doc", purge_report)
+    app.connect("env-merge-info", merge_report)
+    app.connect("build-finished", write_report)
+    app.connect("env-purge-doc", purge_dependencies)
+    app.connect("env-merge-info", merge_dependencies)
+    app.connect("env-get-outdated", outdated_dependencies)
+    app.connect("env-purge-doc", purge_sessions)
+    app.connect("env-purge-doc", purge_chains)
+    app.connect("env-purge-doc", purge_durations)
+    app.connect("env-merge-info", merge_durations)
+    app.connect("env-updated", drop_purged_durations)
+    app.connect("doctree-read", end_document_sessions)
+    app.connect("build-finished", end_sessions)
     return {"version": sphinx.__display_version__, "parallel_read_safe": True}